@@ -0,0 +1,172 @@
+"""
+Audience mode for very large rooms.
+
+In a room created with ``audience_mode`` only the host and the speakers
+the host picked are peers. Together they make up the stage, which has its
+own presence list (under ``stage_group``) with its own version. Joins and
+leaves on the stage are broadcast as usual. Everyone else is the audience:
+they are still in the room's presence, so they are counted and can be
+reached for signaling, but their joins and leaves are not broadcast one
+by one. Instead, an ``audience_update`` with the room's member count goes
+out at most once per ``ROOM_AUDIENCE_PRESENCE_INTERVAL`` seconds per worker.
+Clients page through the full member list with ``presence_page``.
+
+Only the host may send ``video_control`` or ``share_video`` in such a room,
+and only the host moves users on and off the stage, with ``set_role``.
+
+Audience chat is throttled twice. Each socket may send one line per
+``ROOM_AUDIENCE_CHAT_SLOW_MODE`` seconds and is refused until then. Of the
+lines that get through, at most ``ROOM_AUDIENCE_CHAT_RATE`` per room per
+second are broadcast by each worker. The rest are sampled out: they are
+still stored, but only their sender sees them live. Set either to 0 to
+turn that throttle off.
+
+So per event, what the room receives stays bounded however large the
+audience grows. Presence sends one frame per interval, chat a fixed number
+per second, and controls come only from the host.
+"""
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from .models import Room
+
+
+logger = logging.getLogger(__name__)
+
+HOST = 'host'
+SPEAKER = 'speaker'
+AUDIENCE = 'audience'
+
+# Frame types only the host may send in an audience-mode room
+HOST_ONLY_TYPES = frozenset({'video_control', 'share_video', 'set_role'})
+
+
+def stage_group(room_group_name):
+    """Presence key of the stage of ``room_group_name``"""
+    return f'{room_group_name}:stage'
+
+
+def role_of(username, playback_state):
+    """Return the role of ``username`` in the room ``playback_state`` belongs to.
+
+    Outside audience mode every member other than the host is a speaker.
+    """
+    if username == playback_state.host_username:
+        return HOST
+    if not playback_state.audience_mode or username in playback_state.speakers:
+        return SPEAKER
+    return AUDIENCE
+
+
+@sync_to_async
+def save_role(room_pk, username, is_speaker):
+    """Add ``username`` to or remove it from the room's speakers; False if there is no such user"""
+    user = User.objects.filter(username=username).only('pk').first()
+    if room_pk is None or user is None:
+        return False
+    speakers = Room.speakers.through.objects
+    if is_speaker:
+        speakers.get_or_create(room_id=room_pk, user_id=user.pk)
+    else:
+        speakers.filter(room_id=room_pk, user_id=user.pk).delete()
+    return True
+
+
+class AudienceCounter:
+    """Coalesces audience changes into one ``audience_update`` per room per interval"""
+
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        # room -> coroutine function that broadcasts the count
+        self.pending = {}
+        self._tasks = set()
+
+    def changed(self, room, publish):
+        """Note a join or leave in ``room``; ``publish()`` runs once the interval is up"""
+        scheduled = room in self.pending
+        self.pending[room] = publish
+        if not scheduled:
+            asyncio.get_running_loop().call_later(self.interval, self._publish, room)
+
+    def _publish(self, room):
+        publish = self.pending.pop(room, None)
+        if publish is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(publish))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, publish):
+        try:
+            await publish()
+        except Exception as e:
+            logger.error(f"Failed to publish audience count: {e}")
+
+
+class AudienceChat:
+    """Slow mode per socket and sampling per room for audience chat"""
+
+    def __init__(self, slow_mode=5.0, rate=10):
+        self.slow_mode = slow_mode
+        self.rate = rate
+        # Lines broadcast per room in the current one-second window
+        self.window = 0
+        self.counts = {}
+        self.stats = {'broadcast': 0, 'sampled': 0, 'slowed': 0}
+
+    def retry_after(self, last_sent_at):
+        """Seconds a socket that last chatted at ``last_sent_at`` must still wait"""
+        if not self.slow_mode or last_sent_at is None:
+            return 0
+        return max(0.0, last_sent_at + self.slow_mode - time.monotonic())
+
+    def check(self, room, last_sent_at):
+        """Return 'slowed', 'sampled' or 'broadcast' for an audience chat line"""
+        if self.retry_after(last_sent_at) > 0:
+            outcome = 'slowed'
+        elif self.rate and not self._admit(room):
+            outcome = 'sampled'
+        else:
+            outcome = 'broadcast'
+        self.stats[outcome] += 1
+        return outcome
+
+    def _admit(self, room):
+        window = int(time.monotonic())
+        if window != self.window:
+            # Every room starts the new second afresh
+            self.window = window
+            self.counts.clear()
+        count = self.counts.get(room, 0)
+        if count >= self.rate:
+            return False
+        self.counts[room] = count + 1
+        return True
+
+
+_counter = None
+_chat = None
+
+
+def get_audience_counter():
+    """Return the process-wide audience counter configured in settings"""
+    global _counter
+    if _counter is None:
+        _counter = AudienceCounter(interval=getattr(settings, 'ROOM_AUDIENCE_PRESENCE_INTERVAL', 2.0))
+    return _counter
+
+
+def get_audience_chat():
+    """Return the process-wide audience chat throttle configured in settings"""
+    global _chat
+    if _chat is None:
+        _chat = AudienceChat(
+            slow_mode=getattr(settings, 'ROOM_AUDIENCE_CHAT_SLOW_MODE', 5.0),
+            rate=getattr(settings, 'ROOM_AUDIENCE_CHAT_RATE', 10),
+        )
+    return _chat
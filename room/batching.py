@@ -0,0 +1,90 @@
+"""
+Opt-in batching of bursty outbound frames.
+
+A WebRTC negotiation produces dozens of ICE candidates within milliseconds,
+and presence churn produces runs of ``user_list_update``. For clients that
+connect with ``?batch=1``, frames of the types in ``ROOM_BATCH_TYPES`` are
+held for up to ``ROOM_BATCH_WINDOW`` seconds and sent together as a single
+array frame. A batch is sent early once it holds ``ROOM_BATCH_MAX_FRAMES``
+frames or ``ROOM_BATCH_MAX_BYTES`` bytes. Any other frame first sends
+whatever is batched, so the socket never sees frames out of order.
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class FrameBatcher:
+    def __init__(self, codec, send, window=0.008, max_frames=50, max_bytes=65536,
+                 types=('webrtc_ice_candidate', 'user_list_update')):
+        self.codec = codec
+        # Coroutine function taking (frame_type, data) for one encoded frame
+        self._send = send
+        self.window = window
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.types = frozenset(types)
+        self.pending = []
+        self.pending_types = []
+        self.pending_bytes = 0
+        self._timer = None
+        self._tasks = set()
+
+    async def send(self, frame_type, data):
+        """Send one encoded frame, batching it if its type is bursty"""
+        if frame_type not in self.types:
+            await self.flush()
+            await self._send(frame_type, data)
+            return
+        self.pending.append(data)
+        self.pending_types.append(frame_type)
+        self.pending_bytes += len(data)
+        if len(self.pending) >= self.max_frames or self.pending_bytes >= self.max_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        task = asyncio.get_running_loop().create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return
+        batch, batch_types = self.pending, self.pending_types
+        self.pending, self.pending_types, self.pending_bytes = [], [], 0
+        try:
+            if len(batch) == 1:
+                await self._send(batch_types[0], batch[0])
+            else:
+                await self._send('batch', self.codec.join(batch))
+        except Exception as e:
+            logger.error(f"Failed to send batched frames: {e}")
+
+    def close(self):
+        """Drop anything still batched; the socket is gone"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.pending, self.pending_types, self.pending_bytes = [], [], 0
+
+
+def batcher_for(codec, send):
+    """Build a ``FrameBatcher`` configured from settings"""
+    return FrameBatcher(
+        codec,
+        send,
+        window=getattr(settings, 'ROOM_BATCH_WINDOW', 0.008),
+        max_frames=getattr(settings, 'ROOM_BATCH_MAX_FRAMES', 50),
+        max_bytes=getattr(settings, 'ROOM_BATCH_MAX_BYTES', 65536),
+        types=getattr(settings, 'ROOM_BATCH_TYPES', ('webrtc_ice_candidate', 'user_list_update')),
+    )
@@ -0,0 +1,135 @@
+"""
+Write-behind persistence for chat messages.
+
+Chat lines are queued in memory and written with ``bulk_create`` once
+``ROOM_CHAT_BATCH_SIZE`` are waiting or ``ROOM_CHAT_FLUSH_INTERVAL`` seconds
+have passed, so the event loop never waits on an INSERT per message. The
+queue is bounded by ``ROOM_CHAT_MAX_PENDING``: past that, senders wait for a
+flush instead of letting memory grow.
+
+A batch that fails is retried later, unless the database refused it with
+an ``IntegrityError``: then its lines are written one by one, and those the
+database refuses (a line for a room deleted meanwhile, say) are logged and
+dropped so they can't hold up every later batch.
+
+With ``ROOM_CHAT_FLUSH_ON_SHUTDOWN`` whatever is still queued when the
+process exits is written synchronously from an ``atexit`` hook; without it,
+up to one interval of chat can be lost on shutdown.
+"""
+import asyncio
+import atexit
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import ChatMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+class ChatWriter:
+    def __init__(self, batch_size=100, flush_interval=1.0, max_pending=5000, flush_on_shutdown=True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = []
+        self._timer = None
+        self._tasks = set()
+        if flush_on_shutdown:
+            atexit.register(self.flush_sync)
+
+    async def add(self, room_pk, user_pk, message):
+        """Queue one chat line for ``room_pk`` sent by ``user_pk``"""
+        self.pending.append(ChatMessage(room_id=room_pk, user_id=user_pk, message=message))
+        if len(self.pending) >= self.max_pending:
+            # Backpressure: this sender waits rather than the queue growing
+            await self.flush()
+        elif len(self.pending) >= self.batch_size:
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self._ensure_timer()
+
+    def _ensure_timer(self):
+        loop = asyncio.get_running_loop()
+        if self._timer is None or self._timer.done() or self._timer.get_loop() is not loop:
+            self._timer = loop.create_task(self._run())
+
+    async def _run(self):
+        while self.pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+        self._timer = None
+
+    async def flush(self):
+        """Write everything queued so far in one bulk insert"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            retry = await self._save(batch)
+        except Exception as e:
+            logger.error(f"Failed to persist {len(batch)} chat messages: {e}")
+            retry = batch
+        if retry:
+            # Put them back in front, keeping the queue bounded
+            room = max(0, self.max_pending - len(self.pending))
+            self.pending[:0] = retry[-room:] if room else []
+
+    def flush_sync(self):
+        """Write whatever is queued without an event loop, e.g. at exit"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            lost = self.write(batch)
+        except Exception as e:
+            logger.error(f"Failed to persist {len(batch)} chat messages on shutdown: {e}")
+            return
+        if lost:
+            logger.error(f"Failed to persist {len(lost)} chat messages on shutdown")
+
+    def write(self, batch):
+        """Insert ``batch``; returns the lines that failed but may succeed later"""
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create(batch, batch_size=self.batch_size)
+            return []
+        except IntegrityError:
+            pass
+        # Some line is refused; find it and write the rest
+        retry = []
+        for message in batch:
+            message.pk = None
+            try:
+                with transaction.atomic():
+                    message.save(force_insert=True)
+            except IntegrityError as e:
+                logger.error(f"Dropping chat message for room {message.room_id} the database refused: {e}")
+            except Exception as e:
+                logger.error(f"Failed to persist chat message for room {message.room_id}: {e}")
+                retry.append(message)
+        return retry
+
+    def _save(self, batch):
+        return sync_to_async(self.write)(batch)
+
+
+_writer = None
+
+
+def get_chat_writer():
+    """Return the process-wide chat writer configured in settings"""
+    global _writer
+    if _writer is None:
+        _writer = ChatWriter(
+            batch_size=getattr(settings, 'ROOM_CHAT_BATCH_SIZE', 100),
+            flush_interval=getattr(settings, 'ROOM_CHAT_FLUSH_INTERVAL', 1.0),
+            max_pending=getattr(settings, 'ROOM_CHAT_MAX_PENDING', 5000),
+            flush_on_shutdown=getattr(settings, 'ROOM_CHAT_FLUSH_ON_SHUTDOWN', True),
+        )
+    return _writer
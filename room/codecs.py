@@ -0,0 +1,88 @@
+"""
+Wire codecs for room sockets.
+
+Clients pick an encoding through the WebSocket subprotocol header. JSON text
+frames stay the default for clients that ask for nothing; clients offering
+``vibesync.msgpack`` get compact MessagePack binary frames instead. Every
+frame the consumer sends or receives goes through one of these codecs.
+
+Broadcasts are encoded once per codec by the sender (see ``encode_all``) so
+each recipient forwards whichever encoding its socket speaks. ``join`` packs
+several already-encoded frames into one array frame without re-encoding them.
+"""
+import json
+
+import msgpack
+
+
+class FrameDecodeError(ValueError):
+    """Raised when an incoming frame can't be decoded into a message dict"""
+
+
+class JsonCodec:
+    subprotocol = 'vibesync.json'
+    binary = False
+
+    def encode(self, frame):
+        return json.dumps(frame)
+
+    def join(self, encoded_frames):
+        return '[' + ','.join(encoded_frames) + ']'
+
+    def decode(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data if text_data is not None else bytes_data)
+        except (TypeError, ValueError) as e:
+            raise FrameDecodeError(str(e) or type(e).__name__)
+        if not isinstance(message, dict):
+            raise FrameDecodeError("Frame is not an object")
+        return message
+
+
+class MsgpackCodec:
+    subprotocol = 'vibesync.msgpack'
+    binary = True
+
+    def encode(self, frame):
+        return msgpack.packb(frame, use_bin_type=True)
+
+    def join(self, encoded_frames):
+        return msgpack.Packer().pack_array_header(len(encoded_frames)) + b''.join(encoded_frames)
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            raise FrameDecodeError("Expected a binary frame")
+        try:
+            message = msgpack.unpackb(bytes_data, raw=False)
+        except (TypeError, ValueError, msgpack.UnpackException) as e:
+            raise FrameDecodeError(str(e) or type(e).__name__)
+        if not isinstance(message, dict):
+            raise FrameDecodeError("Frame is not a map")
+        return message
+
+
+JSON = JsonCodec()
+MSGPACK = MsgpackCodec()
+
+# In order of preference when a client offers several
+CODECS = [MSGPACK, JSON]
+
+
+def negotiate(subprotocols):
+    """Return ``(codec, subprotocol)`` for the client's offered subprotocols.
+
+    The subprotocol is None when the client offered none we speak, in which
+    case the socket falls back to plain JSON.
+    """
+    for codec in CODECS:
+        if codec.subprotocol in subprotocols:
+            return codec, codec.subprotocol
+    return JSON, None
+
+
+def encode_all(frame):
+    """Encode ``frame`` once for each codec, keyed for ``room.frame`` events"""
+    return {
+        'text': JSON.encode(frame),
+        'bytes': MSGPACK.encode(frame),
+    }
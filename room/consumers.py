@@ -1,62 +1,128 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.exceptions import AuthenticationFailed
-from django.db import models
-from asgiref.sync import sync_to_async
 import logging
-from channels.security.websocket import AllowedHostsOriginValidator, OriginValidator
-from channels.exceptions import DenyConnection
-import json
-import asyncio
+from django.conf import settings
+import time
+from urllib.parse import parse_qs
+from .presence import get_presence_registry
+from .heartbeat import get_heartbeat_scheduler
+from .playback import clean_video_url, get_playback_store
+from .controls import get_control_pipeline
+from .timesync import ClockEstimate, server_now_ms
+from .chat import get_chat_writer
+from .history import get_chat_history
+from .audience import get_audience_chat, get_audience_counter
+from .replay import get_replay_buffer
+from . import audience, sessions
+from .codecs import FrameDecodeError, encode_all, negotiate
+from .batching import batcher_for
+from .outbound import SLOW_CONSUMER_CLOSE_CODE, outbound_queue_for
+from .ratelimit import RATE_LIMITED_CLOSE_CODE, connection_limits
+from vibesync_be import metrics
+from vibesync_be.log import ContextAdapter
 
 
 logger = logging.getLogger(__name__)
 
+# Heartbeat pings never change, so they are encoded once per process
+PING_FRAMES = {'frame_type': 'ping', **encode_all({'type': 'ping', 'message': 'keep-alive'})}
+
+# Chatty message types are logged under a category that LOG_SAMPLING thins out
+LOG_CATEGORIES = {
+    'ping': 'ping',
+    'pong': 'ping',
+    'time_sync': 'ping',
+    'webrtc_ice_candidate': 'ice',
+}
+
+# Message types receive() handles; anything else is counted as 'other' so
+# clients can't mint metric labels
+HANDLED_TYPES = frozenset({
+    'ping', 'pong', 'time_sync', 'presence_resync', 'presence_page', 'chat',
+    'video_control', 'share_video', 'set_role', 'webrtc_offer', 'webrtc_answer',
+    'webrtc_ice_candidate',
+})
+
+
+def group_name(room_id):
+    """Channel layer group of the sockets in room ``room_id``"""
+    return f'room_{room_id}'
+
+
+async def broadcast(channel_layer, room_group_name, frame, **event_fields):
+    """Send ``frame`` to every socket in ``room_group_name``; see ``RoomConsumer.broadcast``"""
+    start = time.perf_counter()
+    frame, epoch = await get_replay_buffer().append(room_group_name, frame)
+    await channel_layer.group_send(
+        room_group_name,
+        {
+            'type': 'room.frame',
+            'frame_type': frame['type'],
+            'seq': frame['seq'],
+            'epoch': epoch,
+            **encode_all(frame),
+            **event_fields,
+        }
+    )
+    metrics.GROUP_SEND_LATENCY.observe(time.perf_counter() - start, frame['type'])
+
+
 class RoomConsumer(AsyncWebsocketConsumer):
-    connected_users = {}
+    # Room frames of replay epoch seen_epoch up to sequence number seen_seq
+    # were already replayed to a resumed client and are skipped when they
+    # also arrive live. Seqs restart under a new epoch, which is never skipped.
+    seen_seq = 0
+    seen_epoch = None
+    # When this socket last sent a chat line that counted against slow mode
+    last_chat_at = None
+
+    @metrics.HANDLER_LATENCY.time('connect')
     async def connect(self):
         logger.info("WebSocket connection attempt.")
-        self.scope['user'] = None
-        token = None
 
-        try:
-            # Extract token from query string
-            query_string = self.scope.get('query_string', b'').decode()
-            logger.debug(f"Query string received: {query_string}")
-            token = query_string.split("token=")[-1]
-            logger.debug(f"Extracted token: {token}")
-        except Exception as e:
-            logger.error(f"Error extracting token: {e}")
-            await self.close(code=4001)
+        # JWTAuthMiddleware has already resolved the token
+        auth_error = self.scope.get('auth_error')
+        if auth_error:
+            metrics.AUTH_FAILURES.inc(str(auth_error))
+            await self.close(code=auth_error)
             return
 
-        if token:
-            try:
-                # Authenticate token
-                validated_token = JWTAuthentication().get_validated_token(token)
-                user = await self.get_user_from_token(validated_token)
-                self.scope['user'] = user
-                logger.info(f"User authenticated: {user.username}")
-            except AuthenticationFailed as e:
-                logger.warning(f"Authentication failed: {e}")
-                await self.close(code=4001)
-                return
-            except Exception as e:
-                logger.error(f"Unexpected error during authentication: {e}")
-                await self.close(code=4002)
-                return
-
-        if self.scope['user'] and self.scope['user'].is_authenticated:
+        if self.scope.get('user') and self.scope['user'].is_authenticated:
             self.room_name = self.scope['url_route']['kwargs']['room_name']
-            self.room_group_name = f'room_{self.room_name}'
+            self.room_group_name = group_name(self.room_name)
             self.user = self.scope['user']
-            
-            # Initialize room in connected_users if not exists
-            if self.room_group_name not in self.connected_users:
-                self.connected_users[self.room_group_name] = set()
-            
-            # Add user to connected users
-            self.connected_users[self.room_group_name].add(self.user.username)
+            # Every record this socket logs carries its room and user
+            self.log = ContextAdapter(logger, {'room': self.room_name, 'user': self.user.username})
+            self.presence = get_presence_registry()
+            self.replay = get_replay_buffer()
+            self.clock = ClockEstimate()
+            self.rate_limits = connection_limits()
+            query = parse_qs(self.scope.get('query_string', b'').decode())
+
+            self.chat_history = get_chat_history()
+            self.playback = get_playback_store()
+            playback_state = await self.playback.acquire(self.room_name)
+            self.is_host = self.user.username == playback_state.host_username
+            # None when the room only exists as a socket URL, not in the DB
+            self.room_pk = playback_state.room_pk
+            # The role decides which user list, if any, this socket is listed in
+            self.audience_mode = playback_state.audience_mode
+            self.role = audience.role_of(self.user.username, playback_state)
+            if self.audience_mode:
+                self.listed_group = audience.stage_group(self.room_group_name)
+            else:
+                self.listed_group = self.room_group_name
+
+            # A client resuming a dropped session takes over the seat it
+            # still holds; otherwise this is a fresh join
+            resume = self.held_session(query)
+            if resume is not None:
+                old_channel, epoch, last_seq = resume
+                if await self.presence.rebind(self.room_group_name, self.user.username, old_channel, self.channel_name) is None:
+                    resume = None
+                elif self.listed_group != self.room_group_name and self.on_stage:
+                    await self.presence.rebind(self.listed_group, self.user.username, old_channel, self.channel_name)
+            if resume is None:
+                presence_version = await self.take_seat()
             
             # Join room group
             await self.channel_layer.group_add(
@@ -64,85 +130,434 @@ class RoomConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
             
-            logger.info(f"User {self.user.username} joined room: {self.room_name}")
-            await self.accept()
-            logger.info(f"WebSocket connection established for user: {self.scope['user'].username}")
-            
-            # Get list of connected users
-            connected_users_list = list(self.connected_users[self.room_group_name])
-            logger.info(f"Connected users in room {self.room_name}: {connected_users_list}")
-            
-            # Notify everyone about the current user list
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
+            self.log.info(f"User {self.user.username} joined room: {self.room_name}")
+            # The subprotocol header picks the wire encoding, JSON by default
+            self.codec, subprotocol = negotiate(self.scope.get('subprotocols', []))
+            await self.accept(subprotocol=subprotocol)
+            metrics.connection_opened(self.room_group_name)
+
+            # Frames are written through a bounded per-socket queue, if enabled
+            self.outbound = outbound_queue_for(self.send_data, self.slow_consumer)
+
+            # Clients opt in to receiving bursty frames batched into arrays
+            self.batcher = batcher_for(self.codec, self.outbound.put) if query.get('batch') == ['1'] else None
+            self.log.info(f"WebSocket connection established for user: {self.scope['user'].username}")
+
+            # Read after group_add, so nothing broadcast from here on is missed
+            missed = None
+            if resume is not None:
+                missed = await self.replay.since(self.room_group_name, last_seq, epoch)
+                # The old socket may still be half open; it must not linger
+                await self.channel_layer.send(old_channel, {'type': 'session.superseded'})
+                metrics.SESSION_RESUMES.inc('replayed' if missed is not None else 'resynced')
+            elif 'resume' in query:
+                metrics.SESSION_RESUMES.inc('expired')
+            if missed is not None:
+                # Replayed frames that also arrive live are skipped
+                seq = self.seen_seq = missed[-1]['seq'] if missed else last_seq
+                self.seen_epoch = epoch
+            else:
+                seq, epoch = await self.replay.position(self.room_group_name)
+            self.resume_token = sessions.resume_token(self.room_name, self.user.username, self.channel_name, epoch)
+            await self.send_frame({
+                'type': 'session',
+                'resume_token': self.resume_token,
+                'seq': seq,
+                # True: only the missed broadcasts follow, keep your state
+                'resumed': missed is not None,
+                'role': self.role,
+            })
+            sessions.live_sessions.add(self)
+
+            if missed is not None:
+                for frame in missed:
+                    await self.send_frame(frame)
+            else:
+                # Replay the recent conversation in a single frame
+                await self.send_frame({
+                    'type': 'chat_history',
+                    'messages': await self.chat_history.recent(self.room_group_name),
+                })
+
+                # Only the new socket gets the full user list
+                await self.send_presence_snapshot()
+
+                # Bring the late joiner up to the room's current playback state
+                await self.send_frame({
+                    'type': 'playback_state',
+                    **playback_state.as_dict(),
+                    'server_time': server_now_ms(),
+                })
+
+            if resume is None and presence_version is None:
+                # An audience member is only counted
+                self.audience_changed()
+            elif resume is None:
+                # Everyone else just hears about the join
+                await self.broadcast({
                     'type': 'user_list_update',
-                    'users': connected_users_list,
                     'action': 'join',
-                    'username': self.user.username
-                }
-            )
+                    'username': self.user.username,
+                    'version': presence_version,
+                })
 
-        self.keep_alive_task = asyncio.create_task(self.keep_alive())  # Start the keep-alive task
+            # Ping this socket directly from the shared heartbeat wheel
+            self.heartbeats = get_heartbeat_scheduler()
+            self.heartbeats.register(self)
+        else:
+            logger.warning("Rejecting unauthenticated WebSocket connection.")
+            metrics.AUTH_FAILURES.inc('4001')
+            await self.close(code=4001)
 
+    @metrics.HANDLER_LATENCY.time('disconnect')
     async def disconnect(self, close_code):
-        # Check if the keep_alive_task exists before trying to cancel it
-        if hasattr(self, 'keep_alive_task'):
-            self.keep_alive_task.cancel()  # Cancel the keep-alive task
-            logger.info(f"Keep-alive task canceled for user: {self.scope['user'].username}")
+        if hasattr(self, 'heartbeats'):
+            self.heartbeats.unregister(self)
+        if getattr(self, 'batcher', None) is not None:
+            self.batcher.close()
+        if hasattr(self, 'outbound'):
+            self.outbound.close()
+            metrics.connection_closed(self.room_group_name)
 
         if hasattr(self, 'room_group_name'):
-            # Remove user from connected users
-            if self.room_group_name in self.connected_users:
-                self.connected_users[self.room_group_name].remove(self.user.username)
-                
-                # Clean up empty rooms
-                if not self.connected_users[self.room_group_name]:
-                    del self.connected_users[self.room_group_name]
-            
-            # Get updated list of connected users
-            connected_users_list = list(self.connected_users.get(self.room_group_name, set()))
-            
-            # Notify others about user leaving and updated user list
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'user_list_update',
-                    'users': connected_users_list,
-                    'action': 'leave',
-                    'username': self.user.username
-                }
-            )
-            
             # Leave room group
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
             )
+            
+            sessions.live_sessions.discard(self)
+            if close_code == sessions.NORMAL_CLOSURE or not hasattr(self, 'resume_token'):
+                await self.announce_leave()
+            else:
+                # Keep the seat for a resume; announce the leave if none comes
+                grace = getattr(settings, 'ROOM_RESUME_GRACE', 30)
+                await self.touch_seat(ttl=grace)
+                sessions.hold(self.announce_leave, grace)
+            if hasattr(self, 'playback'):
+                await self.playback.release(self.room_name)
+            self.log.info(f"User {self.user.username} left room: {self.room_name}")
         
         logger.info(f"WebSocket disconnected with code: {close_code}")
-        logger.info(f"Remaining users in room {self.room_name}: {connected_users_list}")
-
-    async def user_list_update(self, event):
-        """Handle user list updates"""
-        await self.send(text_data=json.dumps({
-            'type': 'user_list_update',
-            'users': event['users'],
-            'action': event['action'],
-            'username': event['username']
-        }))
 
-    async def receive(self, text_data):
+    async def announce_leave(self):
+        """Remove this socket from presence and tell the room.
+
+        A newer socket of the same user, including one that resumed this
+        session, keeps its entry and nothing is announced.
+        """
+        presence_version = await self.presence.leave(self.room_group_name, self.user.username, self.channel_name)
+        if presence_version is not None and self.listed_group != self.room_group_name:
+            if not self.on_stage:
+                self.audience_changed()
+                return
+            presence_version = await self.presence.leave(self.listed_group, self.user.username, self.channel_name)
+        if presence_version is not None:
+            await self.broadcast({
+                'type': 'user_list_update',
+                'action': 'leave',
+                'username': self.user.username,
+                'version': presence_version,
+            })
+
+    @property
+    def on_stage(self):
+        """Whether this socket is listed in user lists rather than only counted"""
+        return self.role != audience.AUDIENCE
+
+    async def take_seat(self):
+        """Join presence; returns the version of the user list this socket is
+        listed in, or None for an audience member.
+
+        Every member is registered in the room's presence, keyed to this
+        socket's channel so signaling can be addressed to it directly. In
+        audience mode the stage is also registered under its own key.
+        """
+        version = await self.presence.join(self.room_group_name, self.user.username, self.channel_name)
+        if self.listed_group == self.room_group_name:
+            return version
+        if not self.on_stage:
+            return None
+        return await self.presence.join(self.listed_group, self.user.username, self.channel_name)
+
+    async def touch_seat(self, ttl=None):
+        """Push back the expiry of this socket's presence entries"""
+        await self.presence.touch(self.room_group_name, self.user.username, self.channel_name, ttl=ttl)
+        if self.listed_group != self.room_group_name and self.on_stage:
+            await self.presence.touch(self.listed_group, self.user.username, self.channel_name, ttl=ttl)
+
+    def audience_changed(self):
+        """Have the room's member count broadcast once the audience settles"""
+        get_audience_counter().changed(self.room_group_name, self.publish_audience)
+
+    async def publish_audience(self):
+        await self.broadcast({
+            'type': 'audience_update',
+            'count': await self.presence.count(self.room_group_name),
+        })
+
+    async def change_role(self, role):
+        """Move this socket onto or off the stage after the host changed its role"""
+        if role == self.role or self.role == audience.HOST:
+            return
+        was_on_stage = self.on_stage
+        self.role = role
+        if self.on_stage == was_on_stage:
+            return
+        if self.on_stage:
+            action = 'join'
+            presence_version = await self.presence.join(self.listed_group, self.user.username, self.channel_name)
+        else:
+            action = 'leave'
+            presence_version = await self.presence.leave(self.listed_group, self.user.username, self.channel_name)
+        if presence_version is not None:
+            await self.broadcast({
+                'type': 'user_list_update',
+                'action': action,
+                'username': self.user.username,
+                'version': presence_version,
+            })
+
+    async def assign_role(self, username, role):
+        """Let the host put ``username`` on the stage or back in the audience"""
+        if not self.is_host:
+            await self.refuse('set_role', 'host_only')
+            return
+        if not self.audience_mode or role not in (audience.SPEAKER, audience.AUDIENCE) or not isinstance(username, str):
+            await self.refuse('set_role', 'invalid_role')
+            return
+        is_speaker = role == audience.SPEAKER
+        if not await audience.save_role(self.room_pk, username, is_speaker):
+            await self.refuse('set_role', 'unknown_user')
+            return
+        # Every worker mirrors the change; the user's own sockets move
+        await self.broadcast({
+            'type': 'role_update',
+            'username': username,
+            'role': role,
+        }, role={'username': username, 'speaker': is_speaker})
+
+    async def rate_limited(self, message_type, scope, retry_after):
+        """Drop or refuse a frame over a rate limit, closing a socket that keeps at it"""
+        if scope == 'connection' and self.rate_limits.strike():
+            metrics.RATE_LIMITED.inc(message_type, scope, 'closed')
+            self.log.warning(f"Closing WebSocket over its rate limits for user: {self.user.username}")
+            await self.close(code=RATE_LIMITED_CLOSE_CODE)
+        elif self.rate_limits.action == 'refuse':
+            metrics.RATE_LIMITED.inc(message_type, scope, 'refused')
+            await self.refuse(message_type, 'rate_limited', scope=scope, retry_after=round(retry_after * 1000))
+        else:
+            metrics.RATE_LIMITED.inc(message_type, scope, 'dropped')
+
+    async def refuse(self, message_type, error, **fields):
+        """Tell this socket a frame it sent was not acted on"""
+        await self.send_frame({
+            'type': 'error',
+            'error': error,
+            'message_type': message_type,
+            **fields,
+        })
+
+    def held_session(self, query):
+        """Return ``(old_channel, epoch, last_seq)`` for a resume request, or None"""
+        try:
+            token = query['resume'][0]
+            last_seq = int(query.get('last_seq', ['0'])[0])
+        except (KeyError, ValueError):
+            return None
+        session = sessions.read_resume_token(token, self.room_name, self.user.username)
+        if session is None:
+            return None
+        return (*session, last_seq)
+
+    async def send_presence_snapshot(self):
+        """Send the full user list and its version to this socket only.
+
+        In audience mode the list is the stage, and the audience is only
+        counted.
+        """
+        members, version = await self.presence.snapshot(self.listed_group)
+        frame = {
+            'type': 'user_list_snapshot',
+            'users': list(members),
+            'version': version,
+        }
+        if self.audience_mode:
+            frame['count'] = await self.presence.count(self.room_group_name)
+        await self.send_frame(frame)
+
+    async def send_presence_page(self, cursor):
+        """Send one page of the room's whole member list to this socket"""
+        try:
+            cursor = max(0, int(cursor or 0))
+        except (TypeError, ValueError):
+            cursor = 0
+        usernames, next_cursor = await self.presence.page(
+            self.room_group_name, cursor, getattr(settings, 'ROOM_AUDIENCE_PAGE_SIZE', 50)
+        )
+        await self.send_frame({
+            'type': 'user_list_page',
+            'users': usernames,
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+        })
+
+    async def send_data(self, data):
+        """Write one encoded frame to the socket; called by the outbound queue"""
+        if self.codec.binary:
+            await self.send(bytes_data=data)
+        else:
+            await self.send(text_data=data)
+
+    async def deliver(self, frame_type, data):
+        """Hand one encoded frame to the batcher or the outbound queue"""
+        if self.batcher is not None:
+            await self.batcher.send(frame_type, data)
+        else:
+            await self.outbound.put(frame_type, data)
+
+    async def send_frame(self, frame):
+        """Encode ``frame`` with this socket's codec and send it"""
+        metrics.FRAMES_SENT.inc(frame['type'])
+        await self.deliver(frame['type'], self.codec.encode(frame))
+
+    async def send_encoded(self, encoded):
+        """Send whichever pre-encoded form of a frame this socket speaks.
+
+        Not counted in FRAMES_SENT: broadcasts are counted by the channel
+        layer as it fans them out, direct sends by their sender.
+        """
+        await self.deliver(encoded.get('frame_type'), encoded['bytes'] if self.codec.binary else encoded['text'])
+
+    async def slow_consumer(self):
+        """Close a socket whose outbound backlog grew past its limit"""
+        self.log.warning(f"Closing slow WebSocket consumer for user: {self.user.username}")
+        await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+
+    async def broadcast(self, frame, **event_fields):
+        """Send ``frame`` to the whole room, encoding it once here.
+
+        Every recipient's ``room_frame`` handler forwards the encoded frame as
+        is, so a frame costs one encoding per codec however large the room is.
+        Presence deltas are ``user_list_update`` frames; clients resync when
+        their version skips. ``event_fields`` ride along in the channel layer
+        event without being sent to clients.
+
+        Every broadcast is stamped with the room's next ``seq`` and kept in
+        the replay buffer for clients that resume.
+        """
+        await broadcast(self.channel_layer, self.room_group_name, frame, **event_fields)
+
+    async def forward_video_control(self, control):
+        """Apply a control that survived coalescing and broadcast it"""
+        playback_state = self.playback.apply_control(
+            self.room_name,
+            control['action'],
+            control['timestamp'],
+            video_url=control['video_url'],
+            video_quality=control['video_quality'],
+            at=control['server_time'] / 1000,
+        )
+        if playback_state is None:
+            return
+        # Receivers add the time elapsed since server_time, converted through
+        # their own clock offset, to land where the sender is now
+        await self.broadcast({
+            'type': 'video_control',
+            'action': control['action'],
+            'timestamp': control['timestamp'],
+            'video_url': control['video_url'],
+            'username': control['username'],
+            'server_time': control['server_time'],
+        }, playback=playback_state.as_dict())
+
+    async def answer_time_sync(self, message_data):
+        """Answer one time_sync probe, learning from the previous round trip"""
+        server_received = server_now_ms()
+        previous = message_data.get('previous')
+        if isinstance(previous, dict):
+            try:
+                self.clock.add_exchange(
+                    previous['client_sent'],
+                    previous['server_received'],
+                    previous['server_sent'],
+                    previous['client_received'],
+                )
+            except (KeyError, TypeError, ValueError):
+                self.log.debug("Ignoring malformed time_sync sample")
+        await self.send_frame({
+            'type': 'time_sync',
+            'client_sent': message_data.get('client_sent'),
+            'server_received': server_received,
+            'server_sent': server_now_ms(),
+            'offset': self.clock.offset,
+            'rtt': self.clock.rtt,
+        })
+
+    # Not timed: it runs once per recipient of every broadcast, and timing
+    # it would cost about as much as it does
+    async def room_frame(self, event):
+        """Forward a frame that was encoded by its sender"""
+        seq = event.get('seq')
+        if seq is not None and seq <= self.seen_seq and event.get('epoch') == self.seen_epoch:
+            return
+        if 'playback' in event:
+            # Keep this worker's copy current for its own late joiners
+            self.playback.sync(self.room_name, event['playback'])
+        if 'role' in event:
+            change = event['role']
+            self.playback.set_role(self.room_name, change['username'], change['speaker'])
+            if change['username'] == self.user.username:
+                await self.change_role(audience.SPEAKER if change['speaker'] else audience.AUDIENCE)
+        await self.send_encoded(event)
+
+    async def receive(self, text_data=None, bytes_data=None):
         user = self.scope['user']
         if user.is_authenticated:
+            start = time.perf_counter()
+            handler = 'invalid'
             try:
-                message_data = json.loads(text_data)
-                logger.info(f"Received message: {message_data}")  # Log the received message
+                message_data = self.codec.decode(text_data, bytes_data)
+                # Any frame from the client counts as a pong
+                self.heartbeats.mark_alive(self)
                 message_type = message_data.get('type', '')
+                if not isinstance(message_type, str):
+                    # It would be used as a dict key and a metric label below
+                    raise FrameDecodeError("Frame type is not a string")
+                if message_type != 'chat':
+                    # Lazy arguments: most ping and ICE records are sampled away
+                    self.log.info("Received %s frame", message_type,
+                                  extra={'category': LOG_CATEGORIES.get(message_type, 'frame')})
+                handler = message_type if message_type in HANDLED_TYPES else 'other'
+                metrics.FRAMES_RECEIVED.inc(handler)
+
+                if self.rate_limits.closed:
+                    return  # Closing for flooding; the rest of its frames go unread
+                if message_type in self.rate_limits:
+                    limited = await self.rate_limits.check(self.room_group_name, message_type)
+                    if limited is not None:
+                        await self.rate_limited(message_type, *limited)
+                        return
+
+                if message_type in ('ping', 'pong'):
+                    return  # Liveness was recorded above
+
+                if message_type == 'time_sync':
+                    await self.answer_time_sync(message_data)
+                    return
 
-                if message_type == 'ping':
-                    logger.info("Received keep-alive ping from client.")  # Log the received ping
-                    return  # Just acknowledge the ping
+                if message_type == 'presence_resync':
+                    # Client saw a gap in presence versions
+                    await self.send_presence_snapshot()
+                    return
+
+                if message_type == 'presence_page':
+                    await self.send_presence_page(message_data.get('cursor'))
+                    return
+
+                if self.audience_mode and not self.is_host and message_type in audience.HOST_ONLY_TYPES:
+                    await self.refuse(message_type, 'host_only')
+                    return
 
                 if message_type == 'chat':
                     # Parse the message correctly
@@ -151,143 +566,146 @@ class RoomConsumer(AsyncWebsocketConsumer):
                         actual_message = message_content
                     else:
                         actual_message = message_content.get('message', '')
+                    outcome = 'broadcast'
+                    if not self.on_stage:
+                        chat_gate = get_audience_chat()
+                        outcome = chat_gate.check(self.room_group_name, self.last_chat_at)
+                        if outcome == 'slowed':
+                            retry_after = chat_gate.retry_after(self.last_chat_at)
+                            await self.refuse('chat', 'slow_mode', retry_after=round(retry_after * 1000))
+                            return
+                        self.last_chat_at = time.monotonic()
+                    self.log.info("Chat message: %s", actual_message, extra={'category': 'chat'})
 
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'chat_message',
-                            'message': actual_message,
-                            'username': user.username
-                        }
-                    )
+                    if self.room_pk is not None:
+                        await get_chat_writer().add(self.room_pk, user.pk, actual_message)
+                    chat_frame = {
+                        'type': 'chat',
+                        'message': actual_message,
+                        'username': user.username
+                    }
+                    if outcome == 'sampled':
+                        # Stored, but over the room's rate: only the sender sees it
+                        await self.send_frame(chat_frame)
+                        return
+                    await self.chat_history.append(self.room_group_name, {
+                        'message': actual_message,
+                        'username': user.username,
+                        'sent_at': server_now_ms(),
+                    })
+                    await self.broadcast(chat_frame)
                 elif message_type == 'video_control':
-                    # Broadcast video control to all users
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
+                    # Seek storms are merged per room before they reach anyone
+                    await get_control_pipeline().submit(
+                        self.room_name,
                         {
-                            'type': 'video_control',
                             'action': message_data.get('action', ''),
                             'timestamp': message_data.get('timestamp', 0),
                             'video_url': message_data.get('video_url', ''),
-                            'username': user.username
-                        }
+                            'video_quality': message_data.get('video_quality'),
+                            'username': user.username,
+                            # When the sender issued it, on the server's clock
+                            'server_time': self.clock.issued_at(message_data.get('sent_at')),
+                        },
+                        self.forward_video_control,
+                        is_host=self.is_host,
                     )
+                elif message_type == 'set_role':
+                    await self.assign_role(message_data.get('username'), message_data.get('role'))
                 elif message_type == 'share_video':
                     # Handle video link sharing
                     video_url = message_data.get('video_url', '')
-                    logger.info(f"User {user.username} is sharing video URL: {video_url}")  # Log the shared URL
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'video_share',
-                            'video_url': video_url,
-                            'username': user.username
-                        }
-                    )
+                    if video_url and clean_video_url(video_url) is None:
+                        await self.refuse(message_type, 'invalid_video_url')
+                        return
+                    self.log.info(f"User {user.username} is sharing video URL: {video_url}")  # Log the shared URL
+                    playback_state = self.playback.apply_share(self.room_name, video_url)
+                    if playback_state is None:
+                        return
+                    await self.broadcast({
+                        'type': 'video_share',
+                        'video_url': video_url,
+                        'username': user.username
+                    }, playback=playback_state.as_dict())
                 elif message_type in ['webrtc_offer', 'webrtc_answer', 'webrtc_ice_candidate']:
-                    # Ensure 'data' is defined correctly
+                    # Signaling is only meaningful to one peer, so deliver it
+                    # straight to that peer's channel instead of the room group
                     to_user = message_data.get('to', None)
                     content = message_data.get('content', None)
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
+                    if not isinstance(to_user, str):
+                        # Anything else would reach presence lookups as a key
+                        await self.refuse(message_type, 'invalid_recipient')
+                        return
+                    target_channel = await self.presence.channel_for(self.room_group_name, to_user)
+                    if target_channel is None:
+                        await self.refuse(message_type, 'peer_not_connected', to=to_user)
+                        return
+                    await self.channel_layer.send(
+                        target_channel,
                         {
-                            'type': message_type,
-                            'from': user.username,
-                            'to': to_user,
-                            'content': content,
+                            'type': 'room.frame',
+                            'frame_type': message_type,
+                            **encode_all({
+                                'type': message_type,
+                                'from': user.username,
+                                'content': content,
+                            }),
                         }
                     )
+                    metrics.FRAMES_SENT.inc(message_type)
 
 
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON received: {text_data}")
+            except FrameDecodeError as e:
+                self.log.error(f"Invalid frame received: {e}")
+            finally:
+                metrics.HANDLER_LATENCY.observe(time.perf_counter() - start, handler)
         else:
             logger.warning("Unauthorized access to WebSocket.")
             await self.send(text_data="Unauthorized access!")
     
-    async def chat_message(self, event):
-        """Handle chat messages"""
-        await self.send(text_data=json.dumps({
-            'type': 'chat',
-            'message': event['message'],
-            'username': event['username']
-        }))
-    async def video_control(self, event):
-        """Handle video control events"""
-        await self.send(text_data=json.dumps({
-            'type': 'video_control',
-            'action': event['action'],
-            'timestamp': event['timestamp'],
-            'video_url': event['video_url'],
-            'username': event['username']
-        }))
-
     async def user_join(self, event):
         """Handle user join notifications"""
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             'type': 'user_join',
             'username': event['username']
-        }))
+        })
 
     async def user_leave(self, event):
         """Handle user leave notifications"""
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             'type': 'user_leave',
             'username': event['username']
-        }))
+        })
 
-    async def video_share(self, event):
-        """Handle video sharing"""
-        logger.info(f"Broadcasting video URL: {event['video_url']} from user: {event['username']}")  # Log the broadcasted URL
-        await self.send(text_data=json.dumps({
-            'type': 'video_share',
-            'video_url': event['video_url'],
-            'username': event['username']
+    async def session_superseded(self, event):
+        """Close this socket: its session was resumed on a newer one"""
+        self.log.info(f"Closing superseded WebSocket for user: {self.user.username}")
+        await self.close(code=sessions.SUPERSEDED_CLOSE_CODE)
+
+    async def drain(self, retry_after):
+        """Close this socket ahead of a shutdown, telling the client when to resume.
+
+        The backlog is dropped rather than flushed: the client gets it back
+        from the replay buffer when it resumes.
+        """
+        if self.batcher is not None:
+            self.batcher.close()
+        self.outbound.close()
+        await self.send_data(self.codec.encode({
+            'type': 'reconnect',
+            'resume_token': self.resume_token,
+            'retry_after': round(retry_after * 1000),
         }))
-    async def webrtc_offer(self, event):
-        if event['to'] == self.user.username:
-            await self.send(json.dumps({
-                'type': 'webrtc_offer',
-                'from': event['from'],
-                'content': event['content'],
-            }))
-
-    async def webrtc_answer(self, event):
-        if event['to'] == self.user.username:
-            await self.send(json.dumps({
-                'type': 'webrtc_answer',
-                'from': event['from'],
-                'content': event['content'],
-            }))
-
-    async def webrtc_ice_candidate(self, event):
-        if event['to'] == self.user.username:
-            await self.send(json.dumps({
-                'type': 'webrtc_ice_candidate',
-                'from': event['from'],
-                'content': event['content'],
-            }))
-
-
-    @sync_to_async
-    def get_user_from_token(self, validated_token):
-        return JWTAuthentication().get_user(validated_token)
-
-    async def keep_alive(self):
-        while True:
-            await asyncio.sleep(60)  # Send a ping every 60 seconds
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'ping',
-                    'message': 'keep-alive'
-                }
-            )
-            logger.info("Sent keep-alive ping to room: {}".format(self.room_group_name))
-
-    async def ping(self, event):
-        """Handle ping messages"""
-        await self.send(text_data=json.dumps({
-            'type': 'ping',
-            'message': event['message']
-        }))
\ No newline at end of file
+        await self.close(code=sessions.SERVICE_RESTART_CLOSE_CODE)
+
+    @metrics.HANDLER_LATENCY.time('heartbeat')
+    async def heartbeat(self):
+        """Ping this socket and refresh its presence entry"""
+        metrics.FRAMES_SENT.inc('ping')
+        await self.send_encoded(PING_FRAMES)
+        await self.touch_seat()
+
+    async def heartbeat_expired(self):
+        """Close a socket that stopped answering pings"""
+        self.log.info(f"Closing unresponsive WebSocket for user: {self.user.username}")
+        await self.close(code=4003)
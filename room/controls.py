@@ -0,0 +1,103 @@
+"""
+Per-room coalescing of ``video_control`` seek storms.
+
+Seeks are throttled per room with a leading and a trailing edge: the first
+seek after a quiet period is forwarded at once and opens a window of
+``ROOM_CONTROL_WINDOW`` seconds. Later seeks in that window replace each
+other, and whichever is left when the window closes is forwarded and opens
+the next window. A room therefore sees at most one seek per window however
+many users are scrubbing.
+
+With ``ROOM_CONTROL_POLICY = 'host'`` a pending seek from the room's host is
+not replaced by seeks from other members; the default, ``'last_writer'``,
+keeps whichever came last. Other actions (play, pause, ...) are forwarded
+immediately and supersede any pending seek.
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class ControlWindow:
+    __slots__ = ('timer', 'pending')
+
+    def __init__(self, timer):
+        self.timer = timer
+        # (control, forward, is_host) waiting for the window to close
+        self.pending = None
+
+
+class ControlPipeline:
+    def __init__(self, window=0.25, policy='last_writer'):
+        self.window = window
+        self.policy = policy
+        self.windows = {}
+        self.stats = {'forwarded': 0, 'merged': 0}
+        self._tasks = set()
+
+    async def submit(self, room_id, control, forward, is_host=False):
+        """Forward ``control`` via ``forward(control)`` now, later, or never"""
+        current = self.windows.get(room_id)
+
+        if control.get('action') != 'seek':
+            if current is not None:
+                current.timer.cancel()
+                del self.windows[room_id]
+                if current.pending is not None:
+                    self.stats['merged'] += 1
+            await self._forward(forward, control)
+            return
+
+        if current is None:
+            # Leading edge: nothing recent, send it straight away
+            self._open_window(room_id)
+            await self._forward(forward, control)
+            return
+
+        if current.pending is not None:
+            if self.policy == 'host' and current.pending[2] and not is_host:
+                self.stats['merged'] += 1
+                return
+            self.stats['merged'] += 1
+        current.pending = (control, forward, is_host)
+
+    def _open_window(self, room_id):
+        loop = asyncio.get_running_loop()
+        timer = loop.call_later(self.window, self._close_window, room_id)
+        self.windows[room_id] = ControlWindow(timer)
+
+    def _close_window(self, room_id):
+        current = self.windows.pop(room_id, None)
+        if current is None or current.pending is None:
+            return
+        # Trailing edge: send the survivor and keep throttling behind it
+        control, forward, _ = current.pending
+        self._open_window(room_id)
+        task = asyncio.get_running_loop().create_task(self._forward(forward, control))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _forward(self, forward, control):
+        self.stats['forwarded'] += 1
+        try:
+            await forward(control)
+        except Exception as e:
+            logger.error(f"Failed to forward video control: {e}")
+
+
+_pipeline = None
+
+
+def get_control_pipeline():
+    """Return the process-wide control pipeline configured in settings"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = ControlPipeline(
+            window=getattr(settings, 'ROOM_CONTROL_WINDOW', 0.25),
+            policy=getattr(settings, 'ROOM_CONTROL_POLICY', 'last_writer'),
+        )
+    return _pipeline
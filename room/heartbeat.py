@@ -0,0 +1,96 @@
+"""
+Per-socket heartbeats driven by one timer wheel per process.
+
+Instead of every connection running its own sleep loop, sockets register with
+the process-wide ``HeartbeatScheduler``. The wheel has one slot per ``tick``
+across the heartbeat interval; each tick fires a single slot, so every socket
+is pinged once per interval and the work is spread evenly over time.
+
+Any frame received from a client counts as a pong. A socket that has been
+silent for longer than the timeout is treated as dead and closed.
+"""
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatScheduler:
+    def __init__(self, interval=30, timeout=75, tick=1.0):
+        self.interval = interval
+        self.timeout = timeout
+        self.tick = tick
+        self.slots = [set() for _ in range(max(1, round(interval / tick)))]
+        self.slot_of = {}
+        self.last_seen = {}
+        self.cursor = 0
+        self._task = None
+
+    def register(self, consumer):
+        """Start heartbeats for ``consumer``, first ping one interval from now"""
+        # The slot just behind the cursor is the last one to fire
+        index = (self.cursor - 1) % len(self.slots)
+        self.slots[index].add(consumer)
+        self.slot_of[consumer] = index
+        self.last_seen[consumer] = time.monotonic()
+        self._ensure_running()
+
+    def unregister(self, consumer):
+        index = self.slot_of.pop(consumer, None)
+        if index is not None:
+            self.slots[index].discard(consumer)
+        self.last_seen.pop(consumer, None)
+
+    def mark_alive(self, consumer):
+        """Record that ``consumer``'s client was heard from"""
+        if consumer in self.last_seen:
+            self.last_seen[consumer] = time.monotonic()
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while self.slot_of:
+            next_tick += self.tick
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            slot = self.slots[self.cursor]
+            self.cursor = (self.cursor + 1) % len(self.slots)
+            if slot:
+                await self._fire(list(slot))
+        self._task = None
+
+    async def _fire(self, consumers):
+        now = time.monotonic()
+        calls = []
+        for consumer in consumers:
+            if now - self.last_seen.get(consumer, now) > self.timeout:
+                self.unregister(consumer)
+                calls.append(consumer.heartbeat_expired())
+            else:
+                calls.append(consumer.heartbeat())
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Heartbeat failed: {result}")
+
+
+_scheduler = None
+
+
+def get_heartbeat_scheduler():
+    """Return the process-wide heartbeat scheduler configured in settings"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = HeartbeatScheduler(
+            interval=getattr(settings, 'ROOM_HEARTBEAT_INTERVAL', 30),
+            timeout=getattr(settings, 'ROOM_HEARTBEAT_TIMEOUT', 75),
+        )
+    return _scheduler
@@ -0,0 +1,109 @@
+"""
+Recent chat history replayed to sockets when they join a room.
+
+Each room keeps a ring buffer of its last ``size`` chat lines so a joiner can
+be sent the conversation in one frame without touching the database. The
+backend is chosen by ``settings.ROOM_CHAT_HISTORY``, laid out like
+``ROOM_PRESENCE``:
+
+- ``LocalChatHistory`` keeps buffers in process memory. Rooms are evicted
+  least-recently-used past ``max_rooms``, and after ``ttl`` idle seconds,
+  so memory stays bounded however many rooms come and go. It only sees
+  chat sent through its own process.
+- ``RedisChatHistory`` keeps one capped list per room, shared by every
+  worker, and lets Redis expire rooms idle for ``ttl`` seconds.
+"""
+import json
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseChatHistory:
+    def __init__(self, size=50, ttl=3600):
+        self.size = size
+        self.ttl = ttl
+
+    async def append(self, room, entry):
+        """Add ``entry`` (a JSON-serializable dict) to ``room``'s buffer"""
+        raise NotImplementedError
+
+    async def recent(self, room):
+        """Return ``room``'s buffered entries, oldest first"""
+        raise NotImplementedError
+
+
+class LocalChatHistory(BaseChatHistory):
+    def __init__(self, size=50, ttl=3600, max_rooms=1000):
+        super().__init__(size=size, ttl=ttl)
+        self.max_rooms = max_rooms
+        # room -> (deque of entries, last_used), least recently used first
+        self.rooms = OrderedDict()
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.rooms:
+            oldest = next(iter(self.rooms))
+            if len(self.rooms) <= self.max_rooms and self.rooms[oldest][1] > cutoff:
+                break
+            del self.rooms[oldest]
+
+    async def append(self, room, entry):
+        buffer = self.rooms[room][0] if room in self.rooms else deque(maxlen=self.size)
+        buffer.append(entry)
+        self.rooms[room] = (buffer, time.monotonic())
+        self.rooms.move_to_end(room)
+        self._evict()
+
+    async def recent(self, room):
+        item = self.rooms.get(room)
+        if item is None:
+            return []
+        if item[1] <= time.monotonic() - self.ttl:
+            del self.rooms[room]
+            return []
+        self.rooms[room] = (item[0], time.monotonic())
+        self.rooms.move_to_end(room)
+        return list(item[0])
+
+
+class RedisChatHistory(BaseChatHistory):
+    def __init__(self, url='redis://127.0.0.1:6379/0', size=50, ttl=3600, prefix='chat_history'):
+        super().__init__(size=size, ttl=ttl)
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis.asyncio as redis
+
+            self._client = redis.Redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    async def append(self, room, entry):
+        key = f'{self.prefix}:{room}'
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, json.dumps(entry))
+            pipe.ltrim(key, -self.size, -1)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def recent(self, room):
+        return [json.loads(entry) for entry in await self.client.lrange(f'{self.prefix}:{room}', 0, -1)]
+
+
+_history = None
+
+
+def get_chat_history():
+    """Return the process-wide chat history configured in settings"""
+    global _history
+    if _history is None:
+        config = getattr(settings, 'ROOM_CHAT_HISTORY', {})
+        backend = import_string(config.get('BACKEND', 'room.history.LocalChatHistory'))
+        _history = backend(**config.get('CONFIG', {}))
+    return _history
@@ -0,0 +1,389 @@
+"""
+Local-first channel layer that uses Redis only for cross-node traffic.
+
+``HybridChannelLayer`` keeps channels and groups in process memory like
+``InMemoryChannelLayer``, so a ``group_send`` whose members all live in this
+process never leaves it. Each process (node) tracks, per group it has local
+members in, which other nodes have members too; only when there are any is
+the message published to Redis, where those nodes pick it up and deliver it
+to their own local members.
+
+Groups and nodes are spread over the configured Redis hosts by consistent
+hashing, so adding a host only moves a small share of the rooms::
+
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'room.layers.HybridChannelLayer',
+            'CONFIG': {
+                'hosts': ['redis://10.0.0.1:6379/0', 'redis://10.0.0.2:6379/0'],
+            },
+        },
+    }
+
+Hosts given as ``local://<name>`` use an in-process stand-in for Redis, which
+lets several layers in one process act as separate nodes without a server.
+"""
+import asyncio
+import bisect
+import functools
+import hashlib
+import logging
+import random
+import string
+import time
+import uuid
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+
+from vibesync_be import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class HashRing:
+    """Consistent hash ring mapping keys onto hosts"""
+
+    def __init__(self, hosts, replicas=100):
+        self.ring = sorted(
+            (self._hash(f'{host}#{i}'), host) for host in hosts for i in range(replicas)
+        )
+        self.points = [point for point, _ in self.ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def get(self, key):
+        index = bisect.bisect(self.points, self._hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+
+class RedisBroker:
+    """Pub/sub and node registry on one Redis host"""
+
+    def __init__(self, url):
+        import redis.asyncio as redis
+
+        self.client = redis.Redis.from_url(url)
+        self.pubsub = None
+        self.callbacks = {}
+        self._reader = None
+
+    async def subscribe(self, topic, callback):
+        if self.pubsub is None:
+            self.pubsub = self.client.pubsub()
+        self.callbacks[topic] = callback
+        await self.pubsub.subscribe(topic)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.get_running_loop().create_task(self._read())
+
+    async def unsubscribe(self, topic):
+        self.callbacks.pop(topic, None)
+        if self.pubsub is not None:
+            await self.pubsub.unsubscribe(topic)
+
+    async def _read(self):
+        while self.callbacks:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                logger.error(f"Redis pub/sub read failed: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if message is None:
+                continue
+            topic = message['channel'].decode()
+            callback = self.callbacks.get(topic)
+            if callback is None:
+                continue
+            # One bad message must not stop the reader for every topic
+            try:
+                callback(message['data'])
+            except Exception as e:
+                logger.error(f"Failed to handle pub/sub message on {topic}: {e}")
+
+    async def publish(self, topic, data):
+        await self.client.publish(topic, data)
+
+    async def register(self, key, member, ttl):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(key, {member: time.time() + ttl})
+            pipe.expire(key, int(ttl * 2))
+            await pipe.execute()
+
+    async def unregister(self, key, member):
+        await self.client.zrem(key, member)
+
+    async def live_members(self, key):
+        return {member.decode() for member in await self.client.zrangebyscore(key, time.time(), '+inf')}
+
+    async def close(self):
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class LocalHub:
+    """In-process stand-in for one Redis host, shared by name"""
+
+    hubs = {}
+
+    def __init__(self):
+        self.topics = {}
+        self.members = {}
+
+    @classmethod
+    def named(cls, name):
+        return cls.hubs.setdefault(name, cls())
+
+
+class LocalBroker:
+    """``RedisBroker`` counterpart backed by a ``LocalHub``"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    async def subscribe(self, topic, callback):
+        self.hub.topics.setdefault(topic, {})[self] = callback
+
+    async def unsubscribe(self, topic):
+        subscribers = self.hub.topics.get(topic, {})
+        subscribers.pop(self, None)
+        if not subscribers:
+            self.hub.topics.pop(topic, None)
+
+    async def publish(self, topic, data):
+        # Delivered on a later loop iteration, like a network round trip
+        loop = asyncio.get_running_loop()
+        for callback in list(self.hub.topics.get(topic, {}).values()):
+            loop.call_soon(callback, data)
+
+    async def register(self, key, member, ttl):
+        self.hub.members.setdefault(key, {})[member] = time.time() + ttl
+
+    async def unregister(self, key, member):
+        self.hub.members.get(key, {}).pop(member, None)
+
+    async def live_members(self, key):
+        now = time.time()
+        return {member for member, expires_at in self.hub.members.get(key, {}).items() if expires_at > now}
+
+    async def close(self):
+        for topic in list(self.hub.topics):
+            await self.unsubscribe(topic)
+
+
+def make_broker(host):
+    if host.startswith('local://'):
+        return LocalBroker(LocalHub.named(host[len('local://'):]))
+    return RedisBroker(host)
+
+
+class HybridChannelLayer(InMemoryChannelLayer):
+    def __init__(self, hosts=None, prefix='vibesync', node_ttl=30, **kwargs):
+        super().__init__(**kwargs)
+        self.hosts = hosts or ['redis://127.0.0.1:6379/0']
+        self.prefix = prefix
+        self.node_ttl = node_ttl
+        self.node_id = uuid.uuid4().hex[:12]
+        self.ring = HashRing(self.hosts)
+        self.brokers = {}
+        # group -> other nodes with members, for groups with local members
+        self.remote_nodes = {}
+        # group -> [lock, users]: joins and leaves of a group never overlap
+        self._group_locks = {}
+        self.stats = {'local_deliveries': 0, 'published': 0, 'received': 0}
+        self._node_subscribed = False
+        self._refresher = None
+        self._tasks = set()
+        self._last_clean = 0.0
+
+    # Routing
+
+    def _broker(self, key):
+        host = self.ring.get(key)
+        if host not in self.brokers:
+            self.brokers[host] = make_broker(host)
+        return self.brokers[host]
+
+    def _group_topic(self, group):
+        return f'{self.prefix}:group:{group}'
+
+    def _group_nodes_key(self, group):
+        return f'{self.prefix}:nodes:{group}'
+
+    def _node_topic(self, node_id):
+        return f'{self.prefix}:node:{node_id}'
+
+    def _node_of(self, channel):
+        if '!' not in channel:
+            return self.node_id
+        return channel.split('!', 1)[0].rsplit('.', 1)[-1]
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _clean_expired(self):
+        # The in-memory sweep walks every channel; once a second is plenty
+        now = time.time()
+        if now - self._last_clean >= 1.0:
+            self._last_clean = now
+            super()._clean_expired()
+
+    # Channels
+
+    async def new_channel(self, prefix='specific.'):
+        if not self._node_subscribed:
+            self._node_subscribed = True
+            await self._broker(self.node_id).subscribe(self._node_topic(self.node_id), self._on_node_message)
+        suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        return f'{prefix}.{self.node_id}!{suffix}'
+
+    async def send(self, channel, message):
+        node_id = self._node_of(channel)
+        if node_id == self.node_id:
+            await super().send(channel, message)
+            return
+        data = msgpack.packb({'channel': channel, 'message': message}, use_bin_type=True)
+        await self._broker(node_id).publish(self._node_topic(node_id), data)
+        self.stats['published'] += 1
+
+    def _on_node_message(self, data):
+        payload = msgpack.unpackb(data, raw=False)
+        self.stats['received'] += 1
+        self._spawn(self._deliver_local(payload['channel'], payload['message']))
+
+    async def _deliver_local(self, channel, message):
+        try:
+            await InMemoryChannelLayer.send(self, channel, message)
+        except ChannelFull:
+            logger.warning(f"Dropped message for full channel {channel}")
+
+    # Groups
+
+    async def group_add(self, group, channel):
+        await super().group_add(group, channel)
+        await self._sync_group(group)
+
+    async def group_discard(self, group, channel):
+        await super().group_discard(group, channel)
+        await self._sync_group(group)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Invalid group name"
+        self._deliver_group(group, message)
+
+        remote = self.remote_nodes.get(group)
+        # Groups without local members aren't tracked, so publish blindly
+        if remote is None or remote:
+            data = msgpack.packb(
+                {'kind': 'message', 'origin': self.node_id, 'message': message}, use_bin_type=True
+            )
+            await self._broker(group).publish(self._group_topic(group), data)
+            self.stats['published'] += 1
+
+    def _deliver_group(self, group, message):
+        self._clean_expired()
+        delivered = 0
+        for channel in list(self.groups.get(group, {})):
+            queue = self.channels.setdefault(channel, asyncio.Queue(maxsize=self.get_capacity(channel)))
+            try:
+                queue.put_nowait((time.time() + self.expiry, message))
+            except asyncio.QueueFull:
+                continue
+            delivered += 1
+        self.stats['local_deliveries'] += delivered
+        # Counted here once per fan-out rather than by each recipient
+        if delivered and 'frame_type' in message:
+            metrics.FRAMES_SENT.inc(message['frame_type'], amount=delivered)
+
+    async def _sync_group(self, group):
+        """Join or leave the group across nodes to match whether it has local members"""
+        entry = self._group_locks.setdefault(group, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # Members can come and go while a join or leave awaits, so check again after each
+                while (group in self.groups) != (group in self.remote_nodes):
+                    if group in self.groups:
+                        await self._join_group(group)
+                    else:
+                        await self._leave_group(group)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._group_locks[group]
+
+    async def _join_group(self, group):
+        self.remote_nodes[group] = set()
+        broker = self._broker(group)
+        topic = self._group_topic(group)
+        await broker.subscribe(topic, functools.partial(self._on_group_message, group))
+        await broker.register(self._group_nodes_key(group), self.node_id, self.node_ttl)
+        self.remote_nodes[group] |= await broker.live_members(self._group_nodes_key(group)) - {self.node_id}
+        await broker.publish(topic, msgpack.packb({'kind': 'hello', 'origin': self.node_id}, use_bin_type=True))
+        self._ensure_refresher()
+
+    async def _leave_group(self, group):
+        self.remote_nodes.pop(group, None)
+        broker = self._broker(group)
+        topic = self._group_topic(group)
+        await broker.unregister(self._group_nodes_key(group), self.node_id)
+        await broker.publish(topic, msgpack.packb({'kind': 'bye', 'origin': self.node_id}, use_bin_type=True))
+        await broker.unsubscribe(topic)
+
+    def _on_group_message(self, group, data):
+        payload = msgpack.unpackb(data, raw=False)
+        origin = payload['origin']
+        if origin == self.node_id:
+            return
+        remote = self.remote_nodes.get(group)
+        kind = payload['kind']
+        if kind == 'message':
+            self.stats['received'] += 1
+            self._deliver_group(group, payload['message'])
+        elif remote is None:
+            return
+        elif kind == 'hello':
+            remote.add(origin)
+        elif kind == 'bye':
+            remote.discard(origin)
+
+    def _ensure_refresher(self):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh())
+
+    async def _refresh(self):
+        # Keep our registrations alive and forget nodes that died silently
+        while self.remote_nodes:
+            await asyncio.sleep(self.node_ttl / 3)
+            for group in list(self.remote_nodes):
+                broker = self._broker(group)
+                key = self._group_nodes_key(group)
+                try:
+                    await broker.register(key, self.node_id, self.node_ttl)
+                    live = await broker.live_members(key)
+                except Exception as e:
+                    logger.error(f"Failed to refresh nodes of group {group}: {e}")
+                    continue
+                if group in self.remote_nodes:
+                    self.remote_nodes[group] = live - {self.node_id}
+
+    # Flush extension
+
+    async def flush(self):
+        await super().flush()
+        for group in list(self.remote_nodes):
+            await self._sync_group(group)
+
+    async def close(self):
+        for broker in self.brokers.values():
+            await broker.close()
+        self.brokers = {}
+        self._node_subscribed = False
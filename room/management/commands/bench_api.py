@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from room.models import Room
+
+
+PASSWORD = 'bench-Passw0rd!'
+
+# Seconds between event loop lag probes
+LAG_INTERVAL = 0.005
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def request(application, method, path, body=None, headers=()):
+    """Make one HTTP request against the ASGI application; return (status, headers)"""
+    payload = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'headers': [
+            (b'host', b'localhost'),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode()),
+            *headers,
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('127.0.0.1', 8000),
+    }
+    messages = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+    response = {}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Nothing more to read; park until the app is done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {name.lower(): value for name, value in message.get('headers', [])}
+
+    await application(scope, receive, send)
+    return response['status'], response['headers']
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent REST throughput through the ASGI application: "
+        "room details (cold, cached and conditional), room creation, "
+        "set-video and login, each driven by many concurrent clients."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint")
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--login-requests', type=int, default=40,
+                            help="Login requests, fewer since each one hashes a password")
+        parser.add_argument('--endpoints', nargs='+',
+                            default=['details', 'details_cached', 'details_304', 'create', 'set_video', 'login'])
+
+    def handle(self, *args, **options):
+        if options['verbosity'] < 2:
+            logging.disable(logging.WARNING)
+
+        suffix = uuid.uuid4().hex[:5]
+        user = User(username=f'bench_{suffix}')
+        user.set_password(PASSWORD)
+        user.save()
+        rooms = Room.objects.bulk_create(
+            Room(room_id=f'a{suffix}{i}', host_user=user) for i in range(options['requests'])
+        )
+        try:
+            results = asyncio.run(self.run(user, rooms, options))
+        finally:
+            Room.objects.filter(host_user=user).delete()
+            user.delete()
+
+        self.stdout.write(f"concurrency {options['concurrency']}")
+        for endpoint, (count, elapsed, latencies, lags, statuses) in results.items():
+            self.stdout.write(
+                f"{endpoint:>15}: {count / elapsed:8.0f} req/s, p50 {percentile(latencies, 0.5) * 1000:7.2f} ms, "
+                f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms, loop lag max {max(lags, default=0) * 1000:7.2f} ms, "
+                f"statuses {statuses}"
+            )
+
+    async def run(self, user, rooms, options):
+        from vibesync_be.asgi import application
+
+        auth = (b'authorization', f'Bearer {AccessToken.for_user(user)}'.encode())
+        video = {'video_url': 'https://example.com/watch?v=bench'}
+        login = {'username': user.username, 'password': PASSWORD}
+        etags = {}
+
+        async def details(i):
+            status, headers = await request(application, 'GET', f'/api/room/{rooms[i].room_id}/', headers=[auth])
+            etags[i] = headers.get(b'etag', b'')
+            return status
+
+        async def details_304(i):
+            conditional = (b'if-none-match', etags.get(i, b''))
+            status, _ = await request(application, 'GET', f'/api/room/{rooms[i].room_id}/', headers=[auth, conditional])
+            return status
+
+        async def create(i):
+            status, _ = await request(application, 'POST', '/api/create-room/', body={}, headers=[auth])
+            return status
+
+        async def set_video(i):
+            status, _ = await request(application, 'POST', f'/api/room/{rooms[i].room_id}/set-video/',
+                                      body=video, headers=[auth])
+            return status
+
+        async def do_login(i):
+            status, _ = await request(application, 'POST', '/api/users/login/', body=login)
+            return status
+
+        scenarios = {
+            # First pass fills the room details cache, second pass hits it
+            'details': (details, options['requests']),
+            'details_cached': (details, options['requests']),
+            'details_304': (details_304, options['requests']),
+            'create': (create, options['requests']),
+            'set_video': (set_video, options['requests']),
+            'login': (do_login, options['login_requests']),
+        }
+        results = {}
+        for endpoint in options['endpoints']:
+            call, count = scenarios[endpoint]
+            results[endpoint] = await self.drive(call, count, options['concurrency'])
+        return results
+
+    async def drive(self, call, count, concurrency):
+        latencies = []
+        statuses = {}
+        pending = iter(range(count))
+
+        async def worker():
+            for i in pending:
+                start = time.perf_counter()
+                status = await call(i)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        async def probe():
+            # How late a short sleep wakes up: what every socket on the
+            # worker would wait meanwhile
+            while True:
+                before = time.perf_counter()
+                await asyncio.sleep(LAG_INTERVAL)
+                lags.append(time.perf_counter() - before - LAG_INTERVAL)
+
+        lags = []
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        prober.cancel()
+        return count, elapsed, latencies, lags, statuses
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from room.codecs import JSON, encode_all
+from room.consumers import RoomConsumer
+
+
+SAMPLE_FRAMES = {
+    'chat': {
+        'type': 'chat',
+        'message': 'anyone else hearing the audio drift at 12:40?',
+        'username': 'viewer42',
+    },
+    'video_control': {
+        'type': 'video_control',
+        'action': 'seek',
+        'timestamp': 761.25,
+        'video_url': 'https://example.com/watch?v=dQw4w9WgXcQ',
+        'username': 'host',
+    },
+    'user_list_update': {
+        'type': 'user_list_update',
+        'action': 'join',
+        'username': 'viewer42',
+        'version': 1187,
+    },
+}
+
+
+class Passthrough:
+    """Stands in for the outbound queue so only the handler path is timed"""
+
+    def __init__(self, send):
+        self.send = send
+
+    async def put(self, frame_type, data):
+        await self.send(text_data=data)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure CPU time per delivered broadcast frame, re-encoding per "
+        "recipient (the old handlers) versus forwarding pre-encoded text."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=200)
+        parser.add_argument('--messages', type=int, default=500)
+
+    def handle(self, *args, **options):
+        recipients = options['recipients']
+        messages = options['messages']
+        deliveries = recipients * messages
+        self.stdout.write(f"{messages} frames x {recipients} recipients = {deliveries} deliveries per run")
+        for frame_type, frame in SAMPLE_FRAMES.items():
+            before = asyncio.run(self.per_recipient(frame, recipients, messages))
+            after = asyncio.run(self.pre_encoded(frame, recipients, messages))
+            self.stdout.write(
+                f"{frame_type:>17}: per-recipient {before / deliveries * 1e6:.3f} us/delivery, "
+                f"pre-encoded {after / deliveries * 1e6:.3f} us/delivery "
+                f"({before / after:.1f}x)"
+            )
+
+    async def per_recipient(self, frame, recipients, messages):
+        sink = []
+
+        async def send(text_data=None):
+            sink.append(text_data)
+
+        # Old path: the event travels as a dict and every recipient's handler
+        # rebuilds and encodes it
+        event = dict(frame)
+        start = time.process_time()
+        for _ in range(messages):
+            for _ in range(recipients):
+                await send(text_data=json.dumps({key: event[key] for key in frame}))
+            sink.clear()
+        return time.process_time() - start
+
+    async def pre_encoded(self, frame, recipients, messages):
+        sink = []
+
+        async def send(text_data=None):
+            sink.append(text_data)
+
+        consumers = []
+        for _ in range(recipients):
+            consumer = RoomConsumer()
+            consumer.codec = JSON
+            consumer.batcher = None
+            consumer.outbound = Passthrough(send)
+            consumer.send = send
+            consumers.append(consumer)
+
+        start = time.process_time()
+        for _ in range(messages):
+            event = {'type': 'room.frame', 'frame_type': frame['type'], **encode_all(frame)}
+            for consumer in consumers:
+                await consumer.room_frame(event)
+            sink.clear()
+        return time.process_time() - start
@@ -0,0 +1,60 @@
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from room.chat import ChatWriter
+from room.models import ChatMessage, Room
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure sustained chat messages/sec into the configured database, "
+        "one INSERT per message versus batched bulk_create."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5000)
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[10, 100, 500])
+
+    def handle(self, *args, **options):
+        messages = options['messages']
+        suffix = uuid.uuid4().hex[:8]
+        user = User.objects.create(username=f'bench_{suffix}')
+        room = Room.objects.create(room_id=f'B{suffix}'[:10], host_user=user)
+        try:
+            elapsed = asyncio.run(self.per_message(room.pk, user.pk, messages))
+            self.report('per-message create', messages, elapsed)
+            for batch_size in options['batch_sizes']:
+                elapsed = asyncio.run(self.batched(room.pk, user.pk, messages, batch_size))
+                self.report(f'bulk_create batch={batch_size}', messages, elapsed)
+        finally:
+            # Cascades to the benchmark's chat messages
+            room.delete()
+            user.delete()
+
+    def report(self, label, messages, elapsed):
+        self.stdout.write(f"{label:>28}: {messages / elapsed:10.0f} msg/s ({elapsed:.2f}s)")
+
+    async def per_message(self, room_pk, user_pk, messages):
+        create = sync_to_async(ChatMessage.objects.create)
+        start = time.perf_counter()
+        for i in range(messages):
+            await create(room_id=room_pk, user_id=user_pk, message=f'message {i}')
+        return time.perf_counter() - start
+
+    async def batched(self, room_pk, user_pk, messages, batch_size):
+        writer = ChatWriter(batch_size=batch_size, flush_interval=0.05, flush_on_shutdown=False)
+        start = time.perf_counter()
+        for i in range(messages):
+            await writer.add(room_pk, user_pk, f'message {i}')
+            # Yield like a consumer would between frames so flushes interleave
+            await asyncio.sleep(0)
+        # Let in-flight batches land, then write the remainder
+        while writer._tasks:
+            await asyncio.gather(*writer._tasks)
+        await writer.flush()
+        return time.perf_counter() - start
@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from room.codecs import CODECS
+
+
+SAMPLE_FRAMES = {
+    'chat': {
+        'type': 'chat',
+        'message': 'anyone else hearing the audio drift at 12:40?',
+        'username': 'viewer42',
+    },
+    'video_control': {
+        'type': 'video_control',
+        'action': 'seek',
+        'timestamp': 761.25,
+        'video_url': 'https://example.com/watch?v=dQw4w9WgXcQ',
+        'username': 'host',
+        'server_time': 1729180800123.5,
+    },
+    'webrtc_offer': {
+        'type': 'webrtc_offer',
+        'from': 'host',
+        'content': {
+            'type': 'offer',
+            'sdp': (
+                "v=0\r\no=- 4611731400430051336 2 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\n"
+                "a=group:BUNDLE 0 1\r\na=extmap-allow-mixed\r\na=msid-semantic: WMS\r\n"
+                "m=audio 9 UDP/TLS/RTP/SAVPF 111 63 9 0 8 13 110 126\r\nc=IN IP4 0.0.0.0\r\n"
+                "a=rtcp:9 IN IP4 0.0.0.0\r\na=ice-ufrag:Vt4Y\r\na=ice-pwd:0xRB7nRqXhVfDvVhFhTu2cQy\r\n"
+                "a=ice-options:trickle\r\na=fingerprint:sha-256 2B:8F:0A:31:64:0D:5C:7E:9A:41:"
+                "E2:1B:6A:53:C7:88:3D:90:1F:66:AB:02:4E:95:D1:3C:7F:28:B6:E0:19:A4\r\n"
+                "a=setup:actpass\r\na=mid:0\r\na=sendrecv\r\na=rtcp-mux\r\n"
+                "a=rtpmap:111 opus/48000/2\r\na=fmtp:111 minptime=10;useinbandfec=1\r\n"
+            ),
+        },
+    },
+    'webrtc_ice_candidate': {
+        'type': 'webrtc_ice_candidate',
+        'from': 'host',
+        'content': {
+            'candidate': 'candidate:842163049 1 udp 1677729535 203.0.113.7 54321 typ srflx '
+                         'raddr 192.168.1.20 rport 54321 generation 0 ufrag Vt4Y network-cost 999',
+            'sdpMid': '0',
+            'sdpMLineIndex': 0,
+        },
+    },
+}
+
+
+class Command(BaseCommand):
+    help = "Compare bytes on the wire and encode/decode CPU of each room codec."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        for frame_type, frame in SAMPLE_FRAMES.items():
+            self.stdout.write(frame_type)
+            for codec in CODECS:
+                encoded = codec.encode(frame)
+                size = len(encoded.encode() if isinstance(encoded, str) else encoded)
+
+                start = time.process_time()
+                for _ in range(iterations):
+                    codec.encode(frame)
+                encode_us = (time.process_time() - start) / iterations * 1e6
+
+                kwargs = {'bytes_data': encoded} if codec.binary else {'text_data': encoded}
+                start = time.process_time()
+                for _ in range(iterations):
+                    codec.decode(**kwargs)
+                decode_us = (time.process_time() - start) / iterations * 1e6
+
+                self.stdout.write(
+                    f"  {codec.subprotocol:>17}: {size:5d} bytes, "
+                    f"encode {encode_us:.2f} us, decode {decode_us:.2f} us"
+                )
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from room.codecs import JSON, encode_all
+from room.consumers import RoomConsumer
+from vibesync_be import metrics
+
+
+CHAT = {'type': 'chat', 'message': 'anyone else hearing the audio drift at 12:40?', 'username': 'viewer42'}
+
+
+class Passthrough:
+    """Stands in for the outbound queue so only the handler path is timed"""
+
+    def __init__(self, send):
+        self.send = send
+
+    async def put(self, frame_type, data):
+        await self.send(text_data=data)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what metrics instrumentation costs: per counter/histogram "
+        "update, and per delivered broadcast frame on the room_frame path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=200000)
+        parser.add_argument('--recipients', type=int, default=200)
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        operations = options['operations']
+        counter = metrics.Counter('bench_total', "Benchmark counter", ('type',))
+        histogram = metrics.Histogram('bench_seconds', "Benchmark histogram", ('handler',))
+
+        start = time.perf_counter()
+        for _ in range(operations):
+            counter.inc('chat')
+        self.report_op('Counter.inc', start, operations)
+
+        start = time.perf_counter()
+        for _ in range(operations):
+            histogram.observe(0.0012, 'chat')
+        self.report_op('Histogram.observe', start, operations)
+
+        async def handler():
+            pass
+
+        timed_handler = histogram.time('handler')(handler)
+        bare = asyncio.run(self.call(handler, operations))
+        timed = asyncio.run(self.call(timed_handler, operations))
+        self.stdout.write(f"{'Histogram.time':>20}: {(timed - bare) / operations * 1e9:.0f} ns/call added")
+
+        deliveries = options['recipients'] * options['messages']
+        # Alternate the two and keep each one's best run to damp noise
+        bare, timed = [], []
+        for _ in range(options['rounds']):
+            bare.append(asyncio.run(self.deliver(options['recipients'], options['messages'], instrumented=False)))
+            timed.append(asyncio.run(self.deliver(options['recipients'], options['messages'], instrumented=True)))
+        bare, timed = min(bare), min(timed)
+        self.stdout.write(
+            f"room_frame delivery: bare {bare / deliveries * 1e6:.3f} us, "
+            f"instrumented {timed / deliveries * 1e6:.3f} us "
+            f"({(timed - bare) / bare:+.1%})"
+        )
+
+    def report_op(self, label, start, operations):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label:>20}: {elapsed / operations * 1e9:.0f} ns/op")
+
+    async def call(self, handler, operations):
+        start = time.perf_counter()
+        for _ in range(operations):
+            await handler()
+        return time.perf_counter() - start
+
+    async def deliver(self, recipients, messages, instrumented):
+        sink = []
+
+        async def send(text_data=None):
+            sink.append(text_data)
+
+        consumers = []
+        for _ in range(recipients):
+            consumer = RoomConsumer()
+            consumer.codec = JSON
+            consumer.batcher = None
+            consumer.outbound = Passthrough(send)
+            consumer.send = send
+            consumers.append(consumer)
+
+        event = {'type': 'room.frame', 'frame_type': CHAT['type'], **encode_all(CHAT)}
+        start = time.process_time()
+        for _ in range(messages):
+            if instrumented:
+                # The one update per broadcast, made by the channel layer's fan-out
+                metrics.FRAMES_SENT.inc(CHAT['type'], amount=recipients)
+            for consumer in consumers:
+                await consumer.room_frame(event)
+            sink.clear()
+        return time.process_time() - start
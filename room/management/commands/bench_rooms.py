@@ -0,0 +1,350 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import tracemalloc
+
+import msgpack
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework_simplejwt.tokens import AccessToken
+
+from room.chat import get_chat_writer
+from room.codecs import JSON, MSGPACK
+from room.models import Room
+from room.outbound import outbound_stats
+
+
+LAYERS = {
+    'hybrid': {
+        'BACKEND': 'room.layers.HybridChannelLayer',
+        'CONFIG': {'hosts': ['local://bench']},
+    },
+    'inmemory': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class SimulatedClient:
+    """One WebSocket client speaking ASGI directly to the application"""
+
+    def __init__(self, application, room_id, user, token, codec, batch, on_frame):
+        self.application = application
+        self.room_id = room_id
+        self.user = user
+        self.token = token
+        self.codec = codec
+        self.batch = batch
+        self.on_frame = on_frame
+        self.inbox = asyncio.Queue()
+        self.accepted = None
+        self.task = None
+
+    async def connect(self):
+        """Open the socket; True once the consumer accepted it"""
+        query = f'token={self.token}' + ('&batch=1' if self.batch else '')
+        path = f'/ws/room/{self.room_id}/'
+        scope = {
+            'type': 'websocket',
+            'asgi': {'version': '3.0'},
+            'scheme': 'ws',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'headers': [(b'host', b'localhost'), (b'origin', b'http://localhost')],
+            'subprotocols': [self.codec.subprotocol],
+            'client': ('127.0.0.1', 0),
+            'server': ('127.0.0.1', 8000),
+        }
+        self.accepted = asyncio.get_running_loop().create_future()
+        self.task = asyncio.get_running_loop().create_task(self.application(scope, self.inbox.get, self.handle))
+        await self.inbox.put({'type': 'websocket.connect'})
+        return await self.accepted
+
+    async def handle(self, message):
+        if message['type'] == 'websocket.accept':
+            self.accepted.set_result(True)
+        elif message['type'] == 'websocket.close':
+            if not self.accepted.done():
+                self.accepted.set_result(False)
+        elif message['type'] == 'websocket.send':
+            received_at = time.perf_counter()
+            if message.get('bytes') is not None:
+                data = msgpack.unpackb(message['bytes'], raw=False)
+            else:
+                data = json.loads(message['text'])
+            # Batched deliveries arrive as an array of frames
+            for frame in data if isinstance(data, list) else [data]:
+                self.on_frame(self, frame, received_at)
+
+    async def send(self, frame):
+        encoded = self.codec.encode(frame)
+        key = 'bytes' if self.codec.binary else 'text'
+        await self.inbox.put({'type': 'websocket.receive', key: encoded})
+
+    async def close(self):
+        await self.inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+        try:
+            await asyncio.wait_for(self.task, timeout=5)
+        except asyncio.TimeoutError:
+            self.task.cancel()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test room sockets in process: connect simulated rooms through "
+        "the ASGI application, drive a chat/control/ICE mix with join/leave "
+        "churn, and report connect rate, fan-out latency, delivered msgs/sec "
+        "and memory per connection. Needs no Redis or network; the channel "
+        "layer is swapped for an in-process one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10)
+        parser.add_argument('--users', type=int, default=20, help="Sockets per room")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of traffic")
+        parser.add_argument('--chat-rate', type=float, default=5.0, help="Chat messages/sec per room")
+        parser.add_argument('--control-rate', type=float, default=1.0, help="Video controls/sec per room")
+        parser.add_argument('--ice-rate', type=float, default=10.0, help="ICE candidates/sec per room")
+        parser.add_argument('--churn', type=float, default=0.5, help="Leave/rejoin cycles/sec per room")
+        parser.add_argument('--codec', choices=['json', 'msgpack'], default='json')
+        parser.add_argument('--batch', action='store_true', help="Clients opt in to batched frames")
+        parser.add_argument('--layer', choices=sorted(LAYERS), default='hybrid')
+        parser.add_argument('--audience-mode', action='store_true',
+                            help="Create the rooms in audience mode; the first socket of each is the host")
+        parser.add_argument('--memory-sample', type=int, default=50,
+                            help="Extra sockets opened under tracemalloc to size a connection")
+        parser.add_argument('--max-p99-ms', type=float, default=None,
+                            help="Fail if chat fan-out p99 exceeds this, for regression gates")
+
+    def handle(self, *args, **options):
+        if options['verbosity'] < 2:
+            # Per-frame INFO logging would dominate the numbers
+            logging.disable(logging.INFO)
+
+        # Bench users and rooms live in a throwaway test database, never the real one
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            total = options['rooms'] * options['users'] + options['memory_sample']
+            users = User.objects.bulk_create(User(username=f'bench_{i}') for i in range(total))
+            rooms = [
+                Room.objects.create(
+                    room_id=f'bench{i}', host_user=users[i * options['users']], audience_mode=options['audience_mode'],
+                )
+                for i in range(options['rooms'])
+            ]
+            with override_settings(
+                CHANNEL_LAYERS={'default': LAYERS[options['layer']]},
+                ROOM_PRESENCE={'BACKEND': 'room.presence.LocalPresenceRegistry'},
+                ROOM_CHAT_HISTORY={'BACKEND': 'room.history.LocalChatHistory'},
+                ROOM_REPLAY={'BACKEND': 'room.replay.LocalReplayBuffer'},
+                ROOM_RATE_LIMITER={'BACKEND': 'room.ratelimit.LocalRateLimiter'},
+            ):
+                results = asyncio.run(self.run(rooms, users, options))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        self.report(results, options)
+        if options['max_p99_ms'] is not None and results['p99']['chat'] > options['max_p99_ms']:
+            raise CommandError(
+                f"Chat fan-out p99 {results['p99']['chat']:.2f} ms exceeds {options['max_p99_ms']:.2f} ms"
+            )
+
+    async def run(self, rooms, users, options):
+        from vibesync_be.asgi import application
+
+        codec = MSGPACK if options['codec'] == 'msgpack' else JSON
+        per_room = options['users']
+        # msg id -> (kind, perf_counter at send)
+        sent = {}
+        latencies = {'chat': [], 'video_control': [], 'webrtc_ice_candidate': []}
+        counts = {'sent': dict.fromkeys(latencies, 0), 'expected_chat': 0}
+        ids = iter(range(1, 1 << 62))
+
+        def on_frame(client, frame, received_at):
+            frame_type = frame.get('type')
+            if frame_type == 'chat':
+                msg_id = int(frame['message'].split()[-1])
+            elif frame_type == 'video_control':
+                msg_id = int(frame['timestamp'])
+            elif frame_type == 'webrtc_ice_candidate':
+                msg_id = frame['content']['id']
+            else:
+                return
+            entry = sent.get(msg_id)
+            if entry is not None:
+                latencies[frame_type].append((received_at - entry[1]) * 1000)
+
+        def make_client(room, user):
+            token = str(AccessToken.for_user(user))
+            return SimulatedClient(application, room.room_id, user, token, codec, options['batch'], on_frame)
+
+        async def open_client(room, user):
+            client = make_client(room, user)
+            if not await client.connect():
+                raise CommandError(f"Socket for {user.username} in room {room.room_id} was refused")
+            return client
+
+        # Connect phase
+        connected = {room.room_id: [] for room in rooms}
+        start = time.perf_counter()
+        for index, room in enumerate(rooms):
+            members = users[index * per_room:(index + 1) * per_room]
+            connected[room.room_id] = await asyncio.gather(*(open_client(room, user) for user in members))
+        connect_elapsed = time.perf_counter() - start
+        connections = len(rooms) * per_room
+
+        # Size a connection with a few extra sockets spread over the rooms
+        memory_per_connection = 0.0
+        sample_users = users[connections:]
+        if sample_users:
+            await asyncio.sleep(0.2)
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            sample = [await open_client(rooms[i % len(rooms)], user) for i, user in enumerate(sample_users)]
+            await asyncio.sleep(0.2)
+            memory_per_connection = (tracemalloc.get_traced_memory()[0] - before) / len(sample)
+            tracemalloc.stop()
+            for client in sample:
+                await client.close()
+
+        # Traffic phase
+        async def chat_traffic(room):
+            clients = connected[room.room_id]
+            while True:
+                await asyncio.sleep(random.expovariate(options['chat_rate']))
+                msg_id = next(ids)
+                sent[msg_id] = ('chat', time.perf_counter())
+                counts['sent']['chat'] += 1
+                counts['expected_chat'] += len(clients)
+                await random.choice(clients).send({'type': 'chat', 'message': f'bench {msg_id}'})
+
+        async def control_traffic(room):
+            clients = connected[room.room_id]
+            while True:
+                await asyncio.sleep(random.expovariate(options['control_rate']))
+                msg_id = next(ids)
+                sent[msg_id] = ('video_control', time.perf_counter())
+                counts['sent']['video_control'] += 1
+                await random.choice(clients).send({
+                    'type': 'video_control',
+                    'action': random.choice(['play', 'pause', 'seek']),
+                    'timestamp': msg_id,
+                    'video_url': 'https://example.com/watch?v=bench',
+                })
+
+        async def ice_traffic(room):
+            clients = connected[room.room_id]
+            while True:
+                await asyncio.sleep(random.expovariate(options['ice_rate']))
+                if len(clients) < 2:
+                    continue
+                sender, peer = random.sample(clients, 2)
+                msg_id = next(ids)
+                sent[msg_id] = ('webrtc_ice_candidate', time.perf_counter())
+                counts['sent']['webrtc_ice_candidate'] += 1
+                await sender.send({
+                    'type': 'webrtc_ice_candidate',
+                    'to': peer.user.username,
+                    'content': {'id': msg_id, 'candidate': 'candidate:0 1 UDP 2122252543 10.0.0.1 50000 typ host'},
+                })
+
+        reconnects = []
+
+        async def churn(room):
+            clients = connected[room.room_id]
+            while True:
+                await asyncio.sleep(random.expovariate(options['churn']))
+                leaving = clients.pop(random.randrange(len(clients)))
+                await leaving.close()
+                reconnect_start = time.perf_counter()
+                clients.append(await open_client(room, leaving.user))
+                reconnects.append(time.perf_counter() - reconnect_start)
+
+        drivers = []
+        for room in rooms:
+            for rate, driver in (
+                (options['chat_rate'], chat_traffic),
+                (options['control_rate'], control_traffic),
+                (options['ice_rate'], ice_traffic),
+                (options['churn'], churn),
+            ):
+                if rate > 0:
+                    drivers.append(asyncio.get_running_loop().create_task(driver(room)))
+
+        start = time.perf_counter()
+        await asyncio.sleep(options['duration'])
+        for task in drivers:
+            task.cancel()
+        await asyncio.gather(*drivers, return_exceptions=True)
+        # Let frames already in flight land
+        await asyncio.sleep(0.5)
+        traffic_elapsed = time.perf_counter() - start
+        queues = outbound_stats()
+
+        for clients in connected.values():
+            for client in clients:
+                await client.close()
+        await get_chat_writer().flush()
+
+        return {
+            'connections': connections,
+            'connect_rate': connections / connect_elapsed,
+            'reconnects': reconnects,
+            'memory_per_connection': memory_per_connection,
+            'elapsed': traffic_elapsed,
+            'sent': counts['sent'],
+            'expected_chat': counts['expected_chat'],
+            'delivered': {kind: len(samples) for kind, samples in latencies.items()},
+            'p50': {kind: percentile(samples, 0.50) for kind, samples in latencies.items()},
+            'p95': {kind: percentile(samples, 0.95) for kind, samples in latencies.items()},
+            'p99': {kind: percentile(samples, 0.99) for kind, samples in latencies.items()},
+            'outbound': queues,
+        }
+
+    def report(self, results, options):
+        self.stdout.write(
+            f"{options['rooms']} rooms x {options['users']} sockets, {options['codec']} codec, "
+            f"{options['layer']} layer, batching {'on' if options['batch'] else 'off'}"
+            + (", audience mode" if options['audience_mode'] else "")
+        )
+        self.stdout.write(f"  connect rate: {results['connect_rate']:.0f} sockets/s")
+        if results['reconnects']:
+            self.stdout.write(
+                f"  churn: {len(results['reconnects'])} rejoins, "
+                f"p50 {percentile(results['reconnects'], 0.5) * 1000:.2f} ms, "
+                f"p99 {percentile(results['reconnects'], 0.99) * 1000:.2f} ms"
+            )
+        self.stdout.write(f"  memory: {results['memory_per_connection'] / 1024:.1f} KiB per connection")
+        delivered = sum(results['delivered'].values())
+        self.stdout.write(
+            f"  delivered: {delivered} frames in {results['elapsed']:.1f}s "
+            f"= {delivered / results['elapsed']:.0f} msgs/s"
+        )
+        if results['expected_chat']:
+            self.stdout.write(
+                f"  chat delivery: {results['delivered']['chat']}/{results['expected_chat']} "
+                f"({results['delivered']['chat'] / results['expected_chat']:.1%})"
+            )
+        for kind in results['delivered']:
+            self.stdout.write(
+                f"  {kind:>21}: sent {results['sent'][kind]:6d}, delivered {results['delivered'][kind]:7d}, "
+                f"p50 {results['p50'][kind]:7.2f} ms, p95 {results['p95'][kind]:7.2f} ms, "
+                f"p99 {results['p99'][kind]:7.2f} ms"
+            )
+        queues = results['outbound']
+        self.stdout.write(
+            f"  outbound: peak depth {queues['peak_depth']}, "
+            f"coalesced {queues['coalesced']}, dropped {queues['dropped']}"
+        )
@@ -0,0 +1,280 @@
+import argparse
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# A worker that dies sooner than this after starting is crash-looping, and
+# is restarted with a growing delay instead of at once
+MIN_UPTIME = 5
+MAX_RESTART_DELAY = 30
+
+
+class Worker:
+    def __init__(self, slot, process, ready_fd):
+        self.slot = slot
+        self.process = process
+        self.ready_fd = ready_fd
+        self.started = time.monotonic()
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the ASGI application from several worker processes sharing one "
+        "listening socket. Crashed workers are restarted; SIGHUP replaces the "
+        "workers one at a time, SIGTERM or SIGINT drains and stops them all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='127.0.0.1', help="IPv4 address to listen on")
+        parser.add_argument('-p', '--port', type=int, default=8000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--backlog', type=int, default=2048)
+        parser.add_argument('--websocket-timeout', type=int, default=1200,
+                            help="Seconds a WebSocket may stay open, as daphne's --websocket_timeout")
+        parser.add_argument('--graceful-timeout', type=float, default=30,
+                            help="Seconds a stopping worker gets to drain its sockets before it is killed")
+        # Set by the supervisor when it starts a worker
+        parser.add_argument('--worker-fd', type=int, help=argparse.SUPPRESS)
+        parser.add_argument('--ready-fd', type=int, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker_fd'] is not None:
+            self.serve(options)
+            return
+
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        if options['workers'] > 1:
+            self.check_shared_state()
+
+        self.options = options
+        self.listener = self.bind(options['bind'], options['port'], options['backlog'])
+        self.workers = {}
+        self.restart_delays = {}
+        self.stopping = False
+        self.reload_requested = False
+
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+        signal.signal(signal.SIGHUP, self.on_reload)
+
+        self.stdout.write(
+            f"Listening on {options['bind']}:{options['port']} with {options['workers']} workers "
+            f"(supervisor pid {os.getpid()})"
+        )
+        for slot in range(options['workers']):
+            self.spawn(slot)
+        try:
+            self.supervise()
+        finally:
+            self.stop_all()
+            self.listener.close()
+
+    # Supervisor
+
+    def check_shared_state(self):
+        """Refuse settings under which rooms can't span workers"""
+        layer = settings.CHANNEL_LAYERS.get('default', {})
+        hosts = layer.get('CONFIG', {}).get('hosts', [])
+        if layer.get('BACKEND', '').endswith('InMemoryChannelLayer') or any(
+            str(host).startswith('local://') for host in hosts
+        ):
+            raise CommandError("Several workers need a channel layer on Redis: CHANNEL_LAYERS is process-local")
+        if getattr(settings, 'ROOM_PRESENCE', {}).get('BACKEND', '').endswith('LocalPresenceRegistry'):
+            raise CommandError("Several workers need a shared ROOM_PRESENCE: LocalPresenceRegistry is process-local")
+        for name in ('ROOM_CHAT_HISTORY', 'ROOM_REPLAY', 'ROOM_RATE_LIMITER'):
+            if getattr(settings, name, {}).get('BACKEND', '').split('.')[-1].startswith('Local'):
+                self.stderr.write(f"Warning: {name} is process-local, so each worker only sees its own share of a room")
+
+    def bind(self, host, port, backlog):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Lets a second supervisor bind the port while this one is still
+        # serving, e.g. to replace the supervisor itself without downtime
+        if hasattr(socket, 'SO_REUSEPORT'):
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            listener.bind((host, port))
+        except OSError as e:
+            raise CommandError(f"Can't listen on {host}:{port}: {e}")
+        listener.listen(backlog)
+        listener.set_inheritable(True)
+        return listener
+
+    def spawn(self, slot):
+        """Start a worker process for ``slot`` on the shared socket"""
+        ready_read, ready_write = os.pipe()
+        argv = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'runworkers',
+            '--worker-fd', str(self.listener.fileno()),
+            '--ready-fd', str(ready_write),
+            '--websocket-timeout', str(self.options['websocket_timeout']),
+        ]
+        # A fresh interpreter per worker: nothing is inherited but the socket,
+        # and a rolling restart picks up new code
+        process = subprocess.Popen(argv, pass_fds=(self.listener.fileno(), ready_write))
+        os.close(ready_write)
+        worker = Worker(slot, process, ready_read)
+        self.workers[worker.pid] = worker
+        return worker
+
+    def wait_ready(self, worker, timeout=30):
+        """Wait until ``worker`` accepts connections; False if it died or timed out"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and worker.process.poll() is None:
+            readable, _, _ = select.select([worker.ready_fd], [], [], 0.2)
+            if readable:
+                return os.read(worker.ready_fd, 1) == b'1'
+        return False
+
+    def supervise(self):
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+            self.reap()
+            time.sleep(0.2)
+
+    def reap(self):
+        """Restart workers that exited on their own"""
+        for pid, worker in list(self.workers.items()):
+            code = worker.process.poll()
+            if code is None:
+                continue
+            del self.workers[pid]
+            os.close(worker.ready_fd)
+            if self.stopping:
+                continue
+            uptime = time.monotonic() - worker.started
+            delay = 0
+            if uptime < MIN_UPTIME:
+                delay = min(MAX_RESTART_DELAY, max(1, self.restart_delays.get(worker.slot, 0) * 2))
+            self.restart_delays[worker.slot] = delay
+            self.stderr.write(
+                f"Worker {pid} (slot {worker.slot}) exited with {code} after {uptime:.1f}s; "
+                f"restarting in {delay}s"
+            )
+            self.sleep(delay)
+            if not self.stopping:
+                self.spawn(worker.slot)
+
+    def rolling_restart(self):
+        """Replace every worker, one at a time, without closing the port"""
+        self.stdout.write("Rolling restart")
+        for old in sorted(self.workers.values(), key=lambda worker: worker.slot):
+            if self.stopping:
+                return
+            new = self.spawn(old.slot)
+            if not self.wait_ready(new):
+                self.stderr.write(f"Replacement worker {new.pid} did not start; keeping {old.pid}")
+                self.stop(new)
+                return
+            # The old worker's sockets drain to the others with resume hints
+            self.stop(old)
+        self.stdout.write("Rolling restart done")
+
+    def stop(self, worker):
+        """Stop ``worker`` gracefully, killing it after the graceful timeout"""
+        if worker.process.poll() is None:
+            worker.process.send_signal(signal.SIGTERM)
+            try:
+                worker.process.wait(self.options['graceful_timeout'])
+            except subprocess.TimeoutExpired:
+                self.stderr.write(f"Worker {worker.pid} did not stop in time, killing it")
+                worker.process.kill()
+                worker.process.wait()
+        if self.workers.pop(worker.pid, None) is not None:
+            os.close(worker.ready_fd)
+
+    def stop_all(self):
+        self.stopping = True
+        workers = list(self.workers.values())
+        for worker in workers:
+            if worker.process.poll() is None:
+                worker.process.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + self.options['graceful_timeout']
+        for worker in workers:
+            try:
+                worker.process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+                worker.process.wait()
+            if self.workers.pop(worker.pid, None) is not None:
+                os.close(worker.ready_fd)
+
+    def sleep(self, seconds):
+        deadline = time.monotonic() + seconds
+        while not self.stopping and time.monotonic() < deadline:
+            time.sleep(0.2)
+
+    def on_stop(self, signum, frame):
+        self.stopping = True
+
+    def on_reload(self, signum, frame):
+        self.reload_requested = True
+
+    # Worker
+
+    def serve(self, options):
+        """Run one worker: daphne on the inherited socket, draining on SIGTERM"""
+        import asyncio
+
+        # Installs the asyncio reactor, so it comes before anything Twisted
+        from daphne.server import Server
+        from twisted.internet import reactor
+
+        from room import sessions
+        from vibesync_be.asgi import application
+
+        ports = []
+        stopping = False
+
+        class WorkerServer(Server):
+            def listen_success(self, port):
+                ports.append(port)
+                super().listen_success(port)
+
+        server = WorkerServer(
+            application,
+            endpoints=[f"fd:fileno={options['worker_fd']}"],
+            signal_handlers=False,
+            websocket_timeout=options['websocket_timeout'],
+            ready_callable=lambda: reactor.callWhenRunning(self.ready, options['ready_fd']),
+            verbosity=options['verbosity'],
+        )
+
+        async def shutdown():
+            # New connections go to the other workers from here on
+            for port in ports:
+                port.stopListening()
+            await sessions.drain()
+            # Let the close frames reach the clients
+            await asyncio.sleep(1)
+            reactor.stop()
+
+        def on_signal():
+            nonlocal stopping
+            if not stopping:
+                stopping = True
+                loop.create_task(shutdown())
+
+        loop = reactor._asyncioEventloop
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, on_signal)
+        server.run()
+
+    def ready(self, ready_fd):
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-17 23:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('room', '0004_room_is_movie_sync_enabled'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='audience_mode',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='speakers',
+            field=models.ManyToManyField(blank=True, related_name='speaking_rooms', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
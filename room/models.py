@@ -12,6 +12,9 @@ class Room(models.Model):
     video_quality = models.CharField(max_length=10, blank=True, null=True)  # Tracks current video quality
     members = models.ManyToManyField(User, related_name='rooms', blank=True)  # Room members
     is_movie_sync_enabled = models.BooleanField(default=False)
+    # Large rooms: only the host and speakers are listed, and only the host controls playback
+    audience_mode = models.BooleanField(default=False)
+    speakers = models.ManyToManyField(User, related_name='speaking_rooms', blank=True)
 
     def __str__(self):
         return self.room_id
@@ -0,0 +1,164 @@
+"""
+Bounded per-connection outbound queues.
+
+Every frame for a socket goes through its ``OutboundQueue`` and is written by
+a drain task, so a slow client never stalls the consumer that produced the
+frame. What happens to a frame while the socket is backlogged depends on its
+type, per ``ROOM_OUTBOUND_POLICIES``:
+
+- ``'latest'``: only the newest queued frame of the type survives (an older
+  seek is useless once a newer one is waiting).
+- ``'drop'``: the frame is discarded (a ping adds nothing to a backlog).
+- anything else, including types not listed, is kept (chat).
+
+A socket whose backlog grows past ``ROOM_OUTBOUND_MAX_DEPTH`` frames is a
+slow consumer: its queue is discarded and the connection is closed with
+code 4004.
+
+The queue can only see a backlog if the server's ``send`` waits for the
+socket to drain, as uvicorn's websockets implementation does once its write
+buffer is full. Daphne's ``send`` never waits: it hands the frame to Twisted,
+which buffers it in the transport without limit. Under Daphne the queue is
+therefore always empty by the time the next frame arrives, so the policies
+and the depth limit never apply and a slow client's backlog grows in
+Twisted's buffer instead. Bounding slow clients needs a server whose
+``send`` applies backpressure.
+
+The queue is therefore opt-in: set ``ROOM_OUTBOUND_QUEUE = True`` when
+serving with such a server. Otherwise sockets get a ``DirectOutbound``,
+which writes each frame as it comes without a drain task per frame.
+"""
+import asyncio
+import logging
+import weakref
+from collections import deque
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_CLOSE_CODE = 4004
+
+# Every open queue in this process, for metrics
+live_queues = weakref.WeakSet()
+
+# Frames discarded by any queue since the process started; unlike the
+# per-queue stats these don't go down when a socket closes
+discarded = {'coalesced': 0, 'dropped': 0}
+
+
+class OutboundQueue:
+    def __init__(self, send, on_overflow, max_depth=500, policies=None):
+        # Coroutine functions: send(data) writes one frame to the socket,
+        # on_overflow() gets rid of a slow consumer
+        self._send = send
+        self._on_overflow = on_overflow
+        self.max_depth = max_depth
+        self.policies = policies or {}
+        self.frames = deque()
+        self.writing = False
+        self.closed = False
+        self.peak_depth = 0
+        self.stats = {'sent': 0, 'coalesced': 0, 'dropped': 0}
+        self._task = None
+        live_queues.add(self)
+
+    @property
+    def depth(self):
+        return len(self.frames)
+
+    async def put(self, frame_type, data):
+        """Queue one encoded frame for the socket"""
+        if self.closed:
+            return
+        if self.frames:
+            # Backlogged: apply the frame type's policy
+            policy = self.policies.get(frame_type)
+            if policy == 'drop':
+                self.stats['dropped'] += 1
+                discarded['dropped'] += 1
+                return
+            if policy == 'latest':
+                before = len(self.frames)
+                self.frames = deque(entry for entry in self.frames if entry[0] != frame_type)
+                self.stats['coalesced'] += before - len(self.frames)
+                discarded['coalesced'] += before - len(self.frames)
+
+        self.frames.append((frame_type, data))
+        if len(self.frames) > self.peak_depth:
+            self.peak_depth = len(self.frames)
+
+        if len(self.frames) > self.max_depth:
+            self.close()
+            await self._on_overflow()
+            return
+
+        if not self.writing:
+            self.writing = True
+            self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self):
+        try:
+            while self.frames and not self.closed:
+                _, data = self.frames.popleft()
+                await self._send(data)
+                self.stats['sent'] += 1
+        except Exception as e:
+            logger.error(f"Failed to write to WebSocket: {e}")
+        finally:
+            self.writing = False
+
+    def close(self):
+        """Discard the backlog and refuse further frames"""
+        self.closed = True
+        self.frames.clear()
+        live_queues.discard(self)
+
+
+class DirectOutbound:
+    """Pass-through with the ``OutboundQueue`` interface, for servers whose send never waits"""
+
+    depth = 0
+
+    def __init__(self, send):
+        self._send = send
+        self.closed = False
+
+    async def put(self, frame_type, data):
+        if self.closed:
+            return
+        try:
+            await self._send(data)
+        except Exception as e:
+            logger.error(f"Failed to write to WebSocket: {e}")
+
+    def close(self):
+        self.closed = True
+
+
+def outbound_queue_for(send, on_overflow):
+    """Build the socket's outbound path: an ``OutboundQueue`` if enabled in settings"""
+    if not getattr(settings, 'ROOM_OUTBOUND_QUEUE', False):
+        return DirectOutbound(send)
+    return OutboundQueue(
+        send,
+        on_overflow,
+        max_depth=getattr(settings, 'ROOM_OUTBOUND_MAX_DEPTH', 500),
+        policies=getattr(settings, 'ROOM_OUTBOUND_POLICIES', {'video_control': 'latest', 'ping': 'drop'}),
+    )
+
+
+def outbound_stats():
+    """Summarize the outbound queues open in this process"""
+    queues = list(live_queues)
+    depths = [queue.depth for queue in queues]
+    return {
+        'connections': len(queues),
+        'queued_frames': sum(depths),
+        'max_depth': max(depths, default=0),
+        'peak_depth': max((queue.peak_depth for queue in queues), default=0),
+        'sent': sum(queue.stats['sent'] for queue in queues),
+        'coalesced': sum(queue.stats['coalesced'] for queue in queues),
+        'dropped': sum(queue.stats['dropped'] for queue in queues),
+    }
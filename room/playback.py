@@ -0,0 +1,269 @@
+"""
+Server-authoritative playback state with write-behind persistence.
+
+Every ``video_control`` and ``share_video`` event updates the in-memory
+``PlaybackState`` of its room, which is what late joiners are sent. Changes
+are written back to ``Room`` by a background flusher at most once per room
+per ``ROOM_PLAYBACK_FLUSH_INTERVAL`` seconds, however many events arrived in
+between. A room's state is also flushed when its last local socket leaves.
+
+URLs and qualities come from client frames, so they are checked against
+``Room``'s fields before they are applied. Each room's row is written on
+its own, so one that fails is retried without holding up the rest.
+
+The process that received an event owns the write. Other workers only
+mirror the state from the broadcast so their late joiners see it too. Each
+flush invalidates the flushed rooms' cached ``RoomDetails``.
+"""
+import asyncio
+import logging
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+
+from .models import Room
+from .room_cache import invalidate_rooms
+
+
+logger = logging.getLogger(__name__)
+
+VIDEO_URL_MAX_LENGTH = Room._meta.get_field('video_url').max_length
+VIDEO_QUALITY_MAX_LENGTH = Room._meta.get_field('video_quality').max_length
+
+_validate_url = URLValidator()
+
+
+def clean_video_url(value):
+    """Return ``value`` if it is a URL that fits ``Room.video_url``, else None"""
+    if not isinstance(value, str) or len(value) > VIDEO_URL_MAX_LENGTH:
+        return None
+    try:
+        _validate_url(value)
+    except ValidationError:
+        return None
+    return value
+
+
+def clean_video_quality(value):
+    """Return ``value`` clipped to fit ``Room.video_quality``, or None if it isn't a string"""
+    if not isinstance(value, str):
+        return None
+    return value[:VIDEO_QUALITY_MAX_LENGTH]
+
+
+class PlaybackState:
+    def __init__(self, video_url=None, current_video_time=0.0, is_playing=False, video_quality=None,
+                 updated_at=0.0, host_username=None, room_pk=None, audience_mode=False, speakers=()):
+        self.video_url = video_url
+        self.current_video_time = current_video_time
+        self.is_playing = is_playing
+        self.video_quality = video_quality
+        # Wall-clock time of the last change, used to order updates across
+        # workers and to extrapolate the position of a playing video
+        self.updated_at = updated_at
+        # Loaded with the room and never written back
+        self.host_username = host_username
+        self.room_pk = room_pk
+        self.audience_mode = audience_mode
+        # Kept current by role_update broadcasts
+        self.speakers = set(speakers)
+
+    def position(self, now=None):
+        """Playback position in seconds, advanced to ``now`` while playing"""
+        if not self.is_playing or not self.updated_at:
+            return self.current_video_time
+        now = time.time() if now is None else now
+        return self.current_video_time + max(0.0, now - self.updated_at)
+
+    def as_dict(self):
+        return {
+            'video_url': self.video_url,
+            'current_video_time': self.position(),
+            'is_playing': self.is_playing,
+            'video_quality': self.video_quality,
+            'updated_at': self.updated_at,
+        }
+
+
+class PlaybackStore:
+    def __init__(self, flush_interval=5.0):
+        self.flush_interval = flush_interval
+        self.states = {}
+        self.refs = {}
+        self.dirty = set()
+        self._task = None
+
+    async def acquire(self, room_id):
+        """Load ``room_id``'s state for a newly connected socket and return it"""
+        self.refs[room_id] = self.refs.get(room_id, 0) + 1
+        if room_id not in self.states:
+            loaded = await self._load(room_id)
+            self.states.setdefault(room_id, loaded)
+        return self.states[room_id]
+
+    async def release(self, room_id):
+        """Drop a socket's hold on ``room_id``, flushing and evicting the last one"""
+        remaining = self.refs.get(room_id, 0) - 1
+        if remaining > 0:
+            self.refs[room_id] = remaining
+            return
+        self.refs.pop(room_id, None)
+        if room_id in self.dirty:
+            try:
+                await self.flush([room_id])
+            except Exception as e:
+                logger.error(f"Playback state flush failed for room {room_id}: {e}")
+        # A socket may have acquired the room while the flush was awaited
+        if not self.refs.get(room_id):
+            self.states.pop(room_id, None)
+
+    def apply_control(self, room_id, action, timestamp, video_url=None, video_quality=None, at=None):
+        """Apply a ``video_control`` event issued at ``at`` and return the new state,
+        or None if ``room_id`` is not loaded
+        """
+        state = self._loaded(room_id)
+        if state is None:
+            return None
+        if action == 'play':
+            state.is_playing = True
+        elif action == 'pause':
+            state.is_playing = False
+        try:
+            current_video_time = float(timestamp)
+        except (TypeError, ValueError):
+            current_video_time = math.nan
+        state.current_video_time = current_video_time if math.isfinite(current_video_time) else state.position()
+        # Invalid values are ignored; the rest of the control still applies
+        video_url = clean_video_url(video_url)
+        if video_url:
+            state.video_url = video_url
+        video_quality = clean_video_quality(video_quality)
+        if video_quality:
+            state.video_quality = video_quality
+        return self._touch(room_id, state, at)
+
+    def apply_share(self, room_id, video_url):
+        """Apply a ``share_video`` event and return the new state, or None if ``room_id`` is not loaded.
+
+        An empty or invalid ``video_url`` clears the room's video.
+        """
+        state = self._loaded(room_id)
+        if state is None:
+            return None
+        state.video_url = clean_video_url(video_url)
+        state.current_video_time = 0.0
+        state.is_playing = False
+        return self._touch(room_id, state)
+
+    def sync(self, room_id, data):
+        """Mirror a state change made by another worker, if it is newer"""
+        state = self.states.get(room_id)
+        if state is None or data['updated_at'] <= state.updated_at:
+            return
+        state.video_url = data['video_url']
+        state.current_video_time = data['current_video_time']
+        state.is_playing = data['is_playing']
+        state.video_quality = data['video_quality']
+        state.updated_at = data['updated_at']
+
+    def set_role(self, room_id, username, is_speaker):
+        """Mirror a speaker being added to or removed from ``room_id``"""
+        state = self.states.get(room_id)
+        if state is None:
+            return
+        if is_speaker:
+            state.speakers.add(username)
+        else:
+            state.speakers.discard(username)
+
+    def _loaded(self, room_id):
+        state = self.states.get(room_id)
+        if state is None:
+            # E.g. a trailing seek forwarded after the room's last socket left.
+            # A blank state would be flushed over the room's row.
+            logger.warning(f"Ignoring playback event for room {room_id}, which is not loaded")
+        return state
+
+    def _touch(self, room_id, state, at=None):
+        state.updated_at = time.time() if at is None else at
+        self.dirty.add(room_id)
+        self._ensure_flusher()
+        return state
+
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self.dirty:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Playback state flush failed: {e}")
+        self._task = None
+
+    async def flush(self, room_ids=None):
+        """Write the dirty states of ``room_ids`` (default: all) in one batch"""
+        room_ids = set(self.dirty) if room_ids is None else self.dirty.intersection(room_ids)
+        rows = {room_id: self.states[room_id].as_dict() for room_id in room_ids if room_id in self.states}
+        self.dirty.difference_update(room_ids)
+        if not rows:
+            return
+        try:
+            failed = await self._save(rows)
+        except Exception:
+            # Keep the rows queued for the next attempt
+            self.dirty.update(rows)
+            raise
+        self.dirty.update(failed)
+
+    @sync_to_async
+    def _load(self, room_id):
+        row = Room.objects.filter(room_id=room_id).values(
+            'id', 'video_url', 'current_video_time', 'is_playing', 'video_quality', 'host_user__username',
+            'audience_mode',
+        ).first()
+        if row is None:
+            return PlaybackState()
+        row['room_pk'] = row.pop('id')
+        row['host_username'] = row.pop('host_user__username')
+        if row['audience_mode']:
+            row['speakers'] = Room.speakers.through.objects.filter(room_id=row['room_pk']).values_list(
+                'user__username', flat=True
+            )
+        return PlaybackState(**row)
+
+    @sync_to_async
+    def _save(self, rows):
+        """Write each room's row on its own; returns the room ids that failed"""
+        failed = set()
+        for room_id, data in rows.items():
+            try:
+                Room.objects.filter(room_id=room_id).update(
+                    video_url=data['video_url'],
+                    current_video_time=data['current_video_time'],
+                    is_playing=data['is_playing'],
+                    video_quality=data['video_quality'],
+                )
+            except Exception as e:
+                logger.error(f"Playback state flush failed for room {room_id}: {e}")
+                failed.add(room_id)
+        invalidate_rooms([room_id for room_id in rows if room_id not in failed])
+        return failed
+
+
+_store = None
+
+
+def get_playback_store():
+    """Return the process-wide playback store configured in settings"""
+    global _store
+    if _store is None:
+        _store = PlaybackStore(flush_interval=getattr(settings, 'ROOM_PLAYBACK_FLUSH_INTERVAL', 5.0))
+    return _store
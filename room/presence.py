@@ -0,0 +1,328 @@
+"""
+Room presence registry.
+
+Tracks which users are connected to which room, and the channel name of
+each user's socket so signaling can be addressed to it directly. Entries
+carry an expiry that consumers refresh on every heartbeat, so sockets whose
+worker died without running ``disconnect`` age out on their own.
+
+Every change to a room's membership bumps a per-room version. Consumers
+broadcast joins and leaves as deltas stamped with that version; a client that
+sees a gap asks for a fresh snapshot. Pruning expired members also bumps the
+version without a delta, which surfaces to clients as exactly such a gap.
+
+Rooms too big to send around in full are read with ``count`` and ``page``
+instead of ``snapshot``, so no single read costs more than a page.
+
+A resumed session takes over its predecessor's entry with ``rebind``, which
+changes the channel but not the membership, so other members hear nothing.
+
+The backend is chosen by ``settings.ROOM_PRESENCE``, laid out like
+``CHANNEL_LAYERS``::
+
+    ROOM_PRESENCE = {
+        'BACKEND': 'room.presence.RedisPresenceRegistry',
+        'CONFIG': {'url': 'redis://127.0.0.1:6379/0', 'ttl': 180},
+    }
+
+``LocalPresenceRegistry`` keeps everything in process memory and is the fast
+path for single-process deployments; ``RedisPresenceRegistry`` is shared by
+every worker pointed at the same Redis.
+"""
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+DEFAULT_PRESENCE_TTL = 180
+
+
+class BasePresenceRegistry:
+    """Interface shared by all presence backends"""
+
+    def __init__(self, ttl=DEFAULT_PRESENCE_TTL):
+        self.ttl = ttl
+
+    async def join(self, room, username, channel_name):
+        """Register ``username`` in ``room`` as reachable on ``channel_name``.
+
+        Returns the room's new presence version.
+        """
+        raise NotImplementedError
+
+    async def leave(self, room, username, channel_name):
+        """Remove ``username`` if it is still bound to ``channel_name``.
+
+        Returns the room's new presence version, or None if nothing was removed.
+        """
+        raise NotImplementedError
+
+    async def touch(self, room, username, channel_name, ttl=None):
+        """Push back the expiry of a live entry to ``ttl`` (default ``self.ttl``) seconds from now"""
+        raise NotImplementedError
+
+    async def rebind(self, room, username, old_channel, new_channel):
+        """Move a live entry from ``old_channel`` to ``new_channel``.
+
+        Membership is unchanged, so the version is not bumped. Returns the
+        room's version, or None if ``username`` is no longer bound to
+        ``old_channel``.
+        """
+        raise NotImplementedError
+
+    async def members(self, room):
+        """Return ``{username: channel_name}`` for every live member of ``room``"""
+        members, _ = await self.snapshot(room)
+        return members
+
+    async def snapshot(self, room):
+        """Return ``(members, version)`` read together"""
+        raise NotImplementedError
+
+    async def channel_for(self, room, username):
+        """Return the channel name of ``username`` in ``room``, or None"""
+        raise NotImplementedError
+
+    async def count(self, room):
+        """Return how many live members ``room`` has"""
+        raise NotImplementedError
+
+    async def page(self, room, cursor=0, limit=50):
+        """Return ``(usernames, next_cursor)`` for about ``limit`` members of ``room``.
+
+        Start from cursor 0 and pass back each ``next_cursor`` until it is
+        None. Members joining or leaving meanwhile may be missed or repeated.
+        """
+        raise NotImplementedError
+
+
+class LocalPresenceRegistry(BasePresenceRegistry):
+    """In-process registry for deployments that run a single worker"""
+
+    def __init__(self, ttl=DEFAULT_PRESENCE_TTL):
+        super().__init__(ttl=ttl)
+        # room -> {username: (channel_name, expires_at)}
+        self.rooms = {}
+        # room -> presence version
+        self.versions = {}
+
+    def _bump(self, room):
+        version = self.versions.get(room, 0) + 1
+        self.versions[room] = version
+        return version
+
+    def _drop_if_empty(self, room):
+        if not self.rooms.get(room):
+            self.rooms.pop(room, None)
+            self.versions.pop(room, None)
+
+    async def join(self, room, username, channel_name):
+        self.rooms.setdefault(room, {})[username] = (channel_name, time.monotonic() + self.ttl)
+        return self._bump(room)
+
+    async def leave(self, room, username, channel_name):
+        room_users = self.rooms.get(room)
+        if not room_users:
+            return None
+        entry = room_users.get(username)
+        if entry is None or entry[0] != channel_name:
+            return None
+        del room_users[username]
+        version = self._bump(room)
+        self._drop_if_empty(room)
+        return version
+
+    async def touch(self, room, username, channel_name, ttl=None):
+        room_users = self.rooms.get(room)
+        if room_users and username in room_users and room_users[username][0] == channel_name:
+            room_users[username] = (channel_name, time.monotonic() + (ttl or self.ttl))
+
+    async def rebind(self, room, username, old_channel, new_channel):
+        entry = self.rooms.get(room, {}).get(username)
+        if entry is None or entry[0] != old_channel or entry[1] <= time.monotonic():
+            return None
+        self.rooms[room][username] = (new_channel, time.monotonic() + self.ttl)
+        return self.versions[room]
+
+    async def snapshot(self, room):
+        room_users = self.rooms.get(room)
+        if not room_users:
+            return {}, self.versions.get(room, 0)
+        now = time.monotonic()
+        expired = [username for username, (_, expires_at) in room_users.items() if expires_at <= now]
+        if expired:
+            for username in expired:
+                del room_users[username]
+            version = self._bump(room)
+            self._drop_if_empty(room)
+        else:
+            version = self.versions[room]
+        members = {username: channel_name for username, (channel_name, _) in room_users.items()}
+        return members, version
+
+    async def channel_for(self, room, username):
+        entry = self.rooms.get(room, {}).get(username)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    async def count(self, room):
+        now = time.monotonic()
+        return sum(1 for _, expires_at in self.rooms.get(room, {}).values() if expires_at > now)
+
+    async def page(self, room, cursor=0, limit=50):
+        room_users = self.rooms.get(room, {})
+        now = time.monotonic()
+        # Dicts keep insertion order, so an offset is a stable enough cursor
+        usernames = list(room_users)[cursor:cursor + limit]
+        next_cursor = cursor + limit if cursor + limit < len(room_users) else None
+        return [username for username in usernames if room_users[username][1] > now], next_cursor
+
+
+class RedisPresenceRegistry(BasePresenceRegistry):
+    """Registry shared across processes through Redis.
+
+    Each room is a hash of ``username -> channel_name``, a sorted set of
+    ``username -> expires_at`` and a version counter. Join, leave and lookups
+    touch a single field; expired members are pruned lazily whenever the
+    member list is read.
+    """
+
+    JOIN_SCRIPT = """
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+    local version = redis.call('INCR', KEYS[3])
+    for i = 1, 3 do
+        redis.call('EXPIRE', KEYS[i], ARGV[4])
+    end
+    return version
+    """
+
+    LEAVE_SCRIPT = """
+    if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+        redis.call('HDEL', KEYS[1], ARGV[1])
+        redis.call('ZREM', KEYS[2], ARGV[1])
+        return redis.call('INCR', KEYS[3])
+    end
+    return false
+    """
+
+    TOUCH_SCRIPT = """
+    if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+        redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+        for i = 1, 3 do
+            redis.call('EXPIRE', KEYS[i], ARGV[4])
+        end
+        return 1
+    end
+    return 0
+    """
+
+    REBIND_SCRIPT = """
+    local expires_at = tonumber(redis.call('ZSCORE', KEYS[2], ARGV[1]) or '0')
+    if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] and expires_at > tonumber(ARGV[4]) then
+        redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+        redis.call('ZADD', KEYS[2], ARGV[5], ARGV[1])
+        return tonumber(redis.call('GET', KEYS[3]) or '0')
+    end
+    return false
+    """
+
+    MEMBERS_SCRIPT = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+    for i = 1, #expired do
+        redis.call('HDEL', KEYS[1], expired[i])
+    end
+    if #expired > 0 then
+        redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+        redis.call('INCR', KEYS[3])
+    end
+    local version = tonumber(redis.call('GET', KEYS[3]) or '0')
+    return {version, redis.call('HGETALL', KEYS[1])}
+    """
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', ttl=DEFAULT_PRESENCE_TTL, prefix='presence'):
+        super().__init__(ttl=ttl)
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Imported lazily so single-process deployments don't need redis
+            import redis.asyncio as redis
+
+            self._client = redis.Redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    def _keys(self, room):
+        return f'{self.prefix}:{room}', f'{self.prefix}:{room}:expiry', f'{self.prefix}:{room}:version'
+
+    async def join(self, room, username, channel_name):
+        # The room keys outlive any single member, but not an abandoned room
+        return await self.client.eval(
+            self.JOIN_SCRIPT, 3, *self._keys(room),
+            username, channel_name, time.time() + self.ttl, self.ttl * 2,
+        )
+
+    async def leave(self, room, username, channel_name):
+        return await self.client.eval(self.LEAVE_SCRIPT, 3, *self._keys(room), username, channel_name)
+
+    async def touch(self, room, username, channel_name, ttl=None):
+        await self.client.eval(
+            self.TOUCH_SCRIPT, 3, *self._keys(room),
+            username, channel_name, time.time() + (ttl or self.ttl), self.ttl * 2,
+        )
+
+    async def rebind(self, room, username, old_channel, new_channel):
+        now = time.time()
+        return await self.client.eval(
+            self.REBIND_SCRIPT, 3, *self._keys(room),
+            username, old_channel, new_channel, now, now + self.ttl,
+        )
+
+    async def snapshot(self, room):
+        version, flat = await self.client.eval(self.MEMBERS_SCRIPT, 3, *self._keys(room), time.time())
+        return dict(zip(flat[::2], flat[1::2])), version
+
+    async def channel_for(self, room, username):
+        members_key, expiry_key, _ = self._keys(room)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hget(members_key, username)
+            pipe.zscore(expiry_key, username)
+            channel_name, expires_at = await pipe.execute()
+        if channel_name is None or expires_at is None or expires_at <= time.time():
+            return None
+        return channel_name
+
+    async def count(self, room):
+        _, expiry_key, _ = self._keys(room)
+        return await self.client.zcount(expiry_key, f'({time.time()}', '+inf')
+
+    async def page(self, room, cursor=0, limit=50):
+        members_key, expiry_key, _ = self._keys(room)
+        cursor, members = await self.client.hscan(members_key, cursor, count=limit)
+        usernames = list(members)
+        if usernames:
+            now = time.time()
+            expiries = await self.client.zmscore(expiry_key, usernames)
+            usernames = [
+                username for username, expires_at in zip(usernames, expiries)
+                if expires_at is not None and expires_at > now
+            ]
+        return usernames, cursor or None
+
+
+_registry = None
+
+
+def get_presence_registry():
+    """Return the process-wide presence registry configured in settings"""
+    global _registry
+    if _registry is None:
+        config = getattr(settings, 'ROOM_PRESENCE', {})
+        backend = import_string(config.get('BACKEND', 'room.presence.LocalPresenceRegistry'))
+        _registry = backend(**config.get('CONFIG', {}))
+    return _registry
@@ -0,0 +1,193 @@
+"""
+Token-bucket limits on the frames clients send.
+
+``ROOM_RATE_LIMITS`` maps a message type to a ``(rate, burst)`` bucket for
+each connection and, optionally, one for each room::
+
+    ROOM_RATE_LIMITS = {
+        'chat': {'connection': (2, 5), 'room': (20, 50)},
+    }
+
+A bucket holds up to ``burst`` tokens and regains ``rate`` per second; every
+frame of the type takes one. Types that are not listed are never limited.
+
+A frame that finds its bucket empty is dropped, or, with
+``ROOM_RATE_LIMIT_ACTION = 'refuse'``, answered with a ``rate_limited`` error
+that says which limit it hit and when to retry. A connection that keeps
+running over its own limits is closed with 4006. Every time it goes over, it
+uses up one of ``ROOM_RATE_LIMIT_CLOSE_AFTER`` strikes, and it gets one
+strike back per second. A room running over its limit is not the fault of
+any one connection and costs no strikes.
+
+Connection buckets live on the consumer. Room buckets live in the backend
+chosen by ``ROOM_RATE_LIMITER``, laid out like ``ROOM_PRESENCE``:
+
+- ``LocalRateLimiter`` keeps them in process memory, so each worker allows
+  a room the full rate.
+- ``RedisRateLimiter`` keeps one hash per bucket, shared by every worker,
+  and updates it in a single script call.
+"""
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+# Close code for a socket that kept sending over its rate limits
+RATE_LIMITED_CLOSE_CODE = 4006
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def take(self, cost=1):
+        """Take ``cost`` tokens; 0 if there were enough, else seconds until there will be"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+
+class BaseRateLimiter:
+    """Interface shared by all room bucket backends"""
+
+    async def take(self, key, rate, burst, cost=1):
+        """Take ``cost`` tokens from bucket ``key``; 0 if allowed, else seconds to wait"""
+        raise NotImplementedError
+
+
+class LocalRateLimiter(BaseRateLimiter):
+    """In-process buckets, evicted least-recently-used past ``max_keys``"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+
+    async def take(self, key, rate, burst, cost=1):
+        bucket = self.buckets.get(key)
+        if bucket is None or bucket.rate != rate or bucket.burst != burst:
+            bucket = self.buckets[key] = TokenBucket(rate, burst)
+            # An evicted bucket comes back full, which is never stricter
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        self.buckets.move_to_end(key)
+        return bucket.take(cost)
+
+
+class RedisRateLimiter(BaseRateLimiter):
+    """Buckets shared across processes through Redis.
+
+    Each bucket is a hash of its tokens and the time they were counted,
+    refilled and taken from atomically, and left to expire once it would
+    be full again anyway.
+    """
+
+    TAKE_SCRIPT = """
+    local rate, burst, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(state[1]) or burst
+    local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+    tokens = math.min(burst, tokens + elapsed * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+    return tostring(wait)
+    """
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', prefix='ratelimit'):
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Imported lazily so single-process deployments don't need redis
+            import redis.asyncio as redis
+
+            self._client = redis.Redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    async def take(self, key, rate, burst, cost=1):
+        # Script results are truncated to integers unless sent as strings
+        wait = await self.client.eval(self.TAKE_SCRIPT, 1, f'{self.prefix}:{key}', rate, burst, time.time(), cost)
+        return float(wait)
+
+
+class ConnectionLimits:
+    """The rate limits one connection is held to"""
+
+    def __init__(self, limits, limiter, action='drop', close_after=20):
+        self.limits = limits
+        self.limiter = limiter
+        self.action = action
+        # message type -> this connection's TokenBucket, made on first use
+        self.buckets = {}
+        self.strikes = TokenBucket(1, close_after) if close_after else None
+        # Set once the connection ran out of strikes and is being closed
+        self.closed = False
+
+    def __contains__(self, message_type):
+        return message_type in self.limits
+
+    async def check(self, room, message_type):
+        """Return None if a ``message_type`` frame may go through, else ``(scope, retry_after)``"""
+        limit = self.limits.get(message_type)
+        if limit is None:
+            return None
+        if limit.get('connection'):
+            bucket = self.buckets.get(message_type)
+            if bucket is None:
+                bucket = self.buckets[message_type] = TokenBucket(*limit['connection'])
+            retry_after = bucket.take()
+            if retry_after:
+                return 'connection', retry_after
+        if limit.get('room'):
+            retry_after = await self.limiter.take(f'{room}:{message_type}', *limit['room'])
+            if retry_after:
+                return 'room', retry_after
+        return None
+
+    def strike(self):
+        """Count one frame over this connection's limits; True once it should be closed"""
+        if self.strikes is not None and self.strikes.take() > 0:
+            self.closed = True
+        return self.closed
+
+
+_limiter = None
+
+
+def get_rate_limiter():
+    """Return the process-wide room bucket backend configured in settings"""
+    global _limiter
+    if _limiter is None:
+        config = getattr(settings, 'ROOM_RATE_LIMITER', {})
+        backend = import_string(config.get('BACKEND', 'room.ratelimit.LocalRateLimiter'))
+        _limiter = backend(**config.get('CONFIG', {}))
+    return _limiter
+
+
+def connection_limits():
+    """Return a fresh ``ConnectionLimits`` for a new socket, as configured in settings"""
+    return ConnectionLimits(
+        getattr(settings, 'ROOM_RATE_LIMITS', {}),
+        get_rate_limiter(),
+        action=getattr(settings, 'ROOM_RATE_LIMIT_ACTION', 'drop'),
+        close_after=getattr(settings, 'ROOM_RATE_LIMIT_CLOSE_AFTER', 20),
+    )
@@ -0,0 +1,188 @@
+"""
+Per-room sequence numbers and replay buffers for resumable sessions.
+
+Every room broadcast is stamped with the room's next sequence number and kept
+in a ring buffer of the last ``size`` frames, so a client that reconnects can
+be sent exactly the frames it missed. Each buffer also has an ``epoch``, a
+random id minted when the room's sequence starts; a client whose epoch no
+longer matches (the buffer expired, or the process holding it restarted)
+cannot be caught up by replay and gets a full resync instead.
+
+The backend is chosen by ``settings.ROOM_REPLAY``, laid out like
+``ROOM_CHAT_HISTORY``:
+
+- ``LocalReplayBuffer`` keeps buffers in process memory, evicting rooms
+  least-recently-used past ``max_rooms`` and after ``ttl`` idle seconds. Only
+  a single-process deployment can resume across sockets with it.
+- ``RedisReplayBuffer`` keeps a counter, an epoch and a capped list per room,
+  shared by every worker. Stamping a broadcast costs one round trip.
+"""
+import json
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseReplayBuffer:
+    def __init__(self, size=200, ttl=600):
+        self.size = size
+        self.ttl = ttl
+
+    async def append(self, room, frame):
+        """Stamp ``frame`` with ``room``'s next sequence number and buffer it.
+
+        Returns the stamped copy and the epoch its sequence number belongs to.
+        """
+        raise NotImplementedError
+
+    async def position(self, room):
+        """Return ``(seq, epoch)``: the last sequence number issued in ``room``"""
+        raise NotImplementedError
+
+    async def since(self, room, seq, epoch):
+        """Return the frames after ``seq``, oldest first.
+
+        Returns None when they can't all be replayed: the epoch changed, or
+        frames after ``seq`` have already left the buffer.
+        """
+        raise NotImplementedError
+
+
+def _gap(frames, seq, last):
+    """The frames after ``seq`` out of a buffer ending at ``last``, or None"""
+    if seq > last:
+        return None
+    missed = [frame for frame in frames if frame['seq'] > seq]
+    if len(missed) != last - seq:
+        return None
+    return missed
+
+
+class LocalReplayBuffer(BaseReplayBuffer):
+    def __init__(self, size=200, ttl=600, max_rooms=1000):
+        super().__init__(size=size, ttl=ttl)
+        self.max_rooms = max_rooms
+        # room -> [seq, epoch, deque of frames, last_used], least recently used first
+        self.rooms = OrderedDict()
+
+    def _room(self, room):
+        entry = self.rooms.get(room)
+        now = time.monotonic()
+        if entry is None or entry[3] <= now - self.ttl:
+            entry = [0, uuid.uuid4().hex[:12], deque(maxlen=self.size), now]
+            self.rooms[room] = entry
+        entry[3] = now
+        self.rooms.move_to_end(room)
+        self._evict(now)
+        return entry
+
+    def _evict(self, now):
+        cutoff = now - self.ttl
+        while len(self.rooms) > 1:
+            oldest = next(iter(self.rooms))
+            if len(self.rooms) <= self.max_rooms and self.rooms[oldest][3] > cutoff:
+                break
+            del self.rooms[oldest]
+
+    async def append(self, room, frame):
+        entry = self._room(room)
+        entry[0] += 1
+        frame = {**frame, 'seq': entry[0]}
+        entry[2].append(frame)
+        return frame, entry[1]
+
+    async def position(self, room):
+        entry = self._room(room)
+        return entry[0], entry[1]
+
+    async def since(self, room, seq, epoch):
+        entry = self._room(room)
+        if entry[1] != epoch:
+            return None
+        return _gap(entry[2], seq, entry[0])
+
+
+class RedisReplayBuffer(BaseReplayBuffer):
+    # A room's counter and epoch are (re)created together, so a counter that
+    # expired never comes back under the old epoch
+    POSITION = """
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        redis.call('SET', KEYS[1], 0)
+        redis.call('SET', KEYS[2], ARGV[1])
+        redis.call('DEL', KEYS[3])
+    end
+    """
+
+    APPEND_SCRIPT = POSITION + """
+    local seq = redis.call('INCR', KEYS[1])
+    redis.call('RPUSH', KEYS[3], '{"seq":' .. seq .. ',' .. string.sub(ARGV[2], 2))
+    redis.call('LTRIM', KEYS[3], -tonumber(ARGV[3]), -1)
+    for i = 1, 3 do
+        redis.call('EXPIRE', KEYS[i], ARGV[4])
+    end
+    return {seq, redis.call('GET', KEYS[2])}
+    """
+
+    POSITION_SCRIPT = POSITION + """
+    for i = 1, 2 do
+        redis.call('EXPIRE', KEYS[i], ARGV[2])
+    end
+    return {tonumber(redis.call('GET', KEYS[1])), redis.call('GET', KEYS[2])}
+    """
+
+    SINCE_SCRIPT = """
+    return {tonumber(redis.call('GET', KEYS[1]) or '0'), redis.call('GET', KEYS[2]), redis.call('LRANGE', KEYS[3], 0, -1)}
+    """
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', size=200, ttl=600, prefix='replay'):
+        super().__init__(size=size, ttl=ttl)
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis.asyncio as redis
+
+            self._client = redis.Redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    def _keys(self, room):
+        return f'{self.prefix}:{room}:seq', f'{self.prefix}:{room}:epoch', f'{self.prefix}:{room}'
+
+    async def append(self, room, frame):
+        # The script splices the sequence number into the frame's JSON object
+        seq, epoch = await self.client.eval(
+            self.APPEND_SCRIPT, 3, *self._keys(room),
+            uuid.uuid4().hex[:12], json.dumps(frame), self.size, self.ttl,
+        )
+        return {**frame, 'seq': seq}, epoch
+
+    async def position(self, room):
+        seq, epoch = await self.client.eval(
+            self.POSITION_SCRIPT, 3, *self._keys(room), uuid.uuid4().hex[:12], self.ttl,
+        )
+        return seq, epoch
+
+    async def since(self, room, seq, epoch):
+        last, current_epoch, frames = await self.client.eval(self.SINCE_SCRIPT, 3, *self._keys(room))
+        if current_epoch != epoch:
+            return None
+        return _gap([json.loads(frame) for frame in frames], seq, last)
+
+
+_buffer = None
+
+
+def get_replay_buffer():
+    """Return the process-wide replay buffer configured in settings"""
+    global _buffer
+    if _buffer is None:
+        config = getattr(settings, 'ROOM_REPLAY', {})
+        backend = import_string(config.get('BACKEND', 'room.replay.LocalReplayBuffer'))
+        _buffer = backend(**config.get('CONFIG', {}))
+    return _buffer
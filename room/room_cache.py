@@ -0,0 +1,62 @@
+"""
+Read-through cache of serialized room details.
+
+``RoomDetails`` serves rooms from Django's cache (the ``ROOM_DETAILS_CACHE``
+alias) together with an ETag of the serialized body, so a poll for an
+unchanged room costs neither a query nor a serialization, and a poll that
+sends the ETag back in ``If-None-Match`` gets an empty 304.
+
+Anything that writes a room's row must call ``invalidate_rooms``:
+``SetVideoURL`` does, and so does the playback store after each flush of
+realtime state. With the default per-process cache, other workers only see
+those invalidations once their entry expires after ``ROOM_DETAILS_CACHE_TTL``
+seconds; point the alias at a shared cache (e.g. Redis) to make them
+immediate everywhere.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Room
+from .serializers import RoomSerializer
+
+
+def _cache():
+    return caches[getattr(settings, 'ROOM_DETAILS_CACHE', 'default')]
+
+
+def _key(room_id):
+    return f'room_details:{room_id}'
+
+
+def _entry(room):
+    data = RoomSerializer(room).data
+    digest = hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+    return dict(data), f'"{digest}"'
+
+
+async def aget_room_details(room_id):
+    """Return ``(data, etag)`` for ``room_id``, or None if there is no such room"""
+    cache = _cache()
+    entry = await cache.aget(_key(room_id))
+    if entry is not None:
+        return entry
+
+    room = await Room.objects.filter(room_id=room_id).afirst()
+    if room is None:
+        return None
+    entry = _entry(room)
+    await cache.aset(_key(room_id), entry, getattr(settings, 'ROOM_DETAILS_CACHE_TTL', 30))
+    return entry
+
+
+def invalidate_rooms(room_ids):
+    """Drop cached details after the rows of ``room_ids`` changed"""
+    _cache().delete_many([_key(room_id) for room_id in room_ids])
+
+
+async def ainvalidate_rooms(room_ids):
+    """``invalidate_rooms`` for async callers"""
+    await _cache().adelete_many([_key(room_id) for room_id in room_ids])
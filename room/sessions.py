@@ -0,0 +1,102 @@
+"""
+Resumable WebSocket sessions.
+
+A socket that drops without saying goodbye (any close code but 1000) does
+not leave its room at once. Its presence entry is held for
+``ROOM_RESUME_GRACE`` seconds. Every session is given a ``resume_token``; a
+client that reconnects inside that window with
+``?resume=<token>&last_seq=<n>`` takes the entry over and is sent only the
+broadcasts after ``n`` from the room's replay buffer, so nobody else in the
+room sees it leave or join. Sessions that don't come back are announced as
+left when the window closes.
+
+``drain`` ends every session on this worker ahead of a shutdown. Each socket
+gets a ``reconnect`` frame with its resume token and a ``retry_after``
+spread at random over ``ROOM_DRAIN_SPREAD`` seconds, so the clients of a
+restarting worker come back staggered instead of all at once, and is closed
+with 1012 (service restart). ``lifespan`` runs it when the server shuts the
+application down.
+"""
+import asyncio
+import logging
+import random
+import weakref
+
+from django.conf import settings
+from django.core import signing
+
+
+logger = logging.getLogger(__name__)
+
+RESUME_SALT = 'room.sessions.resume'
+
+# Close code for a client that said goodbye: its seat is given up at once
+NORMAL_CLOSURE = 1000
+# Close code for sockets closed by drain()
+SERVICE_RESTART_CLOSE_CODE = 1012
+# Close code for a socket whose session was resumed on another socket
+SUPERSEDED_CLOSE_CODE = 4005
+
+# Consumers with an established session in this process
+live_sessions = weakref.WeakSet()
+
+# Delayed leaves still waiting out their grace period
+_held = set()
+
+
+def resume_token(room, username, channel_name, epoch):
+    """Sign the session of ``username`` on ``channel_name`` for a later resume"""
+    return signing.dumps([room, username, channel_name, epoch], salt=RESUME_SALT)
+
+
+def read_resume_token(token, room, username):
+    """Return ``(channel_name, epoch)`` from a token issued to ``username`` in ``room``, or None"""
+    try:
+        token_room, token_user, channel_name, epoch = signing.loads(token, salt=RESUME_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if token_room != room or token_user != username:
+        return None
+    return channel_name, epoch
+
+
+def hold(announce_leave, grace=None):
+    """Run ``announce_leave`` once the grace period for a resume has passed"""
+    grace = getattr(settings, 'ROOM_RESUME_GRACE', 30) if grace is None else grace
+
+    async def wait():
+        await asyncio.sleep(grace)
+        try:
+            await announce_leave()
+        except Exception as e:
+            logger.error(f"Failed to announce a held session leaving: {e}")
+
+    task = asyncio.get_running_loop().create_task(wait())
+    _held.add(task)
+    task.add_done_callback(_held.discard)
+
+
+async def drain(spread=None):
+    """Close every session in this process, telling each client when to resume"""
+    spread = getattr(settings, 'ROOM_DRAIN_SPREAD', 10) if spread is None else spread
+    sessions = list(live_sessions)
+    logger.info(f"Draining {len(sessions)} WebSocket sessions")
+    results = await asyncio.gather(
+        *(session.drain(random.uniform(0, spread)) for session in sessions),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Failed to drain WebSocket session: {result}")
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan application that drains sessions at shutdown"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await drain()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
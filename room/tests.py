@@ -1,3 +1,809 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.layers import channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import re_path
+from rest_framework_simplejwt.tokens import AccessToken
+
+from vibesync_be import metrics
+from vibesync_be.middleware import JWTAuthMiddleware
+
+from . import (
+    audience, chat, controls, heartbeat, history, outbound, playback, presence, ratelimit, replay, sessions,
+    timesync,
+)
+from .consumers import RoomConsumer, group_name
+from .layers import LocalBroker, LocalHub
+from .models import ChatMessage, Room
+from .routing import websocket_urlpatterns
+
+
+# Every node is a HybridChannelLayer on the same in-process stand-in for Redis
+LOCAL_NODE = {
+    'BACKEND': 'room.layers.HybridChannelLayer',
+    'CONFIG': {'hosts': ['local://tests'], 'node_ttl': 0.3},
+}
+
+
+class SecondNodeConsumer(RoomConsumer):
+    """A RoomConsumer served by the second node"""
+
+    channel_layer_alias = 'node2'
+
+
+first_node = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+second_node = JWTAuthMiddleware(URLRouter([
+    re_path(r'ws/room/(?P<room_name>\w+)/$', SecondNodeConsumer.as_asgi()),
+]))
+
+
+def reset_backends():
+    """Drop the process-wide backends so each test builds fresh ones from its settings"""
+    for module, name in (
+        (audience, '_counter'), (audience, '_chat'), (chat, '_writer'), (controls, '_pipeline'),
+        (heartbeat, '_scheduler'), (history, '_history'), (playback, '_store'),
+        (presence, '_registry'), (ratelimit, '_limiter'), (replay, '_buffer'),
+    ):
+        setattr(module, name, None)
+    channel_layers.backends = {}
+    LocalHub.hubs.clear()
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': LOCAL_NODE, 'node2': LOCAL_NODE},
+    ROOM_PRESENCE={'BACKEND': 'room.presence.LocalPresenceRegistry'},
+)
+class RoomSocketTestCase(TransactionTestCase):
+    """Base for tests that talk to RoomConsumer over real sockets"""
+
+    room = 'lobby'
+
+    def setUp(self):
+        reset_backends()
+        self.communicators = []
+
+    async def connect(self, username, node=first_node, query=''):
+        user, _ = await User.objects.aget_or_create(username=username)
+        token = await sync_to_async(AccessToken.for_user)(user)
+        communicator = WebsocketCommunicator(node, f'/ws/room/{self.room}/?token={token}{query}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.communicators.append(communicator)
+        return communicator
+
+    async def disconnect(self, communicator):
+        self.communicators.remove(communicator)
+        await communicator.disconnect()
+
+    async def disconnect_all(self):
+        while self.communicators:
+            await self.disconnect(self.communicators[-1])
+        # Write batched chat while this test's rows still exist
+        if chat._writer is not None:
+            await chat._writer.flush()
+
+    async def frames(self, communicator, timeout=0.1):
+        """Return every frame sent to ``communicator`` until it goes quiet"""
+        frames = []
+        while not await communicator.receive_nothing(timeout):
+            message = await communicator.receive_output()
+            if message['type'] == 'websocket.send':
+                frames.append(json.loads(message['text']))
+        return frames
+
+    async def frames_of(self, communicator, frame_type):
+        return [frame for frame in await self.frames(communicator) if frame.get('type') == frame_type]
+
+
+class CrossNodeTests(RoomSocketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = group_name(self.room)
+        self.layer = channel_layers['default']
+        self.second_layer = channel_layers['node2']
+
+    async def test_group_send_stays_local_without_other_nodes(self):
+        alice = await self.connect('alice')
+        bob = await self.connect('bob')
+        await self.frames(alice)
+        published = self.layer.stats['published']
+        sent = metrics.FRAMES_SENT.values.get(('chat',), 0)
+
+        await alice.send_json_to({'type': 'chat', 'message': 'hi'})
+
+        self.assertEqual([frame['message'] for frame in await self.frames_of(bob, 'chat')], ['hi'])
+        self.assertEqual(self.layer.stats['published'], published)
+        # One fan-out to both sockets
+        self.assertEqual(metrics.FRAMES_SENT.values[('chat',)], sent + 2)
+        await self.disconnect_all()
+
+    async def test_hello_introduces_nodes(self):
+        await self.connect('alice')
+        await self.connect('carol', node=second_node)
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(self.layer.remote_nodes[self.group], {self.second_layer.node_id})
+        self.assertEqual(self.second_layer.remote_nodes[self.group], {self.layer.node_id})
+        await self.disconnect_all()
+
+    async def test_group_send_reaches_other_node(self):
+        alice = await self.connect('alice')
+        carol = await self.connect('carol', node=second_node)
+        await self.frames(alice)
+        await self.frames(carol)
+
+        await alice.send_json_to({'type': 'chat', 'message': 'hi'})
+
+        self.assertEqual([frame['message'] for frame in await self.frames_of(carol, 'chat')], ['hi'])
+        self.assertEqual([frame['message'] for frame in await self.frames_of(alice, 'chat')], ['hi'])
+        await self.disconnect_all()
+
+    async def test_direct_send_reaches_other_node(self):
+        alice = await self.connect('alice')
+        carol = await self.connect('carol', node=second_node)
+        await self.frames(alice)
+
+        await carol.send_json_to({'type': 'webrtc_offer', 'to': 'alice', 'content': {'sdp': 'x'}})
+
+        offers = await self.frames_of(alice, 'webrtc_offer')
+        self.assertEqual(offers, [{'type': 'webrtc_offer', 'from': 'carol', 'content': {'sdp': 'x'}}])
+        await self.disconnect_all()
+
+    async def test_direct_send_to_non_string_is_refused(self):
+        alice = await self.connect('alice')
+        await self.frames(alice)
+
+        await alice.send_json_to({'type': 'webrtc_offer', 'to': ['bob'], 'content': {}})
+
+        refusals = await self.frames_of(alice, 'error')
+        self.assertEqual([frame['error'] for frame in refusals], ['invalid_recipient'])
+        await self.disconnect_all()
+
+    async def test_bye_forgets_node(self):
+        alice = await self.connect('alice')
+        carol = await self.connect('carol', node=second_node)
+        await self.frames(alice)
+
+        await self.disconnect(carol)
+        await self.frames(alice)
+        published = self.layer.stats['published']
+        await alice.send_json_to({'type': 'chat', 'message': 'anyone?'})
+        await self.frames(alice)
+
+        self.assertEqual(self.layer.remote_nodes[self.group], set())
+        self.assertNotIn(self.group, self.second_layer.remote_nodes)
+        self.assertEqual(self.layer.stats['published'], published)
+        await self.disconnect_all()
+
+    async def test_join_while_leaving_stays_subscribed(self):
+        first = await self.layer.new_channel()
+        second = await self.layer.new_channel()
+        await self.layer.group_add('race', first)
+        unsubscribe = LocalBroker.unsubscribe
+
+        async def slow_unsubscribe(broker, topic):
+            await asyncio.sleep(0.01)
+            await unsubscribe(broker, topic)
+
+        with mock.patch.object(LocalBroker, 'unsubscribe', slow_unsubscribe):
+            # The second channel joins while the leave of the first is unsubscribing
+            await asyncio.gather(self.layer.group_discard('race', first), self.layer.group_add('race', second))
+
+        self.assertIn('race', self.layer.remote_nodes)
+        self.assertIn(self.layer._group_topic('race'), LocalHub.named('tests').topics)
+        self.assertEqual(self.layer._group_locks, {})
+        await self.layer.group_discard('race', second)
+
+    async def test_silent_node_expires(self):
+        await self.connect('alice')
+        await self.connect('carol', node=second_node)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.layer.remote_nodes[self.group], {self.second_layer.node_id})
+
+        # The second node dies without saying bye and stops refreshing
+        self.second_layer._refresher.cancel()
+        await asyncio.sleep(LOCAL_NODE['CONFIG']['node_ttl'] * 2)
+
+        self.assertEqual(self.layer.remote_nodes[self.group], set())
+        await self.disconnect_all()
+
+
+@override_settings(
+    ROOM_AUDIENCE_PRESENCE_INTERVAL=0.05,
+    ROOM_AUDIENCE_CHAT_SLOW_MODE=0.3,
+    ROOM_AUDIENCE_CHAT_RATE=0,
+)
+class AudienceModeTests(RoomSocketTestCase):
+    def setUp(self):
+        super().setUp()
+        host = User.objects.create(username='host')
+        Room.objects.create(room_id=self.room, host_user=host, audience_mode=True)
+
+    async def join(self, username):
+        """Connect ``username`` and return its socket and session frame"""
+        communicator = await self.connect(username)
+        frames = await self.frames(communicator)
+        return communicator, next(frame for frame in frames if frame['type'] == 'session')
+
+    async def test_audience_is_counted_not_listed(self):
+        host, session = await self.join('host')
+        self.assertEqual(session['role'], 'host')
+        bob, session = await self.join('bob')
+        self.assertEqual(session['role'], 'audience')
+
+        host_frames = await self.frames(host)
+        self.assertEqual([frame for frame in host_frames if frame['type'] == 'user_list_update'], [])
+        self.assertEqual([frame['count'] for frame in host_frames if frame['type'] == 'audience_update'], [2])
+
+        await bob.send_json_to({'type': 'presence_resync'})
+        snapshot = (await self.frames_of(bob, 'user_list_snapshot'))[0]
+        self.assertEqual((snapshot['users'], snapshot['count']), (['host'], 2))
+
+        await bob.send_json_to({'type': 'presence_page'})
+        page = (await self.frames_of(bob, 'user_list_page'))[0]
+        self.assertEqual(sorted(page['users']), ['bob', 'host'])
+        await self.disconnect_all()
+
+    async def test_controls_are_host_only(self):
+        host, _ = await self.join('host')
+        bob, _ = await self.join('bob')
+
+        for frame_type in ('video_control', 'set_role'):
+            await bob.send_json_to({'type': frame_type, 'action': 'pause', 'username': 'bob', 'role': 'speaker'})
+        refusals = await self.frames_of(bob, 'error')
+
+        self.assertEqual([(frame['message_type'], frame['error']) for frame in refusals], [
+            ('video_control', 'host_only'), ('set_role', 'host_only'),
+        ])
+        self.assertEqual(await self.frames_of(host, 'video_control'), [])
+        await self.disconnect_all()
+
+    async def test_audience_chat_slow_mode(self):
+        host, _ = await self.join('host')
+        bob, _ = await self.join('bob')
+
+        await bob.send_json_to({'type': 'chat', 'message': 'one'})
+        await bob.send_json_to({'type': 'chat', 'message': 'two'})
+
+        self.assertEqual([frame['message'] for frame in await self.frames_of(host, 'chat')], ['one'])
+        refusal = (await self.frames_of(bob, 'error'))[0]
+        self.assertEqual(refusal['error'], 'slow_mode')
+        self.assertGreater(refusal['retry_after'], 0)
+
+        await asyncio.sleep(0.3)
+        await bob.send_json_to({'type': 'chat', 'message': 'three'})
+        self.assertEqual([frame['message'] for frame in await self.frames_of(host, 'chat')], ['three'])
+        await self.disconnect_all()
+
+    async def test_host_moves_speaker_onto_stage(self):
+        host, _ = await self.join('host')
+        bob, _ = await self.join('bob')
+        await self.frames(host)
+
+        await host.send_json_to({'type': 'set_role', 'username': 'bob', 'role': 'speaker'})
+
+        host_frames = await self.frames(host)
+        self.assertIn({'type': 'role_update', 'username': 'bob', 'role': 'speaker'}, [
+            {key: frame.get(key) for key in ('type', 'username', 'role')} for frame in host_frames
+        ])
+        joins = [frame['username'] for frame in host_frames if frame['type'] == 'user_list_update']
+        self.assertEqual(joins, ['bob'])
+        self.assertTrue(await Room.speakers.through.objects.filter(user__username='bob').aexists())
+
+        # On the stage, chat is no longer slowed
+        for line in ('one', 'two'):
+            await bob.send_json_to({'type': 'chat', 'message': line})
+        self.assertEqual([frame['message'] for frame in await self.frames_of(host, 'chat')], ['one', 'two'])
+
+        await host.send_json_to({'type': 'set_role', 'username': 'bob', 'role': 'audience'})
+        leaves = [frame for frame in await self.frames_of(host, 'user_list_update') if frame['action'] == 'leave']
+        self.assertEqual([frame['username'] for frame in leaves], ['bob'])
+        await self.disconnect_all()
+
+
+class LocalPresenceRegistryTests(SimpleTestCase):
+    room = 'room_lobby'
+
+    def setUp(self):
+        self.registry = presence.LocalPresenceRegistry(ttl=180)
+
+    def later(self, seconds):
+        """Patch the registry's clock ``seconds`` into the future"""
+        return mock.patch('room.presence.time.monotonic', return_value=time.monotonic() + seconds)
+
+    async def test_membership_changes_bump_version(self):
+        self.assertEqual(await self.registry.join(self.room, 'alice', 'a1'), 1)
+        self.assertEqual(await self.registry.join(self.room, 'bob', 'b1'), 2)
+        self.assertIsNone(await self.registry.leave(self.room, 'bob', 'stale'))
+        self.assertEqual(await self.registry.leave(self.room, 'bob', 'b1'), 3)
+
+        self.assertEqual(await self.registry.snapshot(self.room), ({'alice': 'a1'}, 3))
+
+    async def test_touch_does_not_bump_version(self):
+        await self.registry.join(self.room, 'alice', 'a1')
+        await self.registry.touch(self.room, 'alice', 'a1')
+
+        self.assertEqual(await self.registry.snapshot(self.room), ({'alice': 'a1'}, 1))
+
+    async def test_rebind_moves_channel_without_bumping_version(self):
+        await self.registry.join(self.room, 'alice', 'a1')
+
+        self.assertEqual(await self.registry.rebind(self.room, 'alice', 'a1', 'a2'), 1)
+        self.assertEqual(await self.registry.channel_for(self.room, 'alice'), 'a2')
+        # The old socket no longer owns the entry
+        self.assertIsNone(await self.registry.rebind(self.room, 'alice', 'a1', 'a3'))
+        self.assertIsNone(await self.registry.leave(self.room, 'alice', 'a1'))
+        self.assertEqual(await self.registry.snapshot(self.room), ({'alice': 'a2'}, 1))
+
+    async def test_rebind_refuses_expired_entry(self):
+        await self.registry.join(self.room, 'alice', 'a1')
+
+        with self.later(200):
+            self.assertIsNone(await self.registry.rebind(self.room, 'alice', 'a1', 'a2'))
+
+    async def test_snapshot_prunes_expired_members(self):
+        await self.registry.join(self.room, 'alice', 'a1')
+        with self.later(100):
+            await self.registry.join(self.room, 'bob', 'b1')
+
+        with self.later(200):
+            self.assertIsNone(await self.registry.channel_for(self.room, 'alice'))
+            self.assertEqual(await self.registry.count(self.room), 1)
+            # Pruning bumps the version without a delta, so clients see a gap
+            self.assertEqual(await self.registry.snapshot(self.room), ({'bob': 'b1'}, 3))
+
+    async def test_empty_room_is_forgotten(self):
+        await self.registry.join(self.room, 'alice', 'a1')
+        await self.registry.leave(self.room, 'alice', 'a1')
+
+        self.assertEqual(self.registry.rooms, {})
+
+
+class LocalReplayBufferTests(SimpleTestCase):
+    room = 'room_lobby'
+
+    def setUp(self):
+        self.buffer = replay.LocalReplayBuffer(size=3, ttl=600)
+
+    async def append(self, count):
+        return [(await self.buffer.append(self.room, {'type': 'chat', 'message': i}))[0] for i in range(count)]
+
+    async def test_append_stamps_consecutive_seqs(self):
+        frames = await self.append(2)
+        seq, epoch = await self.buffer.position(self.room)
+
+        self.assertEqual([frame['seq'] for frame in frames], [1, 2])
+        self.assertEqual(seq, 2)
+        self.assertEqual((await self.buffer.append(self.room, {'type': 'chat'}))[1], epoch)
+
+    async def test_since_returns_missed_frames(self):
+        frames = await self.append(3)
+        _, epoch = await self.buffer.position(self.room)
+
+        self.assertEqual(await self.buffer.since(self.room, 1, epoch), frames[1:])
+        self.assertEqual(await self.buffer.since(self.room, 3, epoch), [])
+
+    async def test_since_refuses_gaps(self):
+        await self.append(5)
+        _, epoch = await self.buffer.position(self.room)
+
+        # Frames 1 and 2 have already left the buffer
+        self.assertIsNone(await self.buffer.since(self.room, 0, epoch))
+        self.assertEqual([frame['seq'] for frame in await self.buffer.since(self.room, 2, epoch)], [3, 4, 5])
+        # A client can't be ahead of the room
+        self.assertIsNone(await self.buffer.since(self.room, 6, epoch))
+
+    async def test_since_refuses_other_epoch(self):
+        await self.append(1)
+
+        self.assertIsNone(await self.buffer.since(self.room, 0, 'other'))
+
+    async def test_idle_room_starts_new_epoch(self):
+        await self.append(2)
+        _, epoch = await self.buffer.position(self.room)
+
+        with mock.patch('room.replay.time.monotonic', return_value=time.monotonic() + 700):
+            seq, new_epoch = await self.buffer.position(self.room)
+            self.assertIsNone(await self.buffer.since(self.room, 0, epoch))
+
+        self.assertEqual(seq, 0)
+        self.assertNotEqual(new_epoch, epoch)
+
+
+class ResumeTokenTests(SimpleTestCase):
+    def test_round_trip(self):
+        token = sessions.resume_token('lobby', 'alice', 'specific.a1', 'e1')
+
+        self.assertEqual(sessions.read_resume_token(token, 'lobby', 'alice'), ('specific.a1', 'e1'))
+
+    def test_other_room_or_user_is_refused(self):
+        token = sessions.resume_token('lobby', 'alice', 'specific.a1', 'e1')
+
+        self.assertIsNone(sessions.read_resume_token(token, 'other', 'alice'))
+        self.assertIsNone(sessions.read_resume_token(token, 'lobby', 'bob'))
+
+    def test_tampered_token_is_refused(self):
+        token = sessions.resume_token('lobby', 'alice', 'specific.a1', 'e1')
+
+        self.assertIsNone(sessions.read_resume_token(token[:-1], 'lobby', 'alice'))
+        self.assertIsNone(sessions.read_resume_token('garbage', 'lobby', 'alice'))
+
+
+@override_settings(ROOM_RESUME_GRACE=0.2)
+class ResumeTests(RoomSocketTestCase):
+    async def session_of(self, communicator):
+        return (await self.frames_of(communicator, 'session'))[0]
+
+    async def test_resume_replays_missed_frames_silently(self):
+        alice = await self.connect('alice')
+        session = await self.session_of(alice)
+        bob = await self.connect('bob')
+        await self.frames(alice)
+
+        # Dropped without a goodbye, so alice's seat is held
+        self.communicators.remove(alice)
+        await alice.disconnect(code=1006)
+        await bob.send_json_to({'type': 'chat', 'message': 'while you were out'})
+        await self.frames(bob)
+
+        alice = await self.connect('alice', query=f'&resume={session["resume_token"]}&last_seq={session["seq"]}')
+        frames = await self.frames(alice)
+        # Let the held leave run out; it must find the seat taken over
+        await asyncio.sleep(0.3)
+
+        self.assertTrue(frames[0]['resumed'])
+        self.assertEqual([frame['message'] for frame in frames if frame['type'] == 'chat'], ['while you were out'])
+        self.assertEqual(await self.frames_of(bob, 'user_list_update'), [])
+        await self.disconnect_all()
+
+    @override_settings(ROOM_REPLAY={'BACKEND': 'room.replay.LocalReplayBuffer', 'CONFIG': {'ttl': 0.5}})
+    async def test_resumed_socket_gets_frames_after_replay_expires(self):
+        alice = await self.connect('alice')
+        session = await self.session_of(alice)
+        bob = await self.connect('bob')
+        self.communicators.remove(alice)
+        await alice.disconnect(code=1006)
+        for i in range(3):
+            await bob.send_json_to({'type': 'chat', 'message': f'missed {i}'})
+        await self.frames(bob)
+        alice = await self.connect('alice', query=f'&resume={session["resume_token"]}&last_seq={session["seq"]}')
+        self.assertTrue((await self.frames(alice))[0]['resumed'])
+
+        # The room goes quiet for longer than its replay entry lives, so
+        # sequence numbers start over under a new epoch
+        await asyncio.sleep(0.6)
+        await bob.send_json_to({'type': 'chat', 'message': 'still here?'})
+
+        self.assertEqual([frame['message'] for frame in await self.frames_of(alice, 'chat')], ['still here?'])
+        await self.disconnect_all()
+
+    async def test_expired_token_gets_full_resync(self):
+        alice = await self.connect('alice')
+        session = await self.session_of(alice)
+        self.communicators.remove(alice)
+        await alice.disconnect(code=1006)
+        await asyncio.sleep(0.3)
+
+        alice = await self.connect('alice', query=f'&resume={session["resume_token"]}&last_seq={session["seq"]}')
+        frames = await self.frames(alice)
+
+        self.assertFalse(frames[0]['resumed'])
+        self.assertIn('chat_history', [frame['type'] for frame in frames])
+        await self.disconnect_all()
+
+
+class TokenBucketTests(SimpleTestCase):
+    def later(self, seconds):
+        return mock.patch('room.ratelimit.time.monotonic', return_value=time.monotonic() + seconds)
+
+    def test_burst_then_wait(self):
+        bucket = ratelimit.TokenBucket(rate=2, burst=3)
+
+        self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(), 0.5, places=2)
+
+    def test_refills_at_rate_up_to_burst(self):
+        bucket = ratelimit.TokenBucket(rate=2, burst=3)
+        for _ in range(3):
+            bucket.take()
+
+        with self.later(1):
+            self.assertEqual([bucket.take() for _ in range(2)], [0, 0])
+            self.assertGreater(bucket.take(), 0)
+        # Idle for a minute, but never more than a burst
+        with self.later(60):
+            self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0])
+            self.assertGreater(bucket.take(), 0)
+
+    async def test_room_buckets_are_shared_by_key(self):
+        limiter = ratelimit.LocalRateLimiter()
+
+        self.assertEqual(await limiter.take('room_a:chat', 1, 1), 0)
+        self.assertGreater(await limiter.take('room_a:chat', 1, 1), 0)
+        self.assertEqual(await limiter.take('room_b:chat', 1, 1), 0)
+
+    async def test_strikes_close_connection(self):
+        limits = ratelimit.ConnectionLimits({'chat': {'connection': (0.01, 1)}}, None, close_after=2)
+
+        self.assertIsNone(await limits.check('room_a', 'chat'))
+        self.assertEqual((await limits.check('room_a', 'chat'))[0], 'connection')
+        self.assertEqual([limits.strike() for _ in range(3)], [False, False, True])
+        self.assertTrue(limits.closed)
+
+
+class ControlPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.forwarded = []
+
+    async def forward(self, control):
+        self.forwarded.append(control)
+
+    def seek(self, position):
+        return {'action': 'seek', 'time': position}
+
+    async def test_seek_storm_keeps_first_and_last(self):
+        pipeline = controls.ControlPipeline(window=0.05)
+
+        for second in range(5):
+            await pipeline.submit('room_a', self.seek(second), self.forward)
+        self.assertEqual(self.forwarded, [self.seek(0)])
+        await asyncio.sleep(0.08)
+
+        self.assertEqual(self.forwarded, [self.seek(0), self.seek(4)])
+        self.assertEqual(pipeline.stats, {'forwarded': 2, 'merged': 3})
+
+    async def test_rooms_are_throttled_separately(self):
+        pipeline = controls.ControlPipeline(window=0.05)
+
+        await pipeline.submit('room_a', self.seek(1), self.forward)
+        await pipeline.submit('room_b', self.seek(2), self.forward)
+
+        self.assertEqual(self.forwarded, [self.seek(1), self.seek(2)])
+
+    async def test_host_seek_is_not_replaced(self):
+        pipeline = controls.ControlPipeline(window=0.05, policy='host')
+
+        await pipeline.submit('room_a', self.seek(0), self.forward)
+        await pipeline.submit('room_a', self.seek(1), self.forward, is_host=True)
+        await pipeline.submit('room_a', self.seek(2), self.forward)
+        await asyncio.sleep(0.08)
+
+        self.assertEqual(self.forwarded, [self.seek(0), self.seek(1)])
+
+    async def test_other_actions_supersede_pending_seek(self):
+        pipeline = controls.ControlPipeline(window=0.05)
+
+        await pipeline.submit('room_a', self.seek(0), self.forward)
+        await pipeline.submit('room_a', self.seek(1), self.forward)
+        await pipeline.submit('room_a', {'action': 'pause'}, self.forward)
+        await asyncio.sleep(0.08)
+
+        self.assertEqual(self.forwarded, [self.seek(0), {'action': 'pause'}])
+        self.assertEqual(pipeline.windows, {})
+
+
+class OutboundQueueTests(SimpleTestCase):
+    async def test_discarded_counters_survive_close(self):
+        written = asyncio.Event()
+        queue = outbound.OutboundQueue(lambda data: written.wait(), None, policies={'seek': 'latest', 'ping': 'drop'})
+        before = dict(outbound.discarded)
+
+        # The first frame is being written; the rest back up behind it
+        for frame_type in ('chat', 'seek', 'seek', 'ping'):
+            await queue.put(frame_type, b'')
+        queue.close()
+        written.set()
+
+        self.assertEqual(outbound.discarded['coalesced'], before['coalesced'] + 1)
+        self.assertEqual(outbound.discarded['dropped'], before['dropped'] + 1)
+        self.assertEqual(metrics.render().count('vibesync_ws_outbound_discarded_total{reason='), 2)
+
+    async def test_queue_is_opt_in(self):
+        written = []
+
+        async def send(data):
+            written.append(data)
+
+        direct = outbound.outbound_queue_for(send, None)
+        await direct.put('chat', b'hi')
+        self.assertIsInstance(direct, outbound.DirectOutbound)
+        self.assertEqual(written, [b'hi'])
+
+        with self.settings(ROOM_OUTBOUND_QUEUE=True):
+            self.assertIsInstance(outbound.outbound_queue_for(send, None), outbound.OutboundQueue)
+
+
+@override_settings(
+    ROOM_RATE_LIMITS={'chat': {'connection': (0.01, 2)}},
+    ROOM_RATE_LIMIT_ACTION='refuse',
+    ROOM_RATE_LIMIT_CLOSE_AFTER=3,
+)
+class RateLimitTests(RoomSocketTestCase):
+    async def test_flooding_socket_is_refused_then_closed(self):
+        alice = await self.connect('alice')
+        await self.frames(alice)
+
+        for i in range(8):
+            await alice.send_json_to({'type': 'chat', 'message': str(i)})
+        messages = []
+        while not await alice.receive_nothing(0.1):
+            messages.append(await alice.receive_output())
+
+        frames = [json.loads(message['text']) for message in messages if message['type'] == 'websocket.send']
+        self.assertEqual([frame['message'] for frame in frames if frame['type'] == 'chat'], ['0', '1'])
+        refusals = [frame for frame in frames if frame['type'] == 'error']
+        self.assertEqual([(frame['error'], frame['scope']) for frame in refusals], [('rate_limited', 'connection')] * 3)
+        self.assertEqual(messages[-1], {'type': 'websocket.close', 'code': ratelimit.RATE_LIMITED_CLOSE_CODE})
+        await self.disconnect_all()
+
+
+class ClockEstimateTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = timesync.ClockEstimate()
+
+    def test_offset_and_rtt(self):
+        # The client runs 1000 ms behind; 40 ms each way, 20 ms on the server
+        self.clock.add_exchange(0, 1040, 1060, 100)
+
+        self.assertEqual(self.clock.rtt, 80)
+        self.assertEqual(self.clock.offset, 1000)
+
+    def test_lowest_rtt_sample_wins(self):
+        self.clock.add_exchange(0, 1040, 1060, 100)
+        self.clock.add_exchange(0, 1010, 1010, 20)
+        self.clock.add_exchange(0, 1100, 1100, 200)
+
+        self.assertEqual((self.clock.rtt, self.clock.offset), (20, 1000))
+
+    def test_bad_samples_are_ignored(self):
+        self.clock.add_exchange(0, 1040, 1060, '1e400')
+        self.clock.add_exchange(0, 1040, 1060, 'nan')
+        # Answered before it was asked
+        self.clock.add_exchange(100, 1040, 1060, 0)
+        self.clock.add_exchange(0, 1000, 1000, timesync.MAX_RTT_MS + 1)
+
+        self.assertIsNone(self.clock.offset)
+        self.assertIsNone(self.clock.rtt)
+
+    def test_issued_at_uses_client_stamp(self):
+        self.clock.add_exchange(0, 1040, 1060, 100)
+        now = timesync.server_now_ms()
+
+        self.assertAlmostEqual(self.clock.issued_at(now - 1000 - 300), now - 300, delta=50)
+
+    def test_issued_at_is_clamped(self):
+        self.clock.add_exchange(0, 1000, 1000, timesync.MAX_RTT_MS)
+        now = timesync.server_now_ms()
+
+        # Half this round trip is more than the clamp allows
+        self.assertGreaterEqual(self.clock.issued_at(), now - timesync.MAX_COMPENSATION_MS)
+        self.assertGreaterEqual(self.clock.issued_at('1e400'), now - timesync.MAX_COMPENSATION_MS)
+        self.assertGreaterEqual(self.clock.issued_at(0), now - timesync.MAX_COMPENSATION_MS)
+        self.assertLessEqual(self.clock.issued_at(now * 2), timesync.server_now_ms())
+
+    def test_issued_at_without_samples_is_now(self):
+        now = timesync.server_now_ms()
+
+        self.assertAlmostEqual(self.clock.issued_at('whenever'), now, delta=50)
+
+
+class MalformedFrameTests(RoomSocketTestCase):
+    async def test_non_string_type_is_ignored(self):
+        alice = await self.connect('alice')
+        await self.frames(alice)
+
+        for frame_type in ([], {}, 7):
+            await alice.send_json_to({'type': frame_type})
+        await alice.send_json_to({'type': 'chat', 'message': 'still here'})
+
+        self.assertEqual([frame['message'] for frame in await self.frames_of(alice, 'chat')], ['still here'])
+        await self.disconnect_all()
+
+
+class TimeSyncTests(RoomSocketTestCase):
+    async def test_bad_sample_never_reaches_the_room(self):
+        alice = await self.connect('alice')
+        await self.frames(alice)
+
+        await alice.send_json_to({'type': 'time_sync', 'client_sent': 1, 'previous': {
+            'client_sent': 0, 'server_received': 1040, 'server_sent': 1060, 'client_received': '1e400',
+        }})
+        reply = (await self.frames_of(alice, 'time_sync'))[0]
+        await alice.send_json_to({'type': 'video_control', 'action': 'play', 'timestamp': 3})
+        await asyncio.sleep(0.3)
+        control = (await self.frames_of(alice, 'video_control'))[0]
+
+        self.assertEqual((reply['offset'], reply['rtt']), (None, None))
+        self.assertGreater(control['server_time'], 0)
+        await self.disconnect_all()
+
+
+class ChatWriterTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='alice')
+        self.room = Room.objects.create(room_id='lobby', host_user=self.user)
+        self.writer = chat.ChatWriter(flush_on_shutdown=False)
+
+    async def test_batch_is_written(self):
+        for line in ('one', 'two'):
+            await self.writer.add(self.room.pk, self.user.pk, line)
+        await self.writer.flush()
+
+        self.assertEqual(self.writer.pending, [])
+        self.assertEqual(await ChatMessage.objects.filter(room=self.room).acount(), 2)
+
+    async def test_refused_line_does_not_block_the_rest(self):
+        await self.writer.add(self.room.pk, self.user.pk, 'before')
+        # A room deleted while its chat was queued
+        await self.writer.add(self.room.pk + 1000, self.user.pk, 'orphan')
+        await self.writer.add(self.room.pk, self.user.pk, 'after')
+        await self.writer.flush()
+
+        self.assertEqual(self.writer.pending, [])
+        messages = [message async for message in ChatMessage.objects.order_by('pk').values_list('message', flat=True)]
+        self.assertEqual(messages, ['before', 'after'])
+
+    async def test_transient_failure_is_retried(self):
+        await self.writer.add(self.room.pk, self.user.pk, 'hello')
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=OperationalError('locked')):
+            await self.writer.flush()
+        self.assertEqual(len(self.writer.pending), 1)
+
+        await self.writer.flush()
+
+        self.assertEqual(self.writer.pending, [])
+        self.assertEqual(await ChatMessage.objects.acount(), 1)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], CHANNEL_LAYERS={'default': LOCAL_NODE})
+class RoomDetailsTests(TestCase):
+    def setUp(self):
+        reset_backends()
+        cache.clear()
+        self.user = User.objects.create(username='alice')
+        self.room = Room.objects.create(room_id='lobby', host_user=self.user)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def get(self, **headers):
+        return self.client.get('/api/room/lobby/', **self.auth, **headers)
+
+    def test_unchanged_room_is_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['room_id'], 'lobby')
+
+        revalidated = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b'')
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_cached_poll_costs_no_query(self):
+        self.get()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_set_video_invalidates(self):
+        etag = self.get()['ETag']
+
+        response = self.client.post(
+            '/api/room/lobby/set-video/', {'video_url': 'https://example.com/v.mp4'}, **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+
+        changed = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['video_url'], 'https://example.com/v.mp4')
+
+    def test_unknown_room(self):
+        self.assertEqual(self.client.get('/api/room/nowhere/', **self.auth).status_code, 404)
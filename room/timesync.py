@@ -0,0 +1,77 @@
+"""
+NTP-style clock synchronization over the room socket.
+
+A client sends ``{'type': 'time_sync', 'client_sent': T1}`` and the server
+answers with ``server_received`` (T2) and ``server_sent`` (T3). The client
+notes when the answer arrived (T4) and echoes all four timestamps as
+``previous`` in its next ``time_sync``. Both sides can then estimate the
+client's clock offset and round-trip time; the server keeps the sample with
+the lowest RTT out of the last few, as NTP's clock filter does.
+
+All wire times are milliseconds since the epoch, as ``Date.now()`` returns.
+"""
+import math
+import time
+from collections import deque
+
+
+# A client clock that claims a frame is older than this is not believed
+MAX_COMPENSATION_MS = 5000
+# Round trips slower than this say nothing useful about the clock offset
+MAX_RTT_MS = 10000
+
+
+def server_now_ms():
+    return time.time() * 1000
+
+
+class ClockEstimate:
+    def __init__(self, max_samples=8):
+        # (rtt, offset) pairs; offset is server clock minus client clock
+        self.samples = deque(maxlen=max_samples)
+
+    def add_exchange(self, client_sent, server_received, server_sent, client_received):
+        """Record one completed time_sync round trip; impossible ones are ignored"""
+        client_sent, server_received, server_sent, client_received = (
+            float(client_sent), float(server_received), float(server_sent), float(client_received)
+        )
+        rtt = (client_received - client_sent) - (server_sent - server_received)
+        offset = ((server_received - client_sent) + (server_sent - client_received)) / 2
+        # Infinities would reach clients as -Infinity, which JSON can't carry
+        if not (math.isfinite(rtt) and math.isfinite(offset)) or not 0 <= rtt <= MAX_RTT_MS:
+            return
+        self.samples.append((rtt, offset))
+
+    @property
+    def best(self):
+        return min(self.samples) if self.samples else None
+
+    @property
+    def offset(self):
+        return self.best[1] if self.samples else None
+
+    @property
+    def rtt(self):
+        return self.best[0] if self.samples else None
+
+    def issued_at(self, client_sent=None):
+        """Server time (ms) at which the client sent a frame.
+
+        Uses the frame's own ``client_sent`` stamp when there is one, and
+        half the round trip otherwise. Either way it is at most
+        ``MAX_COMPENSATION_MS`` in the past.
+        """
+        now = server_now_ms()
+        best = self.best
+        if best is None:
+            return now
+        rtt, offset = best
+        issued = now - rtt / 2
+        if client_sent is not None:
+            try:
+                stamped = float(client_sent) + offset
+            except (TypeError, ValueError):
+                stamped = None
+            if stamped is not None and math.isfinite(stamped):
+                issued = stamped
+        return min(now, max(issued, now - MAX_COMPENSATION_MS))
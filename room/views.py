@@ -1,11 +1,22 @@
-from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.contrib.auth.models import User
+from channels.layers import get_channel_layer
+from django.utils.http import parse_etags
+from .consumers import broadcast, group_name
 from .models import Room
-from .serializers import RoomSerializer, SetVideoURLSerializer, JoinRoomSerializer
+from .playback import PlaybackState, get_playback_store
+from .room_cache import aget_room_details, ainvalidate_rooms
+from .serializers import RoomSerializer, SetVideoURLSerializer
+from vibesync_be.async_views import AsyncAPIView
+from vibesync_be.authentication import AsyncJWTStatelessUserAuthentication
+from vibesync_be.metrics import TimedViewMixin
+import logging
 import random
 import string
+import time
+
+
+logger = logging.getLogger(__name__)
 
 
 def generate_room_id():
@@ -13,11 +24,14 @@ def generate_room_id():
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
 
 
-class CreateRoom(APIView):
-    def post(self, request):
+class CreateRoom(TimedViewMixin, AsyncAPIView):
+    async def post(self, request):
         user = request.user
         room_id = generate_room_id()
-        room = Room.objects.create(room_id=room_id, host_user=user)
+        # Only audience_mode is writable; everything else starts at its default
+        options = RoomSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        room = await Room.objects.acreate(room_id=room_id, host_user=user, **options.validated_data)
         serializer = RoomSerializer(room)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -25,25 +39,59 @@ class CreateRoom(APIView):
 
 
 
-class RoomDetails(APIView):
-    def get(self, request, room_id):
-        try:
-            room = Room.objects.get(room_id=room_id)
-            serializer = RoomSerializer(room)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Room.DoesNotExist:
+class RoomDetails(TimedViewMixin, AsyncAPIView):
+    # The view never looks at the user, so a token is checked without the
+    # database lookup; cached polls then cost no query at all
+    authentication_classes = [AsyncJWTStatelessUserAuthentication]
+
+    async def get(self, request, room_id):
+        details = await aget_room_details(room_id)
+        if details is None:
             return Response({"error": "Room not found"}, status=status.HTTP_404_NOT_FOUND)
+        data, etag = details
+        # Clients revalidate every poll; unchanged rooms get an empty 304
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, status=status.HTTP_200_OK, headers=headers)
 
 
-class SetVideoURL(APIView):
-    def post(self, request, room_id):
+class SetVideoURL(TimedViewMixin, AsyncAPIView):
+    async def post(self, request, room_id):
         try:
-            room = Room.objects.get(room_id=room_id)
+            room = await Room.objects.aget(room_id=room_id)
             serializer = SetVideoURLSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
 
             room.video_url = serializer.validated_data['video_url']
-            room.save()
+            # Only the URL, so playback fields flushed meanwhile survive
+            await room.asave(update_fields=['video_url'])
+            await ainvalidate_rooms([room_id])
+            await self.share_live(room, request.user)
             return Response({"message": "Video URL updated successfully."}, status=status.HTTP_200_OK)
         except Room.DoesNotExist:
             return Response({"error": "Room not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    async def share_live(self, room, user):
+        """Share the new URL with the room's live state and sockets.
+
+        Otherwise a worker holding the room in memory would flush its old
+        URL back over the row at its next write-behind.
+        """
+        store = get_playback_store()
+        if room.room_id in store.states:
+            playback_state = store.apply_share(room.room_id, room.video_url)
+        else:
+            # Workers holding the room mirror it from the broadcast
+            playback_state = PlaybackState(
+                video_url=room.video_url, video_quality=room.video_quality, updated_at=time.time(),
+            )
+        try:
+            await broadcast(get_channel_layer(), group_name(room.room_id), {
+                'type': 'video_share',
+                'video_url': room.video_url,
+                'username': user.username,
+            }, playback=playback_state.as_dict())
+        except Exception as e:
+            logger.error(f"Failed to broadcast video URL for room {room.room_id}: {e}")
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth.password_validation import validate_password
+from vibesync_be.hashing import amake_password
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -25,17 +26,31 @@ class RegisterSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"password": "Password fields didn't match."})
         return attrs
 
-    def create(self, validated_data):
-        user = User.objects.create(
+    def new_user(self, validated_data):
+        """An unsaved user from ``validated_data``, still without a password"""
+        return User(
             username=validated_data['username'],
             email=validated_data['email'],
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name'],
         )
+
+    def create(self, validated_data):
+        user = self.new_user(validated_data)
         user.set_password(validated_data['password'])
         user.save()
         return user
 
+    async def acreate(self, validated_data):
+        """``create`` for async views, with the password hashed on the hashing pool"""
+        user = self.new_user(validated_data)
+        user.password = await amake_password(validated_data['password'])
+        # As set_password does, so save() tells the password validators
+        user._password = validated_data['password']
+        await user.asave()
+        self.instance = user
+        return user
+
 
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField()
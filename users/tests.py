@@ -1,3 +1,72 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_login_failed
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from vibesync_be import hashing
+from vibesync_be.authentication import aauthenticate_credentials
+
+from .serializers import RegisterSerializer
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    PASSWORD_HASH_EXECUTOR='thread',
+)
+class CredentialsTests(TestCase):
+    def setUp(self):
+        hashing._pool = None
+        self.user = User.objects.create_user('alice', password='correct horse')
+        self.failures = []
+        user_login_failed.connect(self.record_failure)
+        self.addCleanup(user_login_failed.disconnect, self.record_failure)
+
+    def record_failure(self, sender, credentials, **kwargs):
+        self.failures.append(credentials)
+
+    async def test_right_password(self):
+        self.assertEqual(await aauthenticate_credentials('alice', 'correct horse'), self.user)
+        self.assertEqual(self.failures, [])
+
+    async def test_failure_sends_signal_without_password(self):
+        self.assertIsNone(await aauthenticate_credentials('alice', 'wrong'))
+        self.assertIsNone(await aauthenticate_credentials('nobody', 'wrong'))
+
+        self.assertEqual([credentials['username'] for credentials in self.failures], ['alice', 'nobody'])
+        self.assertNotIn('wrong', [credentials['password'] for credentials in self.failures])
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.AllowAllUsersModelBackend'])
+    async def test_other_backends_are_used(self):
+        await User.objects.filter(pk=self.user.pk).aupdate(is_active=False)
+
+        # ModelBackend would refuse an inactive user; this backend doesn't
+        self.assertEqual(await aauthenticate_credentials('alice', 'correct horse'), self.user)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    PASSWORD_HASH_EXECUTOR='thread',
+)
+class RegisterSerializerTests(TestCase):
+    data = {
+        'username': 'bob', 'email': 'bob@example.com', 'first_name': 'Bob', 'last_name': 'B',
+        'password': 'a long enough passphrase', 'password2': 'a long enough passphrase',
+    }
+
+    def setUp(self):
+        hashing._pool = None
+
+    def test_save_hashes_password(self):
+        serializer = RegisterSerializer(data=self.data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        user = serializer.save()
+
+        self.assertTrue(user.check_password(self.data['password']))
+
+    async def test_acreate_hashes_password(self):
+        validated_data = {key: value for key, value in self.data.items() if key != 'password2'}
+
+        user = await RegisterSerializer().acreate(validated_data)
+
+        self.assertTrue(await user.acheck_password(self.data['password']))
+        self.assertEqual(await User.objects.filter(username='bob').acount(), 1)
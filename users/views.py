@@ -1,9 +1,10 @@
-from rest_framework.views import APIView
+from asgiref.sync import sync_to_async
 from rest_framework.response import Response
 from rest_framework import status
-from django.contrib.auth import authenticate
 from .serializers import RegisterSerializer, LoginSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
+from vibesync_be.async_views import AsyncAPIView
+from vibesync_be.authentication import aauthenticate_credentials
 
 
 def get_tokens_for_user(user):
@@ -14,22 +15,24 @@ def get_tokens_for_user(user):
     }
 
 
-class RegisterView(APIView):
-    def post(self, request):
+class RegisterView(AsyncAPIView):
+    async def post(self, request):
         serializer = RegisterSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save()
+        # The unique validators query the database
+        if await sync_to_async(serializer.is_valid)():
+            await serializer.acreate(serializer.validated_data)
             return Response({"message": "User registered successfully"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class LoginView(APIView):
-    def post(self, request):
+class LoginView(AsyncAPIView):
+    async def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
-            user = authenticate(
+            user = await aauthenticate_credentials(
                 username=serializer.validated_data['username'],
-                password=serializer.validated_data['password']
+                password=serializer.validated_data['password'],
+                request=request,
             )
             if user is not None:
                 tokens = get_tokens_for_user(user)
@@ -1,38 +1,30 @@
 import os
-import django
+
+from django.core.asgi import get_asgi_application
 
 # Set default settings module before importing Django components
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vibesync_be.settings')
-django.setup()
 
-from django.core.asgi import get_asgi_application
+# Sets Django up, once, before anything below imports models
+django_asgi_app = get_asgi_application()
+
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 from room.routing import websocket_urlpatterns
-from channels.security.websocket import AllowedHostsOriginValidator, OriginValidator
-from channels.exceptions import DenyConnection
-import logging
-
-logger = logging.getLogger(__name__)
-
-# Set default settings module
-# os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vibesync_be.settings') 
-print("DJANGO_SETTINGS_MODULE:", os.environ.get('DJANGO_SETTINGS_MODULE'))
-# Initialize Django application
-django_asgi_app = get_asgi_application()
-
-
+from room.sessions import lifespan
+from vibesync_be.middleware import JWTAuthMiddleware
 
 
 # Define ProtocolTypeRouter with HTTP and WebSocket support
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
+    # Drains WebSocket sessions with resume hints at shutdown
+    "lifespan": lifespan,
     "websocket": AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
+        JWTAuthMiddleware(
             URLRouter(
                 websocket_urlpatterns
             )
         )
     ),
-})
\ No newline at end of file
+})
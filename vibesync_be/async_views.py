@@ -0,0 +1,56 @@
+import inspect
+
+from django.http import HttpResponse
+from rest_framework.views import APIView
+
+from vibesync_be.authentication import aauthenticate_request
+
+
+class AsyncAPIView(APIView):
+    """``APIView`` whose handlers are coroutines run on the event loop.
+
+    Under ASGI a sync ``APIView`` runs whole in the thread-sensitive sync
+    adapter, so a process serves one such request at a time. Here only the
+    work that must be synchronous (each ORM query) leaves the loop; request
+    parsing, authentication, serialization and rendering stay on it, and
+    other requests and sockets proceed while a query is out.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        """``APIView.dispatch`` with awaited authentication and handler"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # With the user resolved here, initial() needs no database
+            await aauthenticate_request(request)
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.rendered(self.response)
+
+    def rendered(self, response):
+        # Django would hop to the sync thread to render a deferred response,
+        # so render it here and hand back a plain one
+        if not hasattr(response, 'render'):
+            return response
+        response.render()
+        plain = HttpResponse(response.content, status=response.status_code)
+        for header, value in response.items():
+            plain[header] = value
+        return plain
@@ -0,0 +1,124 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aauthenticate, get_user_model
+from django.contrib.auth.signals import user_login_failed
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from vibesync_be.hashing import acheck_password, amake_password
+
+
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` that async views can await.
+
+    Token validation is pure CPU and runs inline; the user is fetched with
+    the async ORM. Sync views keep using ``authenticate``.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """``get_user`` with the lookup on the async ORM"""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+class AsyncJWTStatelessUserAuthentication(AsyncJWTAuthentication, JWTStatelessUserAuthentication):
+    """Stateless JWT authentication for async views; the user comes from the token alone"""
+
+    async def aget_user(self, validated_token):
+        return self.get_user(validated_token)
+
+
+async def aauthenticate_request(request):
+    """Async counterpart of DRF's ``Request._authenticate``.
+
+    Authenticators with an ``aauthenticate`` coroutine are awaited; others
+    run in a worker thread.
+    """
+    for authenticator in request.authenticators:
+        try:
+            if hasattr(authenticator, 'aauthenticate'):
+                user_auth_tuple = await authenticator.aauthenticate(request)
+            else:
+                user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+        except exceptions.APIException:
+            request._not_authenticated()
+            raise
+
+        if user_auth_tuple is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = user_auth_tuple
+            return
+
+    request._not_authenticated()
+
+
+async def aauthenticate_credentials(username, password, request=None):
+    """``ModelBackend.authenticate`` with the password checked on the hashing pool.
+
+    This stands in for ``django.contrib.auth.authenticate`` and so skips its
+    backend loop. It is only used while ``AUTHENTICATION_BACKENDS`` is just
+    ``ModelBackend``; any other setup goes through ``aauthenticate`` and its
+    backends, hashing on a worker thread. A failure sends
+    ``user_login_failed`` as ``authenticate`` would.
+    """
+    if list(settings.AUTHENTICATION_BACKENDS) != [MODEL_BACKEND]:
+        return await aauthenticate(request, username=username, password=password)
+    user = await _amodel_backend_user(username, password)
+    if user is None:
+        await user_login_failed.asend(
+            sender=__name__,
+            credentials={'username': username, 'password': '********************'},
+            request=request,
+        )
+    return user
+
+
+async def _amodel_backend_user(username, password):
+    if username is None or password is None:
+        return None
+    user_model = get_user_model()
+    try:
+        user = await user_model._default_manager.aget(**{user_model.USERNAME_FIELD: username})
+    except user_model.DoesNotExist:
+        # Hash anyway, so an unknown username takes as long as a wrong password
+        await amake_password(password)
+        return None
+    if await acheck_password(user, password) and getattr(user, 'is_active', True):
+        return user
+    return None
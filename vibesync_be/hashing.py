@@ -0,0 +1,119 @@
+"""
+Password hashing off the event loop.
+
+A PBKDF2 hash at Django's default work factor is hundreds of milliseconds of
+CPU, and a worker hashing a login serves none of its sockets meanwhile.
+``amake_password`` and ``acheck_password`` run the hashers on a small pool
+instead: ``PASSWORD_HASH_EXECUTOR`` is ``'process'`` (the default, which
+sidesteps the GIL) or ``'thread'``, with ``PASSWORD_HASH_WORKERS`` workers.
+
+Admission is bounded: at most ``PASSWORD_HASH_MAX_PENDING`` hashes may be
+queued or running, and callers beyond that get ``HashingBusy`` (503 with
+``Retry-After``) at once rather than waiting behind work that would outlive
+their request anyway.
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+from rest_framework import exceptions, status
+
+from vibesync_be.metrics import PASSWORD_HASH_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(exceptions.Throttled):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many sign-ins in progress.'
+    default_code = 'hashing_busy'
+
+
+class HashingPool:
+    """Run hashing functions on a bounded executor and await their results"""
+
+    def __init__(self, executor='process', workers=2, max_pending=32):
+        if executor not in ('process', 'thread'):
+            raise ValueError(f"Unknown password hash executor: {executor}")
+        self.kind = executor
+        self.workers = workers
+        self.max_pending = max_pending
+        # Queued or running, including work whose caller has gone away
+        self.pending = 0
+        self.stats = {'completed': 0, 'failed': 0, 'rejected': 0}
+        self._executor = None
+
+    def executor(self):
+        if self._executor is None:
+            if self.kind == 'thread':
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+            else:
+                # Spawned, not forked: the server process has threads running
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    async def run(self, operation, fn, *args):
+        if self.pending >= self.max_pending:
+            self.stats['rejected'] += 1
+            raise HashingBusy(wait=1)
+
+        start = time.perf_counter()
+        executor = self.executor()
+        try:
+            future = asyncio.wrap_future(executor.submit(fn, *args))
+            self.pending += 1
+            future.add_done_callback(self._finished)
+            # A cancelled caller must not free the slot while the hash still runs
+            result = await asyncio.shield(future)
+        except BrokenExecutor:
+            logger.error("Password hashing pool broke, starting a new one")
+            self.reset(executor)
+            raise
+        PASSWORD_HASH_LATENCY.observe(time.perf_counter() - start, operation)
+        return result
+
+    def _finished(self, future):
+        self.pending -= 1
+        if future.cancelled() or future.exception() is not None:
+            self.stats['failed'] += 1
+        else:
+            self.stats['completed'] += 1
+
+    def reset(self, executor):
+        # Callers racing over the same broken pool replace it only once
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+
+
+def get_hashing_pool():
+    """Return the process-wide hashing pool configured in settings"""
+    global _pool
+    if _pool is None:
+        _pool = HashingPool(
+            executor=getattr(settings, 'PASSWORD_HASH_EXECUTOR', 'process'),
+            workers=getattr(settings, 'PASSWORD_HASH_WORKERS', 2),
+            max_pending=getattr(settings, 'PASSWORD_HASH_MAX_PENDING', 32),
+        )
+    return _pool
+
+
+async def amake_password(password):
+    """``make_password`` on the hashing pool"""
+    return await get_hashing_pool().run('make', make_password, password)
+
+
+async def acheck_password(user, raw_password):
+    """``user.acheck_password`` with the verification on the hashing pool"""
+    is_correct, must_update = await get_hashing_pool().run('check', verify_password, raw_password, user.password)
+    if is_correct and must_update:
+        user.password = await amake_password(raw_password)
+        await user.asave(update_fields=['password'])
+    return is_correct
@@ -0,0 +1,352 @@
+"""
+In-process runtime metrics, exposed in the Prometheus text format.
+
+Each worker process keeps its own counters and histograms and serves them at
+``/metrics``; Prometheus scrapes every worker and sums across them. Updating
+a metric is a plain dict update, but that is still a noticeable share of
+delivering one frame to one socket (see ``manage.py bench_metrics``), so
+nothing is updated per recipient of a broadcast: ``HybridChannelLayer``
+counts sent frames once per fan-out, with the number of recipients. Under
+any other channel layer broadcast frames go uncounted.
+
+Realtime metrics are only touched from the worker's event loop thread and
+take no lock; metrics updated from sync view threads are created with
+``threadsafe=True``. Values that other modules already track, such as
+outbound queue and layer stats, are read when the endpoint is scraped rather
+than counted twice.
+
+Set ``METRICS_TOKEN`` to require ``Authorization: Bearer <token>`` on the
+endpoint. Without a token it only answers requests whose ``REMOTE_ADDR`` is
+a loopback address; behind a reverse proxy that is every request, so set a
+token there.
+"""
+import bisect
+import contextlib
+import functools
+import hmac
+import inspect
+import ipaddress
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+# Seconds; handlers and views mostly land in the low milliseconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=(), threadsafe=False):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock() if threadsafe else None
+
+    def inc(self, *label_values, amount=1):
+        if self._lock is None:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+            return
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock or contextlib.nullcontext():
+            items = list(self.values.items())
+        for label_values, value in items:
+            yield self.name + _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS, threadsafe=False):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self.values = {}
+        self._lock = threading.Lock() if threadsafe else None
+
+    def observe(self, value, *label_values):
+        if self._lock is None:
+            self._observe(value, label_values)
+            return
+        with self._lock:
+            self._observe(value, label_values)
+
+    def _observe(self, value, label_values):
+        entry = self.values.get(label_values)
+        if entry is None:
+            entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def time(self, *label_values):
+        """Decorate a coroutine function to observe how long each call takes"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *label_values)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        with self._lock or contextlib.nullcontext():
+            items = [(label_values, list(counts), total) for label_values, (counts, total) in self.values.items()]
+        for label_values, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield self.name + '_bucket' + _format_labels(self.labels, label_values, f'le="{le}"'), cumulative
+            yield self.name + '_sum' + _format_labels(self.labels, label_values), total
+            yield self.name + '_count' + _format_labels(self.labels, label_values), cumulative
+
+
+class CallbackMetric:
+    """A gauge or counter whose values are read from ``collect()`` at scrape time.
+
+    ``collect`` returns ``{label values tuple: value}``.
+    """
+
+    def __init__(self, name, help, collect, labels=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.labels = labels
+        self.kind = kind
+
+    def samples(self):
+        for label_values, value in self.collect().items():
+            yield self.name + _format_labels(self.labels, label_values), value
+
+
+registry = []
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+def render():
+    """Return every registered metric in the Prometheus text format"""
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, value in metric.samples():
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _is_loopback(address):
+    try:
+        return ipaddress.ip_address(address).is_loopback
+    except ValueError:
+        return False
+
+
+async def metrics_view(request):
+    """Serve this worker's metrics to a Prometheus scrape"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        parts = request.headers.get('Authorization', '').split()
+        if len(parts) != 2 or parts[0].lower() != 'bearer' or not hmac.compare_digest(parts[1], token):
+            return HttpResponseForbidden()
+    elif not _is_loopback(request.META.get('REMOTE_ADDR', '')):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Realtime path
+
+FRAMES_RECEIVED = register(Counter(
+    'vibesync_ws_frames_received_total', "Frames received from clients, by message type", ('type',)
+))
+FRAMES_SENT = register(Counter(
+    'vibesync_ws_frames_sent_total', "Frames handed to client sockets, by frame type", ('type',)
+))
+HANDLER_LATENCY = register(Histogram(
+    'vibesync_ws_handler_seconds', "Time spent in RoomConsumer handlers", ('handler',)
+))
+GROUP_SEND_LATENCY = register(Histogram(
+    'vibesync_ws_group_send_seconds', "Time spent in channel layer group_send, by frame type", ('type',)
+))
+AUTH_FAILURES = register(Counter(
+    'vibesync_ws_auth_failures_total', "WebSocket connections refused, by close code", ('code',)
+))
+SESSION_RESUMES = register(Counter(
+    'vibesync_ws_resumes_total', "Resume attempts: replayed the gap, resynced in full, or expired into a fresh join",
+    ('outcome',),
+))
+RATE_LIMITED = register(Counter(
+    'vibesync_ws_rate_limited_total', "Frames over a rate limit: dropped, refused, or closing their socket",
+    ('type', 'scope', 'outcome'),
+))
+
+# Local sockets per room in this worker
+room_connections = {}
+
+
+def connection_opened(room):
+    room_connections[room] = room_connections.get(room, 0) + 1
+
+
+def connection_closed(room):
+    remaining = room_connections.get(room, 0) - 1
+    if remaining > 0:
+        room_connections[room] = remaining
+    else:
+        room_connections.pop(room, None)
+
+
+register(CallbackMetric(
+    'vibesync_ws_connections', "Open room sockets in this worker",
+    lambda: {(): sum(room_connections.values())},
+))
+register(CallbackMetric(
+    'vibesync_ws_rooms', "Rooms with at least one socket in this worker",
+    lambda: {(): len(room_connections)},
+))
+
+
+def _outbound():
+    from room.outbound import outbound_stats
+
+    stats = outbound_stats()
+    return {
+        ('queued',): stats['queued_frames'],
+        ('max_depth',): stats['max_depth'],
+        ('peak_depth',): stats['peak_depth'],
+    }
+
+
+def _outbound_discarded():
+    from room.outbound import discarded
+
+    return {(reason,): value for reason, value in discarded.items()}
+
+
+def _controls():
+    from room.controls import get_control_pipeline
+
+    return {(outcome,): value for outcome, value in get_control_pipeline().stats.items()}
+
+
+def _audience_chat():
+    from room.audience import get_audience_chat
+
+    return {(outcome,): value for outcome, value in get_audience_chat().stats.items()}
+
+
+def _layer():
+    from channels.layers import get_channel_layer
+
+    return {(stat,): value for stat, value in getattr(get_channel_layer(), 'stats', {}).items()}
+
+
+register(CallbackMetric(
+    'vibesync_ws_outbound_frames', "Outbound queue depth across open sockets", _outbound, ('stat',),
+))
+register(CallbackMetric(
+    'vibesync_ws_outbound_discarded_total', "Outbound frames coalesced or dropped by backlogged sockets",
+    _outbound_discarded, ('reason',), kind='counter',
+))
+register(CallbackMetric(
+    'vibesync_ws_video_controls_total', "Video controls forwarded or merged by the seek coalescer",
+    _controls, ('outcome',), kind='counter',
+))
+register(CallbackMetric(
+    'vibesync_ws_audience_chat_total', "Audience chat lines broadcast, sampled out or refused by slow mode",
+    _audience_chat, ('outcome',), kind='counter',
+))
+register(CallbackMetric(
+    'vibesync_channel_layer_messages_total', "Channel layer deliveries and Redis traffic",
+    _layer, ('stat',), kind='counter',
+))
+
+
+def _logging():
+    from vibesync_be.log import get_log_sampler, live_handlers
+
+    values = {('queue_full', ''): sum(handler.dropped for handler in live_handlers)}
+    for category, limit in get_log_sampler().limits.items():
+        values[('sampled', category)] = limit.suppressed
+    return values
+
+
+register(CallbackMetric(
+    'vibesync_log_records_discarded_total', "Log records dropped on a full queue or sampled away",
+    _logging, ('reason', 'category'), kind='counter',
+))
+
+# REST path
+
+VIEW_LATENCY = register(Histogram(
+    'vibesync_http_view_seconds', "REST view latency, by view and status code", ('view', 'status'),
+    threadsafe=True,
+))
+
+
+class TimedViewMixin:
+    """Record each request's latency in ``VIEW_LATENCY``, for sync and async views"""
+
+    def dispatch(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().dispatch(request, *args, **kwargs)
+        if inspect.isawaitable(response):
+            return self._timed(response, start)
+        VIEW_LATENCY.observe(time.perf_counter() - start, type(self).__name__, response.status_code)
+        return response
+
+    async def _timed(self, response, start):
+        response = await response
+        VIEW_LATENCY.observe(time.perf_counter() - start, type(self).__name__, response.status_code)
+        return response
+
+
+PASSWORD_HASH_LATENCY = register(Histogram(
+    'vibesync_password_hash_seconds', "Password hashing time including the wait for a pool worker, by operation",
+    ('operation',),
+))
+
+
+def _hashing_queue():
+    from vibesync_be.hashing import get_hashing_pool
+
+    pool = get_hashing_pool()
+    return {('pending',): pool.pending, ('max_pending',): pool.max_pending, ('workers',): pool.workers}
+
+
+def _hashing_outcomes():
+    from vibesync_be.hashing import get_hashing_pool
+
+    return {(outcome,): value for outcome, value in get_hashing_pool().stats.items()}
+
+
+register(CallbackMetric(
+    'vibesync_password_hash_queue', "Password hashes queued or running on the hashing pool",
+    _hashing_queue, ('stat',),
+))
+register(CallbackMetric(
+    'vibesync_password_hash_total', "Password hashes completed, failed or refused admission",
+    _hashing_outcomes, ('outcome',), kind='counter',
+))
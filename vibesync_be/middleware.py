@@ -1,23 +1,105 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenUserCache:
+    """Bounded LRU of validated tokens and the users they resolve to.
+
+    Entries expire at the token's own ``exp`` or after ``ttl`` seconds,
+    whichever comes first, so a deactivated user is not trusted forever.
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        # token key -> (user, expires_at)
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, user, expires_at):
+        self.entries[key] = (user, min(expires_at, time.time() + self.ttl))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
 class JWTAuthMiddleware:
-    def __init__(self, app):
+    """Authenticate WebSocket connections from a JWT access token.
+
+    The token is read from the ``token`` query parameter or a
+    ``Authorization: Bearer`` header. Validation and the user lookup run off
+    the event loop, and their result is cached, so reconnects with the same
+    token cost no database round trip. ``scope['user']`` is always set;
+    ``scope['auth_error']`` carries the close code for a rejected token
+    (4001 for an invalid token, 4002 for an unexpected failure).
+    """
+
+    def __init__(self, app, cache=None):
         self.app = app
+        self.cache = cache or TokenUserCache(
+            max_size=getattr(settings, 'WEBSOCKET_AUTH_CACHE_SIZE', 10000),
+            ttl=getattr(settings, 'WEBSOCKET_AUTH_CACHE_TTL', 300),
+        )
+        self.authentication = JWTAuthentication()
 
     async def __call__(self, scope, receive, send):
-        # Perform JWT authentication
-        # For example, extract the token from headers or query parameters
-        headers = dict(scope.get("headers", []))
-        token = headers.get(b"authorization", b"").decode("utf-8")
+        # Don't mutate the scope passed down by outer middleware
+        scope = dict(scope, user=AnonymousUser(), auth_error=None)
+        token = self.get_token(scope)
 
         if token:
-            # Validate token (use your logic here)
-            scope["user"] = await self.authenticate_token(token)
-        else:
-            scope["user"] = None
+            try:
+                scope['user'] = await self.authenticate_token(token)
+            except AuthenticationFailed as e:
+                logger.warning(f"Authentication failed: {e}")
+                scope['auth_error'] = 4001
+            except Exception as e:
+                logger.error(f"Unexpected error during authentication: {e}")
+                scope['auth_error'] = 4002
 
         # Pass control to the next middleware or app
         return await self.app(scope, receive, send)
 
+    def get_token(self, scope):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        if query.get('token'):
+            return query['token'][0]
+        headers = dict(scope.get('headers', []))
+        parts = headers.get(b'authorization', b'').decode('utf-8').split()
+        if len(parts) == 2 and parts[0].lower() == 'bearer':
+            return parts[1]
+        return None
+
     async def authenticate_token(self, token):
-        # Implement your token validation logic
-        # Return the user object or raise an exception if invalid
-        pass
+        key = hashlib.sha256(token.encode()).hexdigest()
+        user = self.cache.get(key)
+        if user is None:
+            user, expires_at = await self.validate_token(token)
+            self.cache.set(key, user, expires_at)
+        return user
+
+    @sync_to_async
+    def validate_token(self, token):
+        validated_token = self.authentication.get_validated_token(token)
+        return self.authentication.get_user(validated_token), validated_token['exp']
@@ -79,14 +79,128 @@ TEMPLATES = [
 
 
 ASGI_APPLICATION = 'vibesync_be.asgi.application'
+# Group members on this process are reached in memory; Redis only carries
+# traffic for groups with members on other processes. Rooms are sharded
+# across 'hosts' by consistent hashing.
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': 'room.layers.HybridChannelLayer',
         'CONFIG': {
-            "hosts": [("127.0.0.1", 6379)],
+            "hosts": ['redis://127.0.0.1:6379/0'],
         },
     },
 }
+# Who is connected to which room, shared by every worker on the same Redis.
+# Single-process deployments can use 'room.presence.LocalPresenceRegistry'.
+ROOM_PRESENCE = {
+    'BACKEND': 'room.presence.RedisPresenceRegistry',
+    'CONFIG': {
+        'url': 'redis://127.0.0.1:6379/0',
+        'ttl': 180,
+    },
+}
+# Every socket is pinged once per interval; one silent for longer than the
+# timeout is closed with code 4003.
+ROOM_HEARTBEAT_INTERVAL = 30
+ROOM_HEARTBEAT_TIMEOUT = 75
+# Playback state is kept in memory and written back to Room at most once per
+# room per this many seconds.
+ROOM_PLAYBACK_FLUSH_INTERVAL = 5
+# RoomDetails responses are cached in this CACHES alias for up to this many
+# seconds; writes invalidate them. Use a shared cache when running several
+# workers so invalidations reach all of them.
+ROOM_DETAILS_CACHE = 'default'
+ROOM_DETAILS_CACHE_TTL = 30
+# Seeks within this many seconds of each other are merged per room. With
+# 'host' a pending seek from the room host beats other members' seeks;
+# 'last_writer' keeps the latest.
+ROOM_CONTROL_WINDOW = 0.25
+ROOM_CONTROL_POLICY = 'last_writer'
+# Chat is persisted in bulk once this many lines are queued or this many
+# seconds have passed. Senders wait once MAX_PENDING lines are queued, and
+# whatever is left is written at exit unless FLUSH_ON_SHUTDOWN is off.
+ROOM_CHAT_BATCH_SIZE = 100
+ROOM_CHAT_FLUSH_INTERVAL = 1.0
+ROOM_CHAT_MAX_PENDING = 5000
+ROOM_CHAT_FLUSH_ON_SHUTDOWN = True
+# The last 'size' chat lines of each room are replayed to joiners. Use
+# 'room.history.RedisChatHistory' (with a 'url') when running several workers.
+ROOM_CHAT_HISTORY = {
+    'BACKEND': 'room.history.LocalChatHistory',
+    'CONFIG': {
+        'size': 50,
+        'ttl': 3600,
+        'max_rooms': 1000,
+    },
+}
+# Room broadcasts are numbered and the last SIZE kept per room, so a client
+# resuming a dropped session is sent just what it missed. Laid out like
+# ROOM_CHAT_HISTORY; use room.replay.RedisReplayBuffer with several workers.
+ROOM_REPLAY = {
+    'BACKEND': 'room.replay.LocalReplayBuffer',
+    'CONFIG': {
+        'size': 200,
+        'ttl': 600,
+        'max_rooms': 1000,
+    },
+}
+# A dropped socket keeps its seat this many seconds, waiting for a resume.
+# Must exceed DRAIN_SPREAD: at shutdown, clients are told to come back at
+# random within that many seconds.
+ROOM_RESUME_GRACE = 30
+ROOM_DRAIN_SPREAD = 10
+# Rooms created with audience_mode list only the host and speakers; the
+# audience is counted in an audience_update sent at most once per
+# PRESENCE_INTERVAL seconds per worker, and paged through PAGE_SIZE at a time.
+# Audience chat: one line per socket per CHAT_SLOW_MODE seconds, and at most
+# CHAT_RATE lines per room per second per worker broadcast; the rest reach
+# only their sender. 0 turns either off.
+ROOM_AUDIENCE_PRESENCE_INTERVAL = 2
+ROOM_AUDIENCE_PAGE_SIZE = 50
+ROOM_AUDIENCE_CHAT_SLOW_MODE = 5
+ROOM_AUDIENCE_CHAT_RATE = 10
+# Token buckets on frames clients send, by message type: (tokens per second,
+# burst) for each connection and each room. Frames over a limit are dropped,
+# or with ACTION 'refuse' answered with a rate_limited error. A connection
+# over its own limits more than CLOSE_AFTER times in a row (one is forgiven
+# per second) is closed with code 4006. Room buckets live in
+# ROOM_RATE_LIMITER; with Local each worker allows a room the full rate, use
+# room.ratelimit.RedisRateLimiter (with a 'url') to share them.
+ROOM_RATE_LIMITS = {
+    'chat': {'connection': (2, 5), 'room': (20, 50)},
+    'video_control': {'connection': (5, 10), 'room': (10, 20)},
+    'share_video': {'connection': (0.2, 3), 'room': (0.5, 5)},
+    'set_role': {'connection': (1, 5)},
+    'presence_resync': {'connection': (0.5, 3)},
+    'presence_page': {'connection': (5, 20)},
+}
+ROOM_RATE_LIMIT_ACTION = 'refuse'
+ROOM_RATE_LIMIT_CLOSE_AFTER = 20
+ROOM_RATE_LIMITER = {
+    'BACKEND': 'room.ratelimit.LocalRateLimiter',
+    'CONFIG': {
+        'max_keys': 10000,
+    },
+}
+# Sockets connected with ?batch=1 get these frame types batched into one
+# array frame per window, capped at MAX_FRAMES frames or MAX_BYTES bytes.
+ROOM_BATCH_WINDOW = 0.008
+ROOM_BATCH_MAX_FRAMES = 50
+ROOM_BATCH_MAX_BYTES = 65536
+ROOM_BATCH_TYPES = ('webrtc_ice_candidate', 'user_list_update')
+# Write frames through a bounded per-socket queue. Only servers whose send
+# waits for the socket (uvicorn) ever fill it; Daphne's never does, so it is
+# off by default (see room.outbound).
+ROOM_OUTBOUND_QUEUE = False
+# With the queue on, frames queued for a backlogged socket: 'latest' keeps
+# only the newest of a type, 'drop' discards it, anything else is kept.
+# Sockets backlogged by more than MAX_DEPTH frames are closed with code 4004.
+ROOM_OUTBOUND_MAX_DEPTH = 500
+ROOM_OUTBOUND_POLICIES = {
+    'video_control': 'latest',
+    'audience_update': 'latest',
+    'ping': 'drop',
+}
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
@@ -100,7 +214,8 @@ REST_FRAMEWORK = {
     
     'DEFAULT_AUTHENTICATION_CLASSES': (
       
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication that async views can await without a thread hop
+        'vibesync_be.authentication.AsyncJWTAuthentication',
     )
     
 }
@@ -130,6 +245,21 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": False,
 
 }
+# WebSocket logins are cached per token until it expires or for this many
+# seconds, whichever is sooner.
+WEBSOCKET_AUTH_CACHE_SIZE = 10000
+WEBSOCKET_AUTH_CACHE_TTL = 300
+
+# Password hashing for login and registration runs on this pool, 'process' or
+# 'thread', so it never holds up the event loop. Beyond MAX_PENDING queued or
+# running hashes, requests are refused with a 503 instead of queueing.
+PASSWORD_HASH_EXECUTOR = 'process'
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_MAX_PENDING = 32
+
+# Bearer token required to scrape /metrics. Without one the endpoint only
+# answers requests from the loopback address.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -161,6 +291,17 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 LOGS_DIR = os.path.join(BASE_DIR, 'logs')
 os.makedirs(LOGS_DIR, exist_ok=True)
+
+# High-volume log events, by the ``category`` they are logged under: keep a
+# ``sample`` fraction, then at most ``rate`` records per second.
+LOG_SAMPLING = {
+    'ping': {'sample': 0.01, 'rate': 1},
+    'ice': {'sample': 0.1, 'rate': 5},
+    'chat': {'sample': 0.1, 'rate': 5},
+}
+
+# Handlers write from a background thread (vibesync_be.log.BackgroundHandler)
+# so logging never blocks the event loop; the file gets JSON lines.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -173,18 +314,23 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'vibesync_be.log.JsonFormatter',
+        },
     },
     'handlers': {
         'console': {
             'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
+            'class': 'vibesync_be.log.BackgroundHandler',
+            'target': 'logging.StreamHandler',
             'formatter': 'simple',
         },
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'vibesync_be.log.BackgroundHandler',
+            'target': 'logging.FileHandler',
             'filename': os.path.join(BASE_DIR, 'logs/vibesync.log'),
-            'formatter': 'verbose',
+            'formatter': 'json',
         },
     },
     'loggers': {
@@ -198,5 +344,20 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'room': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'users': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'vibesync_be': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     },
-}
\ No newline at end of file
+}
@@ -0,0 +1,17 @@
+from django.test import SimpleTestCase, override_settings
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class MetricsViewTests(SimpleTestCase):
+    @override_settings(METRICS_TOKEN=None)
+    def test_without_token_only_loopback_is_served(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='::1').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.7').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.7', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'vibesync_ws_frames_sent_total', response.content)
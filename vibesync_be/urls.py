@@ -16,9 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path,include
+from vibesync_be.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('users.urls')),
     path('api/',include('room.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]